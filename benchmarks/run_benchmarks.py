@@ -0,0 +1,266 @@
+"""
+=============================================================================
+BATCH TRANSFORM SCALING BENCHMARKS
+ClearVue BI System - Throughput and peak memory per phase at growing sizes
+=============================================================================
+
+Runs each batch transform on seeded synthetic frames (see synthetic.py) at
+10k, 100k, 1M and 10M rows. Every (transform, rows) case runs in a fresh
+interpreter, so its peak RSS is its own. The transform's phases are
+measured by the same instrumentation the nightly runs use
+(etl_scripts.batch_etl.instrumentation). Documents are exported to a
+temporary directory exactly as in production, so serialisation is measured
+too. A case that exceeds --timeout is recorded as such instead of stopping
+the suite.
+
+Results are written as one JSON file per suite run (benchmarks/results/ by
+default) with the commit and library versions. The summary prints each
+phase's scaling exponent between consecutive sizes: ~1.0 is linear, and
+anything near 2 is a quadratic path. --compare prints the wall-time ratio
+against an earlier results file.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --transforms sales finance --rows 10000 100000
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<earlier>.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+if __package__ in (None, ""):
+    # allow running this file directly: python benchmarks/run_benchmarks.py
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import GENERATORS
+from etl_scripts.batch_etl.dtype_planner import compact_frame
+from etl_scripts.batch_etl.instrumentation import RunMetrics, peak_rss_bytes
+from etl_scripts.batch_etl.rollups import FINANCE_ROLLUP, SALES_ROLLUP, build_finance_rollup, build_sales_rollup, load_rollup
+from etl_scripts.batch_etl.surrogate_keys import KeyDictionary
+
+DEFAULT_ROWS = (10_000, 100_000, 1_000_000, 10_000_000)
+DEFAULT_TIMEOUT = 3600
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+REPO_DIR = Path(__file__).resolve().parents[1]
+SUPERLINEAR_EXPONENT = 1.5
+
+
+def _run_transform(name, frames, output_dir):
+    # each transform's stages and rollups, as its main() runs them, minus sample printing
+    if name == "sales":
+        from etl_scripts.batch_etl import transform_sales as module
+        keys = KeyDictionary()
+        header_df, documents = module.transform(frames, keys=keys)
+        writer, _ = module.load(documents, output_dir, n_samples=0)
+        load_rollup(build_sales_rollup(header_df, keys), output_dir, SALES_ROLLUP)
+    elif name == "customer":
+        from etl_scripts.batch_etl import transform_customer as module
+        writer = module.load(module.transform(frames), output_dir)
+    elif name == "finance":
+        from etl_scripts.batch_etl import transform_finance as module
+        finance_data, documents = module.transform(frames)
+        writer = module.load(documents, output_dir)
+        load_rollup(build_finance_rollup(finance_data), output_dir, FINANCE_ROLLUP)
+    elif name == "supplier":
+        from etl_scripts.batch_etl import transform_supplier as module
+        writer = module.load(module.transform(frames), output_dir)
+    else:
+        raise ValueError(f"Unknown transform: {name}")
+    return writer
+
+
+def run_case(name, rows, seed=0):
+    """Generate, compact and transform one case in this process; returns its result dict."""
+    logging.disable(logging.WARNING)  # the supplier transform logs every discrepancy
+    start = time.perf_counter()
+    frames = {key: compact_frame(df)[0] for key, df in GENERATORS[name](rows, seed).items()}
+    generate_time = time.perf_counter() - start
+    input_rows = sum(len(df) for df in frames.values())
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        # the transforms narrate every step; keep the benchmark output readable
+        with contextlib.redirect_stdout(io.StringIO()), RunMetrics(name) as run:
+            writer = _run_transform(name, frames, output_dir)
+
+    return {
+        "transform": name,
+        "rows": rows,
+        "input_rows": input_rows,
+        "documents": writer.documents,
+        "status": "ok",
+        "generate_time": generate_time,
+        "wall_time": run.wall_time,
+        "cpu_time": run.cpu_time,
+        "rows_per_sec": rows / run.wall_time if run.wall_time else None,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "phases": [
+            {
+                "name": metrics.name,
+                "wall_time": metrics.wall_time,
+                "cpu_time": metrics.cpu_time,
+                "rows_in": metrics.rows_in,
+                "rows_out": metrics.rows_out,
+                "rows_per_sec": rows / metrics.wall_time if metrics.wall_time else None,
+                "peak_rss_bytes": metrics.peak_rss_bytes,
+                "rss_growth_bytes": metrics.rss_growth_bytes,
+            }
+            for metrics in run.phases
+        ],
+    }
+
+
+def _run_isolated(name, rows, seed, timeout):
+    with tempfile.TemporaryDirectory() as tmp:
+        result_path = Path(tmp) / "result.json"
+        command = [sys.executable, str(Path(__file__).resolve()), "--case", name, str(rows),
+                   "--seed", str(seed), "--case-output", str(result_path)]
+        try:
+            completed = subprocess.run(command, cwd=REPO_DIR, timeout=timeout, capture_output=True, text=True)
+        except subprocess.TimeoutExpired:
+            return {"transform": name, "rows": rows, "status": "timeout", "wall_time": timeout}
+        if completed.returncode != 0 or not result_path.exists():
+            error = (completed.stderr.strip().splitlines() or ["no output"])[-1]
+            return {"transform": name, "rows": rows, "status": "failed", "error": error}
+        return json.loads(result_path.read_text())
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def scaling_exponents(cases):
+    """{(transform, phase): [(rows_from, rows_to, exponent), ...]} between consecutive sizes."""
+    series = {}
+    for case in sorted((c for c in cases if c["status"] == "ok"), key=lambda c: (c["transform"], c["rows"])):
+        phases = {"total": case["wall_time"], **{p["name"]: p["wall_time"] for p in case["phases"]}}
+        for phase_name, wall_time in phases.items():
+            series.setdefault((case["transform"], phase_name), []).append((case["rows"], wall_time))
+
+    exponents = {}
+    for key, points in series.items():
+        exponents[key] = [
+            (n1, n2, math.log(t2 / t1) / math.log(n2 / n1))
+            for (n1, t1), (n2, t2) in zip(points, points[1:])
+            if t1 > 0 and t2 > 0 and n2 > n1
+        ]
+    return exponents
+
+
+def print_summary(results):
+    print("\n" + "=" * 80)
+    print("BENCHMARK SUMMARY")
+    print("=" * 80)
+    for case in results["cases"]:
+        label = f"{case['transform']:<9} {case['rows']:>11,} rows"
+        if case["status"] != "ok":
+            print(f"✗ {label}  {case['status']} {case.get('error', '')}")
+            continue
+        print(f"✓ {label}  {case['wall_time']:9.2f}s  {case['rows_per_sec']:>12,.0f} rows/s  "
+              f"peak {case['peak_rss_bytes'] / 1024 ** 2:9.1f} MB")
+        for phase in sorted(case["phases"], key=lambda p: -p["wall_time"])[:4]:
+            print(f"    {phase['name']:<28} {phase['wall_time']:9.3f}s  "
+                  f"peak {phase['peak_rss_bytes'] / 1024 ** 2:9.1f} MB")
+
+    print("\nScaling exponents (wall time ~ rows^k; k near 2 is a quadratic path)")
+    print("-" * 80)
+    for (transform, phase_name), steps in sorted(results["scaling"].items()):
+        if not steps:
+            continue
+        text = "  ".join(f"{n1:,}->{n2:,}: {k:.2f}" for n1, n2, k in steps)
+        flag = "  ⚠ superlinear" if any(k >= SUPERLINEAR_EXPONENT for _, _, k in steps) else ""
+        print(f"  {transform:<9} {phase_name:<28} {text}{flag}")
+
+
+def print_comparison(results, baseline):
+    print("\nWall time against " + str(baseline.get("environment", {}).get("commit") or "baseline"))
+    print("-" * 80)
+    before = {(c["transform"], c["rows"]): c for c in baseline["cases"] if c["status"] == "ok"}
+    for case in results["cases"]:
+        old = before.get((case["transform"], case["rows"]))
+        if case["status"] != "ok" or old is None:
+            continue
+        ratio = case["wall_time"] / old["wall_time"] if old["wall_time"] else float("nan")
+        print(f"  {case['transform']:<9} {case['rows']:>11,} rows  {old['wall_time']:9.2f}s -> "
+              f"{case['wall_time']:9.2f}s  ({ratio:.2f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scaling benchmarks for the batch transforms")
+    parser.add_argument("--transforms", nargs="+", choices=sorted(GENERATORS), default=sorted(GENERATORS))
+    parser.add_argument("--rows", nargs="+", type=int, default=list(DEFAULT_ROWS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds per case")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", type=Path, default=None, help="earlier results file to compare with")
+    parser.add_argument("--case", nargs=2, metavar=("TRANSFORM", "ROWS"), help=argparse.SUPPRESS)
+    parser.add_argument("--case-output", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        # child process of an isolated run
+        result = run_case(args.case[0], int(args.case[1]), args.seed)
+        args.case_output.write_text(json.dumps(result))
+        return 0
+
+    cases = []
+    for name in args.transforms:
+        for rows in sorted(args.rows):
+            print(f"Running {name} at {rows:,} rows...", flush=True)
+            case = _run_isolated(name, rows, args.seed, args.timeout)
+            cases.append(case)
+            if case["status"] != "ok":
+                print(f"  ✗ {case['status']}: {case.get('error', '')} - skipping larger sizes")
+                break
+
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": args.seed,
+        "environment": environment(),
+        "cases": cases,
+    }
+    results["scaling"] = {
+        f"{transform}/{phase_name}": steps for (transform, phase_name), steps in scaling_exponents(cases).items()
+    }
+    output = args.output or RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+
+    print_summary({**results, "scaling": scaling_exponents(cases)})
+    if args.compare:
+        print_comparison(results, json.loads(args.compare.read_text()))
+    print(f"\nResults written to {output}")
+    return 0 if all(case["status"] == "ok" for case in cases) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
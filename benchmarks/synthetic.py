@@ -0,0 +1,238 @@
+"""
+=============================================================================
+SYNTHETIC RAW DATA
+ClearVue BI System - Seeded generators for the raw_data workbook schemas
+=============================================================================
+
+Each generator returns the frames one transform reads, keyed like its
+SOURCES and with the columns and dtypes pd.read_excel produces for the real
+workbooks (upper-case names, object codes, int64 / float64 amounts,
+datetime64 dates). rows sizes the transform's largest input; the other
+tables keep roughly the proportions of the real extract:
+
+    sales     rows sales lines, rows / 4 headers
+    customer  rows customers, rows / 3 account parameters
+
+(both also get a 128-row Representatives sheet; sales also gets the product
+sheets for 1,900 of its 2,000 inventory codes)
+    finance   rows age analysis rows, rows / 8 payment lines (and headers),
+              rows / 30 customers
+    supplier  rows purchase lines, rows / 40 purchase headers
+
+The same (rows, seed) always produces the same frames, so results of
+different commits are comparable.
+"""
+
+import numpy as np
+import pandas as pd
+
+FIN_PERIODS = np.array([year * 100 + month for year in range(2015, 2021) for month in range(1, 13)])
+PARAMETERS = np.array(["Closed", "Cod", "Credit card", "Legal", "Suspended"], dtype=object)
+
+
+def _codes(prefix, count, width=7):
+    return np.array([f"{prefix}{i:0{width}d}" for i in range(count)], dtype=object)
+
+
+def _customer_codes(rows):
+    return _codes("C", max(10, rows // 30), width=6)
+
+
+def _dates(rng, count, start="2015-01-01", days=6 * 365):
+    return pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, count), unit="D")
+
+
+def _representatives(rng, count=128):
+    # rep codes R000.. (the sales and customer generators draw from the first 100 / 58)
+    descriptions = np.array(["BJ", "BJ CONSIGNMENTS", "HEAD OFFICE", "CAT CUSTOMER ONLY ex BM", "do not use"],
+                            dtype=object)
+    return pd.DataFrame({
+        "REP_CODE": _codes("R", count, width=3),
+        "REP_DESC": descriptions[rng.integers(0, len(descriptions), count)],
+        "COMM_METHOD": np.array(["Sales", "Gross Profit"], dtype=object)[rng.integers(0, 2, count)],
+        "COMMISSION": rng.choice([0.0, 0.5], count),
+    })
+
+
+def _product_frames(rng, inventory_codes):
+    # the last 5% of the codes are not in the product sheets; styles cover every other product
+    codes = inventory_codes[: len(inventory_codes) * 19 // 20]
+    text = lambda *values: np.array(values, dtype=object)
+    return {
+        "products": pd.DataFrame({
+            "INVENTORY_CODE": codes,
+            "PRODCAT_CODE": rng.integers(0, 60, len(codes)),
+            "LAST_COST": rng.integers(10, 5000, len(codes)),
+            "STOCK_IND": text("Yes", "No")[rng.integers(0, 2, len(codes))],
+        }),
+        "product_styles": pd.DataFrame({
+            "INVENTORY_CODE": codes[::2],
+            "GENDER": text("female", "male", "unisex", None)[rng.integers(0, 4, len(codes[::2]))],
+            "MATERIAL": text("plastic", "metal", "leather", None)[rng.integers(0, 4, len(codes[::2]))],
+            "STYLE": text("classic", "sport", "fashion", None)[rng.integers(0, 4, len(codes[::2]))],
+            "COLOUR": text("classic", "bright", None)[rng.integers(0, 3, len(codes[::2]))],
+            "BRANDING": text("low", "medium", "high", None)[rng.integers(0, 4, len(codes[::2]))],
+        }),
+        "product_categories": pd.DataFrame({
+            "PRODCAT_CODE": np.arange(60),
+            "PRODCAT_DESC": _codes("Category ", 60, width=2),
+            "BRAND_CODE": rng.integers(1, 10, 60),
+            "PRAN_CODE": rng.integers(1, 4, 60),
+        }),
+        "product_brands": pd.DataFrame({"PRODBRA_CODE": np.arange(1, 10), "PRODBRA_DESC": text(*"ABCDEFGHI")}),
+        "product_ranges": pd.DataFrame({"PRAN_CODE": [1, 2, 3], "PRAN_DESC": text("Product", "Parts", "Product")}),
+    }
+
+
+def sales_frames(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    n_headers = max(1, rows // 4)
+    doc_numbers = _codes("DC", n_headers)
+    customers = _customer_codes(rows)
+    trans_date = _dates(rng, n_headers)
+
+    header = pd.DataFrame({
+        "DOC_NUMBER": doc_numbers,
+        "TRANSTYPE_CODE": rng.integers(1, 6, n_headers),
+        "REP_CODE": _codes("R", 100, width=3)[rng.integers(0, 100, n_headers)],
+        "CUSTOMER_NUMBER": customers[rng.integers(0, len(customers), n_headers)],
+        "TRANS_DATE": trans_date,
+        "FIN_PERIOD": trans_date.year * 100 + trans_date.month,
+    })
+    quantity = rng.integers(-1, 20, rows).astype(np.float64)
+    unit_sell_price = rng.uniform(5, 500, rows)
+    inventory_codes = _codes("P", 2000, width=5)
+    lines = pd.DataFrame({
+        # a few lines point at documents that do not exist (orphans are validated away)
+        "DOC_NUMBER": _codes("DC", n_headers + max(1, n_headers // 100))[rng.integers(0, n_headers + max(1, n_headers // 100), rows)],
+        "INVENTORY_CODE": inventory_codes[rng.integers(0, 2000, rows)],
+        "QUANTITY": quantity,
+        "UNIT_SELL_PRICE": unit_sell_price,
+        "UNIT_COST": unit_sell_price * rng.uniform(0.3, 0.9, rows),
+        "TOTAL_LINE_PRICE": quantity * unit_sell_price,
+    })
+    trans_types = pd.DataFrame({
+        "TRANSTYPE_CODE": np.arange(1, 6),
+        "TRANSTYPE_DESC": np.array(["TAX INVOICE", "CREDIT NOTE", "DEBIT NOTE", "RETURN", "JOURNAL"], dtype=object),
+    })
+    return {"sales_header": header, "sales_lines": lines, "trans_types": trans_types,
+            "representatives": _representatives(rng), **_product_frames(rng, inventory_codes)}
+
+
+def customer_frames(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    customers = _codes("C", rows, width=7)
+    regions = _codes("", 34, width=3)
+    customer = pd.DataFrame({
+        "CUSTOMER_NUMBER": customers,
+        "CCAT_CODE": rng.integers(0, 52, rows),  # 50 and 51 are not in the lookup
+        "REGION_CODE": regions[rng.integers(0, 34, rows)],
+        "REP_CODE": _codes("R", 58, width=3)[rng.integers(0, 58, rows)],
+        "SETTLE_TERMS": rng.choice([0.0, 30.0, 60.0], rows),
+        "NORMAL_PAYTERMS": rng.choice([0, 30, 60, 90, 120], rows),
+        "DISCOUNT": rng.integers(0, 10, rows),
+        "CREDIT_LIMIT": rng.integers(0, 50, rows) * 1000,
+    })
+    categories = pd.DataFrame({"CCAT_CODE": np.arange(50), "CCAT_DESC": _codes("Category ", 50, width=2)})
+    region_lookup = pd.DataFrame({"REGION_CODE": regions, "REGION_DESC": _codes("Region ", 34, width=2)})
+    n_params = max(1, rows // 3)
+    account_params = pd.DataFrame({
+        "CUSTOMER_NUMBER": customers[rng.integers(0, rows, n_params)],
+        "PARAMETER": PARAMETERS[rng.integers(0, len(PARAMETERS), n_params)],
+    })
+    return {
+        "customers": customer,
+        "customer_categories": categories,
+        "customer_regions": region_lookup,
+        "account_params": account_params,
+        "representatives": _representatives(rng),
+    }
+
+
+def finance_frames(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    customers = _customer_codes(rows)
+    periods = FIN_PERIODS[-24:]
+
+    buckets = ["AMT_CURRENT"] + [f"AMT_{days}_DAYS" for days in range(30, 361, 30)]
+    # most buckets of a row are zero, like the real sheet
+    amounts = np.where(rng.random((rows, len(buckets))) < 0.2, rng.integers(-500, 5000, (rows, len(buckets))), 0)
+    age = pd.DataFrame({
+        "CUSTOMER_NUMBER": customers[rng.integers(0, len(customers), rows)],
+        "FIN_PERIOD": periods[rng.integers(0, len(periods), rows)],
+        "TOTAL_DUE": amounts.sum(axis=1).astype(np.float64),
+    })
+    for i, bucket in enumerate(buckets):
+        # the sheet stores the first buckets as float and the older ones as int
+        age[bucket] = amounts[:, i].astype(np.float64 if i < 6 else np.int64)
+
+    n_payments = max(1, rows // 8)
+    deposit_refs = _codes("DB", max(1, n_payments * 3 // 4))[rng.integers(0, max(1, n_payments * 3 // 4), n_payments)]
+    payment_customers = customers[rng.integers(0, len(customers), n_payments)]
+    bank_amt = -rng.integers(100, 500000, n_payments) / 100
+    payment_lines = pd.DataFrame({
+        "CUSTOMER_NUMBER": payment_customers,
+        "FIN_PERIOD": periods[rng.integers(0, len(periods), n_payments)],
+        "DEPOSIT_DATE": _dates(rng, n_payments, start="2019-01-01", days=2 * 365),
+        "DEPOSIT_REF": deposit_refs,
+        "BANK_AMT": bank_amt,
+        "DISCOUNT": rng.integers(0, 50, n_payments),
+        "TOT_PAYMENT": bank_amt.astype(np.int64),
+    })
+    payment_header = pd.DataFrame({"CUSTOMER_NUMBER": payment_customers, "DEPOSIT_REF": deposit_refs})
+    n_params = max(1, len(customers) // 2)
+    account_params = pd.DataFrame({
+        "CUSTOMER_NUMBER": customers[rng.integers(0, len(customers), n_params)],
+        "PARAMETER": PARAMETERS[rng.integers(0, len(PARAMETERS), n_params)],
+    })
+    customer = pd.DataFrame({
+        "CUSTOMER_NUMBER": customers,
+        "REGION_CODE": _codes("", 34, width=3)[rng.integers(0, 34, len(customers))],
+    })
+    return {
+        "payment_header": payment_header,
+        "payment_lines": payment_lines,
+        "age_analysis": age,
+        "account_params": account_params,
+        "customers": customer,
+    }
+
+
+def supplier_frames(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    n_suppliers = 22
+    supplier_codes = _codes("", n_suppliers, width=3)
+    suppliers = pd.DataFrame({
+        "SUPPLIER_CODE": supplier_codes,
+        "SUPPLIER_DESC": np.array(
+            [f"DR purch order {i}" if i % 3 == 0 else f"Supplier {i}" for i in range(n_suppliers)], dtype=object
+        ),
+        "EXCLSV": np.array(["Y", "N"], dtype=object)[rng.integers(0, 2, n_suppliers)],
+        "NORMAL_PAYTERMS": rng.choice([0, 30], n_suppliers),
+        "CREDIT_LIMIT": np.zeros(n_suppliers, dtype=np.int64),
+    })
+    n_headers = max(1, rows // 40)
+    doc_numbers = _codes("PC", n_headers)
+    headers = pd.DataFrame({
+        "SUPPLIER_CODE": supplier_codes[rng.integers(0, n_suppliers, n_headers)],
+        "PURCH_DOC_NO": doc_numbers,
+        "PURCH_DATE": _dates(rng, n_headers, start="2018-01-01", days=2 * 365),
+    })
+    quantity = rng.integers(1, 100, rows)
+    unit_cost = rng.integers(100, 50000, rows) / 100
+    lines = pd.DataFrame({
+        "PURCH_DOC_NO": doc_numbers[rng.integers(0, n_headers, rows)],
+        "INVENTORY_CODE": _codes("P", 5000, width=5)[rng.integers(0, 5000, rows)],
+        "QUANTITY": quantity,
+        "UNIT_COST_PRICE": unit_cost,
+        "TOTAL_LINE_COST": np.round(quantity * unit_cost, 2),
+    })
+    return {"suppliers": suppliers, "headers": headers, "lines": lines}
+
+
+GENERATORS = {
+    "sales": sales_frames,
+    "customer": customer_frames,
+    "finance": finance_frames,
+    "supplier": supplier_frames,
+}
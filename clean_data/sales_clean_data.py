@@ -1,5 +1,9 @@
 import pandas as pd
 import os 
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from etl_scripts.batch_etl.ingest import read_excel_cached
 
 input_folder = (r"C:\Users\nandi\OneDrive\Desktop\SQL Slashers\clearvue-bi-system\raw_data")
 output_folder = (r"C:\Users\nandi\OneDrive\Desktop\SQL Slashers\clearvue-bi-system\clean_data")
@@ -9,7 +13,7 @@ files = ["Products.xlsx", "Products Styles.xlsx", "Product Brands.xlsx", "Produc
 for file in files :
     file_path = os.path.join(input_folder, file)
 
-    df = pd.read_excel(file_path, engine="openpyxl")
+    df = read_excel_cached(file_path, engine="openpyxl")
     df = df.drop_duplicates()
     df = df.fillna("Unknown")
 
@@ -0,0 +1,196 @@
+"""
+=============================================================================
+COLLECTION EXPORT WRITER
+ClearVue BI System - Streaming newline-delimited JSON for MongoDB loads
+=============================================================================
+
+CollectionWriter writes one compact JSON document per line as documents are
+produced, so a transform never has to hold a second, serialised copy of its
+collection. Output can be gzip or zstd compressed (zstd needs the optional
+`zstandard` package). orjson is used as the serializer when it is installed;
+without it the json module writes the same bytes: NaN/inf as null, numpy
+scalars as their Python value and non-ASCII text unescaped.
+
+Every written document carries a content_hash: a digest of its canonical
+JSON (sorted keys, no whitespace, NaN as null, always the json module), so
+it does not depend on key order or on which serializer wrote the file. The loaders use
+it to skip documents that did not change since the last load.
+
+Usage:
+    with CollectionWriter(collection_path(out_dir, "sales_collection")) as writer:
+        for doc in documents:
+            writer.write(doc)
+    print(writer.documents, writer.bytes_written, writer.bytes_on_disk)
+"""
+
+import datetime
+import gzip
+import hashlib
+import json
+import math
+import os
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:  # optional fast serializer
+    orjson = None
+
+COMPRESSION_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def _check_compression(compression):
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown compression: {compression!r} (expected None, 'gzip' or 'zstd')")
+    return compression
+
+
+# Compression used by the transforms' exports: unset, "gzip" or "zstd"
+EXPORT_COMPRESSION = _check_compression(os.environ.get("CLEARVUE_EXPORT_COMPRESSION") or None)
+
+# Field holding each document's content digest
+HASH_FIELD = "content_hash"
+
+
+def _dumps(doc):
+    if orjson is not None:
+        return orjson.dumps(doc, default=_canonical,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) + b"\n"
+    return (json.dumps(_canonical(doc), separators=(",", ":"), ensure_ascii=False) + "\n").encode()
+
+
+def _canonical(value):
+    # the values as orjson writes them, so a re-read document hashes the same:
+    # NaN/inf as null, dates and times in ISO 8601, numpy floats by their shortest
+    # repr (float32 1.1 is 1.1), other numpy scalars as their Python value and
+    # anything else unknown by its string form
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if value is None or isinstance(value, (str, int)):
+        return value
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if getattr(getattr(value, "dtype", None), "kind", None) == "f":
+        return _canonical(float(str(value)))
+    if hasattr(value, "item"):
+        return _canonical(value.item())
+    return str(value)
+
+
+def content_hash(doc, hash_field=HASH_FIELD):
+    """Stable digest of a document's canonical JSON, ignoring its own hash field."""
+    body = _canonical({key: value for key, value in doc.items() if key != hash_field})
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+def _infer_compression(path):
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if suffix and path.name.endswith(suffix):
+            return compression
+    return None
+
+
+def _open_compressed(path, mode, compression):
+    if compression is None:
+        return open(path, mode)
+    if compression == "gzip":
+        return gzip.open(path, mode, compresslevel=6)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError("zstd compression needs the 'zstandard' package: pip install zstandard") from e
+        return zstandard.open(path, mode)
+    _check_compression(compression)
+
+
+def collection_path(directory, name, compression=EXPORT_COMPRESSION):
+    """Export path for a collection, e.g. <directory>/sales_collection.ndjson.gz."""
+    return Path(directory) / f"{name}.ndjson{COMPRESSION_SUFFIXES[_check_compression(compression)]}"
+
+
+def find_collection(directory, name):
+    """Locate an exported collection in any supported format (legacy .json arrays included)."""
+    directory = Path(directory)
+    for suffix in (".ndjson", ".ndjson.gz", ".ndjson.zst", ".json"):
+        path = directory / f"{name}{suffix}"
+        if path.exists():
+            return path
+    raise FileNotFoundError(f"No export of {name} found in {directory}")
+
+
+class CollectionWriter:
+    """Stream documents to an NDJSON file, tracking documents and bytes written.
+
+    Each document is written with its content_hash (hash_field=None writes it unchanged).
+    """
+
+    def __init__(self, path, compression="infer", hash_field=HASH_FIELD):
+        self.path = Path(path)
+        self.compression = _infer_compression(self.path) if compression == "infer" else _check_compression(compression)
+        self.hash_field = hash_field
+        self.documents = 0
+        self.bytes_written = 0  # uncompressed
+        self.bytes_on_disk = 0  # known once the writer is closed
+        self._file = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = _open_compressed(self.path, "wb", self.compression)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, doc):
+        if self.hash_field is not None:
+            doc = {**doc, self.hash_field: content_hash(doc, self.hash_field)}
+        line = _dumps(doc)
+        self._file.write(line)
+        self.documents += 1
+        self.bytes_written += len(line)
+
+    def write_all(self, docs):
+        for doc in docs:
+            self.write(doc)
+        return self
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self.bytes_on_disk = self.path.stat().st_size
+
+
+def write_collection(path, docs, compression="infer"):
+    """Write an iterable of documents and return the closed writer (for its stats)."""
+    with CollectionWriter(path, compression=compression) as writer:
+        writer.write_all(docs)
+    return writer
+
+
+def read_collection(path):
+    """Yield the documents of an exported collection, one at a time."""
+    path = Path(path)
+    if path.suffix == ".json":
+        # legacy export: a single indented JSON array
+        with open(path, "r") as f:
+            yield from json.load(f)
+        return
+
+    with _open_compressed(path, "rb", _infer_compression(path)) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            if orjson is not None:
+                try:
+                    yield orjson.loads(line)
+                    continue
+                except orjson.JSONDecodeError:
+                    pass  # e.g. NaN written by the json module
+            yield json.loads(line)
@@ -0,0 +1,78 @@
+"""
+=============================================================================
+COLUMNAR DOCUMENT HELPERS
+ClearVue BI System - Grouping kernels shared by the batch transforms
+=============================================================================
+
+The collections embed child rows (sales lines, purchase lines, payment
+lines) as arrays inside their parent document. Filtering the child frame
+once per parent is O(parents x children); these helpers group the child
+rows with a single stable sort instead and emit the nested arrays in one
+linear pass over plain Python lists.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def group_offsets(keys):
+    """Group row positions by key with one stable sort.
+
+    keys is a 1-D array/Series, or a list of them for a composite key.
+    Returns (uniques, order, offsets): the rows order[offsets[i]:offsets[i + 1]]
+    belong to uniques[i]. Groups come out in first-appearance order and rows
+    keep their original order inside a group. Rows with a missing key are
+    dropped, like DataFrame.groupby does.
+    """
+    if isinstance(keys, list):
+        if not len(keys[0]):
+            # pandas cannot factorize an empty MultiIndex
+            return [], np.empty(0, dtype=np.intp), np.zeros(1, dtype=np.intp)
+        keys = pd.MultiIndex.from_arrays(keys)
+    codes, uniques = pd.factorize(keys)
+
+    order = np.argsort(codes, kind="stable")
+    order = order[np.count_nonzero(codes < 0):]
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    offsets = np.zeros(len(uniques) + 1, dtype=np.intp)
+    np.cumsum(counts, out=offsets[1:])
+    return uniques, order, offsets
+
+
+def nest_records(keys, columns):
+    """Build {key: [record, ...]} from parallel columns in one pass.
+
+    columns maps each output field name to a column (Series or array) aligned
+    with keys. Values are taken with .tolist(), so records hold plain Python
+    scalars that json.dump can write directly.
+    """
+    uniques, order, offsets = group_offsets(keys)
+    fields = list(columns)
+    values = [np.asarray(columns[field])[order].tolist() for field in fields]
+
+    records = [dict(zip(fields, row)) for row in zip(*values)]
+    return {
+        key: records[start:end]
+        for key, start, end in zip(uniques, offsets[:-1].tolist(), offsets[1:].tolist())
+    }
+
+
+def isoformat_column(column):
+    """Timestamp.isoformat() for every value of a datetime column, None where missing.
+
+    Whole-second values (the norm for Excel dates) are formatted in one numpy
+    call; only values with a fractional second fall back to Timestamp.isoformat.
+    """
+    column = pd.Series(column)
+    if not pd.api.types.is_datetime64_dtype(column):
+        column = pd.to_datetime(column, errors="coerce")
+
+    text = pd.Series(
+        np.datetime_as_string(column.to_numpy(dtype="datetime64[ns]"), unit="s"),
+        index=column.index,
+        dtype=object,
+    )
+    fractional = column.notna() & (column.dt.floor("s") != column)
+    if fractional.any():
+        text[fractional] = [ts.isoformat() for ts in column[fractional]]
+    return text.where(column.notna(), None).tolist()
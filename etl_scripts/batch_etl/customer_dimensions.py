@@ -0,0 +1,517 @@
+"""
+=============================================================================
+CUSTOMER & FINANCE DIMENSION PIPELINE
+ClearVue BI System - The clean_data/thakgalo notebook chain as cached stages
+=============================================================================
+
+The dimension files in clean_data/thakgalo/json_outputs were produced by a
+chain of notebooks, each re-reading the previous ones' JSON-lines output and
+writing every table twice (CSV and JSON). Their cleaning steps are the
+stages below, run by stage_cache.run_stages():
+
+  customers             customer_data_cleaned.ipynb       customer_df_clean.json
+  customer_params       customer_acc_parameters_cleaned   customer_params_df_clean.json
+  customer_categories   customer_categories_cleaned       customer_categories_df_clean.json
+  customer_regions      customer_regions_cleaned          customer_regions_df_clean.json
+  representatives       representatives_cleaned           representatives_clean.json
+  payment_headers       payment_header_cleaned            payment_headers_clean.json
+  valid_payment_lines   payment_lines_cleaned (filter)    - (intermediate only)
+  payment_lines         payment_lines_cleaned             payment_lines_clean.json
+  dim_payment_summary   payment_lines_cleaned (summary)   dim_payment_summary.json
+  age_analysis          age_analysis.ipynb                age_analysis_clean.json
+  dim_time              dim_time.ipynb                    dim_time_collection.json
+  customer_merged       merge_customer.ipynb              customer_merged.json
+
+Stage results are cached as Parquet in clean_data/thakgalo/.stage_cache and
+a stage reruns only when its workbook, an upstream result or its own code
+(including the lookup maps it uses) changed. Refreshing customer_merged
+after an edit to the region map reruns customer_regions and customer_merged
+only. The JSON outputs are written once, when their content changes; the
+CSV copies are no longer produced.
+
+The outputs match the notebooks', except dim_time: it now comes from the
+financial calendar (fin_calendar.py), whose months do not overlap, and
+customer_merged keeps SETTLE_TERMS as a float (the notebooks' JSON round
+trip turned 0.0 into 0).
+
+Usage:
+    python etl_scripts/batch_etl/customer_dimensions.py
+    python etl_scripts/batch_etl/customer_dimensions.py --targets customer_merged
+    python etl_scripts/batch_etl/customer_dimensions.py --force customer_regions
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+if __package__ in (None, ""):
+    # allow running this file directly: python etl_scripts/batch_etl/customer_dimensions.py
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from etl_scripts.batch_etl.fin_calendar import FinancialCalendar
+from etl_scripts.batch_etl.instrumentation import RunMetrics, phase
+from etl_scripts.batch_etl.stage_cache import CACHE_DIR_NAME, Stage, print_runs, run_stages
+
+PIPELINE_DIR = Path(__file__).resolve().parents[2] / "clean_data" / "thakgalo"
+DATA_DIR = PIPELINE_DIR / "Data"
+EXPORT_DIR = PIPELINE_DIR / "json_outputs"
+CACHE_DIR = PIPELINE_DIR / CACHE_DIR_NAME
+
+# ABCD01, ABCDEF, ABCDE1 - the customer number formats the notebooks keep
+CUSTOMER_NUMBER_PATTERN = r"^[A-Z]{4}([A-Z]{2}|[A-Z][0-9]|[0-9]{2})$"
+REGION_CODE_PATTERN = r"^\d{1,2}[A-Za-z]$"
+
+PARAMETER_GROUPS = {
+    "Closed": "Account Status",
+    "Trading Account": "Account Status",
+    "Consignment": "Operations",
+    "Promotion": "Marketing",
+    "Promotional Stand": "Retail Format",
+}
+
+CCAT_GROUPS = {
+    # revenue-generating sales channels
+    "Departmentstore": "Channel: Retail (Dept Store)",
+    "Speciality stores": "Channel: Retail (Specialty)",
+    "sale goods": "Channel: Retail",
+    "Consignment": "Channel: Consignment",
+    "Botswana trip excl Exports": "Channel: Export",
+    "Exports incl Botswana": "Channel: Export",
+    # internal / operational
+    "House accounts": "Internal: House Account",
+    "samples": "Internal: Sample",
+    "stock movemnt shipments/backup": "Internal: Stock Movement",
+    "Advertising Appro": "Internal: Advertising",
+    "Advertising Appo.": "Internal: Advertising",
+    "Advertising App": "Internal: Advertising",
+    # junk / inactive
+    "bad debts": "Junk: Inactive/Bad Debt",
+    "CLOSED": "Junk: Inactive/Bad Debt",
+    "Unknown": "Junk: Unknown",
+    "No": "Junk: Unknown",
+    "no": "Junk: Unknown",
+    "?": "Junk: Unknown",
+    # regions entered as categories (they belong in REGION_DESC)
+    "Johannesburg CBDl": "Junk: Regional Code",
+    "Pretoria East": "Junk: Regional Code",
+    "Pietersburg / Potgietersrus": "Junk: Regional Code",
+    "Nelspruit / Tzaneen": "Junk: Regional Code",
+    "Pretoria Central": "Junk: Regional Code",
+    "Ermelo Pietretief": "Junk: Regional Code",
+    "Rustenburg Brits": "Junk: Regional Code",
+    "Gauteng North - Sandton": "Junk: Regional Code",
+    "Gauteng East": "Junk: Regional Code",
+    "G North-N/ Randburg/Rivonia": "Junk: Regional Code",
+    "Pretoria": "Junk: Regional Code",
+    "N- prov. Witbank Midd burg": "Junk: Regional Code",
+    "Gaut.N-EastgateNorwoodMidr": "Junk: Regional Code",
+    "Free state": "Junk: Regional Code",
+    "E Cape": "Junk: Regional Code",
+    "Pretoria North/South /West": "Junk: Regional Code",
+    "W cape/CT": "Junk: Regional Code",
+    "KZN/DBN": "Junk: Regional Code",
+    "Midlands": "Junk: Regional Code",
+    "Soweto Lenasia": "Junk: Regional Code",
+    "Vaal Triangle": "Junk: Regional Code",
+    "Krugersdorp Suncity": "Junk: Regional Code",
+    "Potch KlerksD Kuruman": "Junk: Regional Code",
+    "kwz natal/DBN Deon": "Junk: Regional Code",
+}
+JUNK_CCAT_GROUPS = ("Junk: Unknown", "Junk: Inactive/Bad Debt", "Junk: Regional Code")
+
+INVALID_REGION_DESCS = (
+    "Unknown", "Samples", "ADAPRO", "Stock - Defectives", "Closed - Bad Debts",
+    "Closed", "CONS", "Stores", "House Accounts", "Reps Trip - Botswana",
+)
+PROVINCES = {
+    "Durban": "KwaZulu-Natal",
+    "Midlands": "KwaZulu-Natal",
+    "Free State / Lesotho": "Free State",
+    "Botswana and Exports": "Export",
+    "Ermelo / Piet Retief": "Mpumalanga",
+    "Witbank/Middelburg": "Mpumalanga",
+    "Nelspruit / Tzaneen": "Mpumalanga",
+    "Pietersburg / Potgietersrus": "Limpopo",
+    "East Cape": "Eastern Cape",
+    "West Cape": "Western Cape",
+    "Pretoria Central": "Gauteng",
+    "Pretoria North/South/West": "Gauteng",
+    "Pretoria East": "Gauteng",
+    "Pretoria": "Gauteng",
+    "Vaal Triangle": "Gauteng",
+    "Soweto/Lenasia": "Gauteng",
+    "Johannesburg CBD": "Gauteng",
+    "Gauteng N - Sandton": "Gauteng",
+    "Gauteng N - Randburg/Rivonia": "Gauteng",
+    "Gauteng N - Eastgate/Norwood/Midrand": "Gauteng",
+    "Gauteng E - Alberton/Benoni/Kempton": "Gauteng",
+    "Rustenburg": "North West",
+    "Krugersdorp / Sun City": "North West",
+    "Potch / Krugersdorp / Kuruman": "North West",
+}
+
+# REP_DESC -> REP_DESC_CLEAN, as kept by representatives_cleaned.ipynb
+REP_DESC_CLEAN = {
+    # sales reps: their initials
+    "R": "R",
+    "R CONSIGNMENT SALES ACC": "R",
+    "R'S CUSTOMER - CH'S SALE": "R",
+    "R'S CUSTOMER - JU'S SALE": "R",
+    "R'S CUTOMER -EM'S SALE": "R",
+    "R's customer - RO's sale": "R",
+    "R  discount customer": "R",
+    "BJ": "BJ",
+    "BJ discount customer": "BJ",
+    "BJ CONSIGNMENTS": "BJ",
+    "BJ'S CUSTOMER - CH'S SALE": "BJ",
+    "BJ'S CUSTOMER - JU'S SALE": "BJ",
+    "BJ'S CUSTOMER- EM'S SALE": "BJ",
+    "BJ'S CUSTOMER- PROBLEM ACC": "BJ",
+    "BJ Exhibition": "BJ",
+    "BM": "BM",
+    "BM CONSIGNMENT SALES ACC": "BM",
+    "BM'S CUSTOMER - CH'S SAL": "BM",
+    "BM'S CUSTOMER - JU'S SALE": "BM",
+    "BM'S CUSTOMER-EM'S SALE": "BM",
+    "BM discount customer": "BM",
+    "BM FREE STATE + LESOTHO": "BM",
+    "RL": "RL",
+    "RL CONSIGNMENT SALES ACC": "RL",
+    "RL'S CUSTOMER - CH SALE": "RL",
+    "RL'S CUSTOMER - JU'S SALE": "RL",
+    "DA": "DA",
+    "DA CONSIGNMENT": "DA",
+    "DA CUSTOMER VP'S SAL": "DA",
+    "DA's Customer - EM's sal": "DA",
+    "DA CUSTOMER JU'S SALE": "DA",
+    "DA discount customer": "DA",
+    "LA": "LA",
+    "LA Consignments SalesAcc": "LA",
+    "LA CUST-VP'S SALE": "LA",
+    "LA CUST-EM SALE": "LA",
+    "LA CUSTJU SALE": "LA",
+    "LA Discount Customers": "LA",
+    "07-GROUP-LA": "LA",
+    "BA ALLISON": "BA",
+    "BA CONSIGNMENT SALES ACC": "BA",
+    "CONSIGNMENT BA": "BA_CONSIGNMENT",
+    "CH": "CH",
+    "JU": "JU",
+    "EM": "EM",
+    "VP": "VP",
+    "ML": "ML",
+    "SH": "SH",
+    "GR": "GR",
+    "DR": "DR",
+    # head office
+    "HEAD OFFICE": "HEAD OFFICE",
+    "HEAD OFFICE'S CUSTOMER DEPT STORE": "HEAD OFFICE",
+    "Head Office-Top Ten Dept stores": "HEAD OFFICE",
+    "HO discount customer": "HEAD OFFICE",
+    "HO'S CUSTOMER-EM'S SALE": "HEAD OFFICE",
+    # consignment
+    "LL Consignm": "CONSIGNMENT",
+    "LL": "CONSIGNMENT",
+    "CONSIGNMENT DE/STAND": "CONSIGNMENT",
+    "CONSIGNMENT BJ/STAND": "CONSIGNMENT",
+    "CONSIGNMENT BM/STAND": "CONSIGNMENT",
+    "CONSIGNMENT HO/STAND": "CONSIGNMENT",
+    "CONSIGNMENT DA/STAND": "CONSIGNMENT",
+    "Consignment LA / Stand": "CONSIGNMENT",
+    "CONSIGNMENTS HEAD OFFICE": "CONSIGNMENT",
+    "CONSIGNMENTS DE": "CONSIGNMENT",
+    "CONSIGNMENTS BJ": "CONSIGNMENT",
+    "CONSIGNMENTS BM": "CONSIGNMENT",
+    "CONSIGNMENTS HO": "CONSIGNMENT",
+    "CONSIGNMENTS DA": "CONSIGNMENT",
+    "Consignments LA": "CONSIGNMENT",
+    "STANDS- 30 PC CONSIGNMENT": "CONSIGNMENT_STANDS",
+    "STANDS-CONSIGNMENT": "CONSIGNMENT_STANDS",
+    "STAND-60PC CONSIGNMENT": "CONSIGNMENT_STANDS",
+    "HOUSE CONSIGNMENTS": "CONSIGNMENT",
+    # catalogue
+    "CAT CUSTOMER ONLY -ex BJ": "CATALOGUE",
+    "CAT CUSTOMER ONLY ex BM": "CATALOGUE",
+    "CAT CUSTOMER  ONLY- ex R": "CATALOGUE",
+    "CAT CUSTOMERS ONLY- ex RL": "CATALOGUE",
+    "CATALOGUE CUSTOMER ONLY - BJ": "CATALOGUE",
+    "CATALOGUE CUSTOMER ONLY - BM": "CATALOGUE",
+    "CATALOGUE CUSTOMER ONLY - RO": "CATALOGUE",
+    "CATALOGUE CUSTOMER-CH": "CATALOGUE",
+    "CM": "CATALOGUE",
+    # wholesale / export
+    "WHOLESALERS": "WHOLESALERS",
+    "EXPORTS": "EXPORTS",
+    # dropped below
+    "Faulty code - do not use": "UNWANTED_DATA",
+    "HEAD OFFICE do not use": "UNWANTED_DATA",
+    "do not use": "UNWANTED_DATA",
+    "BLOCK AND MOVE - DO NOT USE": "UNWANTED_DATA",
+    "PROBLEM - DECEASED ESTATES": "PROBLEM_ACCOUNT",
+    "PROBLEM - INSOLVENT ACCOUNT": "PROBLEM_ACCOUNT",
+    "PROBLEM-BAD DEBT-PAYING OFF": "PROBLEM_ACCOUNT",
+    "BAD DEBT- H/OVER": "BAD_DEBT",
+    "BAD DEBTS-DUCHESS-HANDED OVER": "BAD_DEBT",
+    "BAD CREDIT": "BAD_DEBT",
+    "CLOSED": "CLOSED_ACCOUNT",
+    "SALE HEAD OFFICE": "SALE",
+    "SALE R": "SALE",
+    "SALE BJ": "SALE",
+    "SALE BM": "SALE",
+    "SALE RL": "SALE",
+    "SALE DA": "SALE",
+    "LA SALE GOODS": "SALE",
+    "SALE CH": "SALE",
+    "SALE JU": "SALE",
+    "SALE EM": "SALE",
+    "DISC. FOR WIFES/FRIENDS": "DISCOUNT",
+    "discount specials": "DISCOUNT",
+    "PROMOTION ONCE-OFF": "PROMOTION",
+    "Repairs": "REPAIRS",
+    "REPAIR": "REPAIRS",
+    "sales stock": "STOCK_MOVEMENT",
+    "SAMPLES": "SAMPLES",
+    "STOCK MOVEMENT / SHIPMENTS/": "STOCK_MOVEMENT",
+    "Unknown": "UNKNOWN",
+    "01 CREDIT CARD": "UNKNOWN",
+    "01 N": "UNKNOWN",
+    "C- ITC": "UNKNOWN",
+    "C LEGAL": "UNKNOWN",
+}
+DROPPED_REP_DESC_CLEAN = (
+    "UNWANTED_DATA", "PROBLEM_ACCOUNT", "BAD_DEBT", "CLOSED_ACCOUNT", "STOCK_MOVEMENT",
+    "REPAIRS", "SAMPLES", "PROMOTION", "DISCOUNT", "UNKNOWN",
+)
+
+MERGED_REP_COLUMNS = ["REP_CODE", "COMM_METHOD", "COMMISSION", "REP_DESC_CLEAN", "REP_GROUP"]
+MERGED_CUSTOMER_COLUMNS = [
+    "CUSTOMER_NUMBER", "CCAT_CODE", "REGION_CODE", "REP_CODE",
+    "SETTLE_TERMS", "NORMAL_PAYTERMS", "DISCOUNT", "CREDIT_LIMIT",
+]
+DIM_TIME_FIELDS = ("financial_month", "start_date", "end_date", "year", "month", "quarter", "quarter_label")
+
+
+# ============================================================================
+# CUSTOMER STAGES
+# ============================================================================
+
+@phase("customers")
+def clean_customers(customer_df):
+    """Complete customer rows with a valid number, category, region, rep and terms."""
+    df = customer_df.dropna()
+    keep = (
+        df["CUSTOMER_NUMBER"].str.match(CUSTOMER_NUMBER_PATTERN, na=False)
+        & (df["CCAT_CODE"] > 0)
+        & df["REGION_CODE"].astype(str).str.match(REGION_CODE_PATTERN)
+        & df["REP_CODE"].astype(str).str.isalnum()
+        & (df["SETTLE_TERMS"] >= 0)
+        & (df["NORMAL_PAYTERMS"] > 0)
+        & (df["DISCOUNT"] >= 0)
+        & (df["CREDIT_LIMIT"] >= 0)
+    )
+    return df[keep].reset_index(drop=True)
+
+
+@phase("customer_params")
+def clean_customer_params(parameters_df):
+    df = parameters_df.dropna().copy()
+    df["PARAMETER_GROUP"] = df["PARAMETER"].map(PARAMETER_GROUPS)
+    return df
+
+
+@phase("customer_categories")
+def clean_customer_categories(categories_df):
+    """Categories with their CCAT_GROUP; junk and region-like categories are dropped."""
+    df = categories_df.dropna().copy()
+    df["CCAT_GROUP"] = df["CCAT_DESC"].map(CCAT_GROUPS)
+    return df[~df["CCAT_GROUP"].isin(JUNK_CCAT_GROUPS)].copy()
+
+
+@phase("customer_regions")
+def clean_customer_regions(regions_df):
+    """Real regions only, with their PROVINCE."""
+    df = regions_df.dropna()
+    df = df[~df["REGION_DESC"].isin(INVALID_REGION_DESCS)].copy()
+    df["PROVINCE"] = df["REGION_DESC"].map(PROVINCES)
+    return df
+
+
+def rep_groups(rep_desc_clean):
+    """REP_GROUP of each REP_DESC_CLEAN value (the notebook's classify_rep_group)."""
+    clean = pd.Series(rep_desc_clean)
+    text = clean.astype(object).fillna("").astype(str)
+    groups = np.select(
+        [clean.isna().to_numpy(),
+         (text.str.len() <= 2).to_numpy(),
+         (text == "HEAD OFFICE").to_numpy(),
+         text.str.contains("CONSIGNMENT", regex=False).to_numpy(),
+         (text == "CATALOGUE").to_numpy(),
+         (text == "WHOLESALERS").to_numpy(),
+         (text == "EXPORTS").to_numpy()],
+        ["Unclassified_Missing_Data", "Sales Rep", "Internal Sales", "Channel: Consignment",
+         "Channel: Catalogue", "Channel: Wholesaler", "Channel: Export"],
+        default="Unclassified",
+    )
+    return pd.Series(groups, index=clean.index, dtype=object)
+
+
+@phase("representatives")
+def clean_representatives(representatives_df):
+    """Representatives with REP_DESC_CLEAN and REP_GROUP; unusable reps are dropped."""
+    df = representatives_df.dropna().copy()
+    df["REP_DESC_CLEAN"] = df["REP_DESC"].map(REP_DESC_CLEAN)
+    df = df[~df["REP_DESC_CLEAN"].isin(DROPPED_REP_DESC_CLEAN)].copy()
+    df["REP_GROUP"] = rep_groups(df["REP_DESC_CLEAN"])
+    return df
+
+
+@phase("customer_merged")
+def merge_customer(customers, representatives, customer_params, customer_regions, customer_categories):
+    """One row per customer and parameter with its rep, region and category attributes."""
+    merged = customers[MERGED_CUSTOMER_COLUMNS].merge(
+        representatives[MERGED_REP_COLUMNS], on="REP_CODE", how="left"
+    )
+    return (
+        merged
+        .merge(customer_params[["CUSTOMER_NUMBER", "PARAMETER"]], on="CUSTOMER_NUMBER", how="left")
+        .merge(customer_regions, on="REGION_CODE", how="left")
+        .merge(customer_categories, on="CCAT_CODE", how="left")
+    )
+
+
+# ============================================================================
+# FINANCE STAGES
+# ============================================================================
+
+@phase("payment_headers")
+def clean_payment_headers(payment_header_df):
+    """Valid customers' payment headers with each customer's number of deposits."""
+    df = payment_header_df.dropna()
+    df = df[df["CUSTOMER_NUMBER"].str.match(CUSTOMER_NUMBER_PATTERN, na=False)].reset_index(drop=True)
+    df["NUM_DEPOSITS"] = df.groupby("CUSTOMER_NUMBER")["DEPOSIT_REF"].transform("nunique")
+    return df
+
+
+@phase("valid_payment_lines")
+def valid_payment_lines(payment_lines_df):
+    """Complete payment lines of valid customers with a deposit date."""
+    df = payment_lines_df.dropna().copy()
+    df["CUSTOMER_NUMBER"] = df["CUSTOMER_NUMBER"].astype(str).str.strip().str.upper()
+    df = df[df["CUSTOMER_NUMBER"].str.match(CUSTOMER_NUMBER_PATTERN, na=False)].copy()
+    df["DEPOSIT_DATE"] = pd.to_datetime(df["DEPOSIT_DATE"], errors="coerce")
+    return df.dropna(subset=["DEPOSIT_DATE"])
+
+
+@phase("dim_payment_summary")
+def payment_summary(valid_payment_lines):
+    """Total payments per FIN_PERIOD."""
+    return valid_payment_lines.groupby("FIN_PERIOD")["TOT_PAYMENT"].sum().reset_index()
+
+
+@phase("payment_lines")
+def clean_payment_lines(valid_payment_lines):
+    """Non-zero payments with lower-case columns, 'YYYY-MM' fin_period and ISO deposit_date."""
+    df = valid_payment_lines.copy()
+    for column in ("BANK_AMT", "DISCOUNT", "TOT_PAYMENT"):
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    df = df[df["TOT_PAYMENT"] != 0].copy()
+
+    period = df["FIN_PERIOD"].astype(str)
+    df["fin_period"] = period.str[:4] + "-" + period.str[4:]
+    df["deposit_date"] = df["DEPOSIT_DATE"].dt.strftime("%Y-%m-%d")
+    df = df.drop(columns=["FIN_PERIOD", "DEPOSIT_DATE"])
+
+    first = ["CUSTOMER_NUMBER", "fin_period", "deposit_date"]
+    df = df[first + [column for column in df.columns if column not in first]]
+    df.columns = df.columns.str.lower()
+    return df
+
+
+@phase("age_analysis")
+def clean_age_analysis(age_analysis_df):
+    """CUSTOMER_NUMBER, FIN_PERIOD (first of the month), TOTAL_DUE and AMT_CURRENT."""
+    df = age_analysis_df.copy()
+    df["CUSTOMER_NUMBER"] = df["CUSTOMER_NUMBER"].astype(str).str.strip()
+    df["FIN_PERIOD"] = pd.to_datetime(df["FIN_PERIOD"], format="%Y%m")
+    amount_columns = [column for column in df.columns if "AMT_" in column or "TOTAL_DUE" in column]
+    df[amount_columns] = df[amount_columns].apply(pd.to_numeric, errors="coerce")
+    # as in age_analysis.ipynb: the sheet's TOTAL_DUE plus every ageing bucket
+    df["TOTAL_DUE"] = df[amount_columns].sum(axis=1)
+    return df[["CUSTOMER_NUMBER", "FIN_PERIOD", "TOTAL_DUE", "AMT_CURRENT"]]
+
+
+@phase("dim_time")
+def build_dim_time(age_analysis):
+    """Financial months between the first and last FIN_PERIOD of the age analysis."""
+    periods = age_analysis["FIN_PERIOD"].dropna()
+    if periods.empty:
+        return pd.DataFrame(columns=list(DIM_TIME_FIELDS))
+    first, last = periods.min(), periods.max()
+    calendar = FinancialCalendar(first.year, last.year)
+    documents = calendar.documents(first.year * 100 + first.month, last.year * 100 + last.month)
+    return pd.DataFrame([{field: doc[field] for field in DIM_TIME_FIELDS} for doc in documents])
+
+
+STAGES = (
+    Stage("customers", clean_customers,
+          sources=(("customer_df", "Customer.xlsx", "Customer"),),
+          export="customer_df_clean.json"),
+    Stage("customer_params", clean_customer_params,
+          sources=(("parameters_df", "Customer Account Parameters.xlsx", "Customer_Account_Parameters"),),
+          export="customer_params_df_clean.json"),
+    Stage("customer_categories", clean_customer_categories,
+          sources=(("categories_df", "Customer Categories.xlsx", "Customer_Categories"),),
+          export="customer_categories_df_clean.json"),
+    Stage("customer_regions", clean_customer_regions,
+          sources=(("regions_df", "Customer Regions.xlsx", "Customer_Regions"),),
+          export="customer_regions_df_clean.json"),
+    Stage("representatives", clean_representatives,
+          sources=(("representatives_df", "Representatives.xlsx", "Representatives"),),
+          export="representatives_clean.json"),
+    Stage("customer_merged", merge_customer,
+          deps=("customers", "representatives", "customer_params", "customer_regions", "customer_categories"),
+          export="customer_merged.json"),
+    Stage("payment_headers", clean_payment_headers,
+          sources=(("payment_header_df", "Payment Header.xlsx", "Payment_Header"),),
+          export="payment_headers_clean.json"),
+    Stage("valid_payment_lines", valid_payment_lines,
+          sources=(("payment_lines_df", "Payment Lines.xlsx", "Payment_Lines"),)),
+    Stage("payment_lines", clean_payment_lines, deps=("valid_payment_lines",),
+          export="payment_lines_clean.json"),
+    Stage("dim_payment_summary", payment_summary, deps=("valid_payment_lines",),
+          export="dim_payment_summary.json"),
+    Stage("age_analysis", clean_age_analysis,
+          sources=(("age_analysis_df", "Age Analysis.xlsx", "Age_Analysis"),),
+          export="age_analysis_clean.json"),
+    Stage("dim_time", build_dim_time, deps=("age_analysis",),
+          export="dim_time_collection.json"),
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the customer and finance dimension outputs")
+    parser.add_argument("--targets", nargs="+", choices=[stage.name for stage in STAGES], default=None,
+                        help="build only these stages (and what they depend on)")
+    parser.add_argument("--force", nargs="+", default=(), help="rerun these stages even when cached")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--export-dir", type=Path, default=EXPORT_DIR)
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    args = parser.parse_args(argv)
+
+    print("\n" + "=" * 80)
+    print("CUSTOMER & FINANCE DIMENSIONS (STAGED PIPELINE)")
+    print("=" * 80 + "\n")
+
+    with RunMetrics("customer_dimensions", args.cache_dir.parent) as run:
+        runs = run_stages(STAGES, args.data_dir, args.cache_dir, args.export_dir,
+                          targets=args.targets, force=tuple(args.force))
+    print_runs(runs)
+    print("\n" + run.report())
+    return runs
+
+
+if __name__ == "__main__":
+    main()
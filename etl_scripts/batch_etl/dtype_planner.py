@@ -0,0 +1,99 @@
+"""
+=============================================================================
+DTYPE PLANNER
+ClearVue BI System - Compact column types for the raw frames
+=============================================================================
+
+pd.read_excel hands every code column back as object (one Python str per
+cell) and every amount as int64/float64. plan_dtypes() picks a smaller type
+for each column from its values:
+
+  - low-cardinality text (CCAT_CODE, REGION_CODE, REP_CODE, ...) -> category;
+  - other text columns with no missing cells -> Arrow-backed strings
+    (needs pyarrow; without it they stay object);
+  - integers -> the smallest signed int that holds their range;
+  - floats -> float32 only when every value survives the round trip exactly.
+
+Every conversion is lossless, but narrow types change arithmetic, so kernels
+that multiply or sum amounts widen() their inputs to int64/float64 first.
+Text with missing cells is never made Arrow-backed: .tolist() and
+.astype(str) would hand pd.NA / '<NA>' to the document builders instead of
+NaN / 'nan'. Mixed-type object columns (ints and strings) are left alone.
+
+RawFrames applies compact_frame() to every frame it loads and prints the
+before/after memory_usage(deep=True) of each one.
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (backs the "string[pyarrow]" dtype)
+    ARROW_STRING = "string[pyarrow]"
+except ImportError:  # optional: text columns stay object
+    ARROW_STRING = None
+
+# a text column becomes a category when it has at most this share of distinct values
+CATEGORY_MAX_RATIO = 0.5
+MB = 1024 ** 2
+
+
+def _is_all_str(column):
+    values = column.dropna()
+    return len(values) > 0 and values.map(type).eq(str).all()
+
+
+def _plan_column(column):
+    dtype = column.dtype
+    if pd.api.types.is_bool_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype):
+        return None
+    if pd.api.types.is_integer_dtype(dtype) and dtype.kind in "iu":
+        narrow = pd.to_numeric(column, downcast="integer").dtype
+        return narrow if narrow != dtype else None
+    if pd.api.types.is_float_dtype(dtype) and dtype != np.float32:
+        as_float32 = column.astype(np.float32)
+        lossless = (as_float32.astype(dtype) == column) | column.isna()
+        return np.dtype(np.float32) if lossless.all() else None
+    if dtype == object and _is_all_str(column):
+        non_null = column.notna().sum()
+        if column.nunique() <= CATEGORY_MAX_RATIO * non_null:
+            return "category"
+        if ARROW_STRING is not None and non_null == len(column):
+            return ARROW_STRING
+    return None
+
+
+def plan_dtypes(df):
+    """{column: target dtype} for the columns of df that can be stored more compactly."""
+    plan = {}
+    for name in df.columns:
+        target = _plan_column(df[name])
+        if target is not None:
+            plan[name] = target
+    return plan
+
+
+def compact_frame(df, plan=None):
+    """Apply a dtype plan (plan_dtypes(df) by default); returns (df, bytes before, bytes after)."""
+    before = int(df.memory_usage(deep=True).sum())
+    plan = plan_dtypes(df) if plan is None else plan
+    if plan:
+        df = df.astype(plan)
+    return df, before, int(df.memory_usage(deep=True).sum())
+
+
+def memory_report(name, before, after):
+    saved = 1 - after / before if before else 0.0
+    return f"Memory usage {name}: {before / MB:.2f} MB -> {after / MB:.2f} MB ({saved:.0%} smaller)"
+
+
+def widen(column):
+    """A numeric column as int64/float64 (what the kernels compute in); other columns unchanged."""
+    column = pd.Series(column)
+    if pd.api.types.is_bool_dtype(column.dtype):
+        return column
+    if pd.api.types.is_integer_dtype(column.dtype) and column.dtype.kind in "iu":
+        return column.astype(np.int64)
+    if pd.api.types.is_float_dtype(column.dtype):
+        return column.astype(np.float64)
+    return column
@@ -0,0 +1,219 @@
+"""
+=============================================================================
+FINANCIAL CALENDAR
+ClearVue BI System - Financial months, quarters and the dim_time collection
+=============================================================================
+
+ClearVue's financial month ends on the last Friday of the calendar month and
+starts the day after the previous one ended (the last Saturday of the
+previous month):
+
+  2018-03   2018-02-24 .. 2018-03-30   Q1 2018
+  2018-04   2018-03-31 .. 2018-04-27   Q2 2018
+
+The transforms used to derive FIN_PERIOD with strftime("%Y%m"), which puts
+the last days of a calendar month into the wrong financial month.
+FinancialCalendar precomputes the period end dates of a range of years as
+one sorted datetime64[D] array. assign() maps a whole date column with a
+single np.searchsorted (O(n log p) for n dates and p periods): a date
+belongs to the first period that ends on or after it. The quarter is the
+calendar quarter of the financial month, as in dim_time.ipynb.
+
+dim_time.ipynb built the months with Python loops over calendar.monthrange
+and started each month on the last Saturday of the previous calendar month,
+so a month following one that ended on a Friday (2018-08-31) overlapped it
+by a week. Here every month starts the day after the previous one ends.
+
+Run as a script to export the dim_time collection for the periods the
+source workbooks cover:
+    python etl_scripts/batch_etl/fin_calendar.py
+    python etl_scripts/batch_etl/loading_scripts/bulk_upsert.py dim_time --collection dim_time
+
+Usage:
+    periods = fin_calendar_for(dates).assign(dates)   # FIN_PERIOD, FIN_QUARTER, QUARTER_LABEL
+    header_df["FIN_PERIOD"] = fin_periods(header_df["TRANS_DATE"])
+"""
+
+import functools
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+if __package__ in (None, ""):
+    # allow running this file directly: python etl_scripts/batch_etl/fin_calendar.py
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from etl_scripts.batch_etl.collection_writer import collection_path, write_collection
+from etl_scripts.batch_etl.ingest import read_excel_cached
+from etl_scripts.batch_etl.instrumentation import RunMetrics, phase
+
+SCRIPT_DIR = Path(__file__).parent
+RAW_DATA_DIR = SCRIPT_DIR.parent.parent / "raw_data"
+OUTPUT_DIR = RAW_DATA_DIR.parent
+
+DIM_TIME = "dim_time"
+FRIDAY = 4
+# workbook, sheet, column: the FIN_PERIODs dim_time must cover
+PERIOD_SOURCES = (
+    ("Sales Header.xlsx", "Sales_Header", "FIN_PERIOD"),
+    ("Age Analysis.xlsx", "Age_Analysis", "FIN_PERIOD"),
+    ("Payment Lines.xlsx", "Payment_Lines", "FIN_PERIOD"),
+)
+
+
+def _last_fridays(months):
+    # last Friday of each calendar month (datetime64[M]), as datetime64[D]
+    month_ends = (months + 1).astype("datetime64[D]") - 1
+    # 1970-01-01 was a Thursday: weekday (Monday = 0) = (days + 3) % 7
+    weekdays = (month_ends.astype(np.int64) + 3) % 7
+    return month_ends - ((weekdays - FRIDAY) % 7).astype("timedelta64[D]")
+
+
+class FinancialCalendar:
+    """Financial months of first_year..last_year as sorted boundary arrays."""
+
+    def __init__(self, first_year, last_year):
+        if last_year < first_year:
+            raise ValueError(f"Empty calendar: {first_year}..{last_year}")
+        months = np.arange(np.datetime64(f"{first_year}-01", "M"), np.datetime64(f"{last_year + 1}-01", "M"))
+        # the December before first_year only supplies the first start date
+        boundaries = _last_fridays(np.concatenate([months[:1] - 1, months]))
+        self.starts = boundaries[:-1] + 1
+        self.ends = boundaries[1:]
+        self.years = months.astype("datetime64[Y]").astype(np.int64) + 1970
+        self.months = months.astype(np.int64) % 12 + 1
+        self.periods = self.years * 100 + self.months
+        self.quarters = (self.months - 1) // 3 + 1
+
+    def __len__(self):
+        return len(self.periods)
+
+    @property
+    def first_day(self):
+        return pd.Timestamp(self.starts[0])
+
+    @property
+    def last_day(self):
+        return pd.Timestamp(self.ends[-1])
+
+    def positions(self, dates):
+        """Index of each date's financial month; -1 for missing dates and dates outside the calendar."""
+        days = pd.to_datetime(pd.Series(dates), errors="coerce").to_numpy(dtype="datetime64[D]")
+        positions = np.searchsorted(self.ends, days, side="left")
+        outside = np.isnat(days) | (positions >= len(self.ends))
+        positions[outside] = 0
+        outside |= days < self.starts[positions]
+        positions[outside] = -1
+        return positions
+
+    def _take(self, values, positions, index):
+        found = positions >= 0
+        return pd.Series(values[np.where(found, positions, 0)], index=index).where(found, None)
+
+    def fin_periods(self, dates):
+        """FIN_PERIOD (YYYYMM, Int64 with <NA> where unknown) of each date."""
+        index = getattr(dates, "index", None)
+        return self._take(self.periods, self.positions(dates), index).astype("Int64")
+
+    def assign(self, dates):
+        """FIN_PERIOD, FIN_QUARTER and QUARTER_LABEL ('Q1 2018') of each date."""
+        index = getattr(dates, "index", None)
+        positions = self.positions(dates)
+        labels = np.array([f"Q{q} {y}" for q, y in zip(self.quarters.tolist(), self.years.tolist())], dtype=object)
+        return pd.DataFrame({
+            "FIN_PERIOD": self._take(self.periods, positions, index).astype("Int64"),
+            "FIN_QUARTER": self._take(self.quarters, positions, index).astype("Int64"),
+            "QUARTER_LABEL": self._take(labels, positions, index).astype(object),
+        }, index=index)
+
+    def documents(self, first_period=None, last_period=None):
+        """dim_time documents of the financial months first_period..last_period (YYYYMM, inclusive)."""
+        keep = np.ones(len(self), dtype=bool)
+        if first_period is not None:
+            keep &= self.periods >= int(first_period)
+        if last_period is not None:
+            keep &= self.periods <= int(last_period)
+        for period, year, month, quarter, start, end in zip(
+            self.periods[keep].tolist(), self.years[keep].tolist(), self.months[keep].tolist(),
+            self.quarters[keep].tolist(), self.starts[keep].astype(str).tolist(), self.ends[keep].astype(str).tolist(),
+        ):
+            yield {
+                "_id": str(period),
+                "fin_period": str(period),
+                "financial_month": f"{year}-{month:02}",
+                "start_date": start,
+                "end_date": end,
+                "days": int((np.datetime64(end) - np.datetime64(start)) / np.timedelta64(1, "D")) + 1,
+                "year": year,
+                "month": month,
+                "quarter": quarter,
+                "quarter_label": f"Q{quarter} {year}",
+            }
+
+
+@functools.lru_cache(maxsize=16)
+def _calendar(first_year, last_year):
+    return FinancialCalendar(first_year, last_year)
+
+
+def fin_calendar_for(dates):
+    """A (cached) calendar covering every date in dates."""
+    days = pd.to_datetime(pd.Series(dates), errors="coerce")
+    if days.notna().any():
+        first_year, last_year = days.min().year, days.max().year
+    else:
+        first_year = last_year = 2000
+    # a date after December's last Friday falls in January of the next year
+    return _calendar(int(first_year), int(last_year) + 1)
+
+
+def fin_periods(dates):
+    """FIN_PERIOD (YYYYMM, Int64) of each date under the financial calendar."""
+    return fin_calendar_for(dates).fin_periods(dates)
+
+
+# ============================================================================
+# DIM_TIME EXPORT
+# ============================================================================
+
+def period_range(raw_data_dir=RAW_DATA_DIR):
+    """(first, last) FIN_PERIOD referenced by the PERIOD_SOURCES workbooks that exist."""
+    bounds = []
+    for workbook, sheet_name, column in PERIOD_SOURCES:
+        path = Path(raw_data_dir) / workbook
+        if not path.exists():
+            continue
+        periods = pd.to_numeric(read_excel_cached(path, sheet_name=sheet_name)[column], errors="coerce").dropna()
+        if len(periods):
+            bounds += [int(periods.min()), int(periods.max())]
+    if not bounds:
+        raise FileNotFoundError(f"No FIN_PERIOD source workbook found in {raw_data_dir}")
+    return min(bounds), max(bounds)
+
+
+@phase("load_dim_time")
+def load_dim_time(first_period, last_period, output_dir=OUTPUT_DIR):
+    """Write the dim_time documents of first_period..last_period; returns the writer."""
+    calendar = _calendar(first_period // 100, last_period // 100)
+    output_file = collection_path(output_dir, DIM_TIME)
+    writer = write_collection(output_file, calendar.documents(first_period, last_period))
+    print(f"✓ Exported {writer.documents} {DIM_TIME} documents ({first_period}..{last_period}) to {output_file}")
+    return writer
+
+
+def main(raw_data_dir=RAW_DATA_DIR, output_dir=OUTPUT_DIR):
+    print("\n" + "=" * 80)
+    print("DIM_TIME COLLECTION (FINANCIAL CALENDAR)")
+    print("=" * 80 + "\n")
+
+    with RunMetrics(DIM_TIME, output_dir) as run:
+        first_period, last_period = period_range(raw_data_dir)
+        writer = load_dim_time(first_period, last_period, output_dir)
+    print("\n" + run.report())
+    return writer
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+=============================================================================
+FOREIGN KEY VALIDATION
+ClearVue BI System - Declarative parent/child checks with reject sidecars
+=============================================================================
+
+The sales, customer and supplier transforms each checked their foreign
+keys by hand: a Python set of parent codes per key, then one filter of the
+child frame per key. Rejected rows were counted and thrown away. Now each
+transform declares its keys as ForeignKey specs and check_foreign_keys()
+validates a child table against all of them together:
+
+  - each parent key becomes a pandas Index (a hash table; composite keys a
+    MultiIndex) and the child column is probed against it once;
+  - every violated constraint sets its bit in one uint32 reason mask per
+    row, so the child frame is filtered a single time however many keys
+    it has, and a row that breaks two keys reports both;
+  - a key with reject=False only records its violations (the supplier
+    check: purchase orders of unknown suppliers are kept and get an
+    "Unknown Supplier" later).
+
+Membership follows Series.isin, so a missing child value is only valid when
+the parent has a missing value too, exactly as the old checks behaved.
+
+While a RejectLog is active (`with RejectLog(job, output_dir):` in the
+transforms' main()), every child row that broke a key is written with a
+REJECT_REASONS column ('unknown_ccat_code|unknown_region_code') to
+<output_dir>/.etl_rejects/<job>/<table>.parquet (NDJSON when the frame
+cannot be stored as Parquet), and a summary.json counts the rejects per
+table and reason. Each run replaces its job's sidecars. Without an active
+RejectLog (tests, benchmarks) nothing is written.
+
+Usage:
+    result = check_foreign_keys(
+        "customers", customers_df,
+        [ForeignKey("unknown_ccat_code", "CCAT_CODE", "customer_categories")],
+        {"customer_categories": customer_categories_df},
+    )
+    print_report(result)
+    customers_df = result.valid
+"""
+
+import contextvars
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REJECTS_DIR_NAME = ".etl_rejects"
+REASON_COLUMN = "REJECT_REASONS"
+MAX_CONSTRAINTS = 32  # one bit of the uint32 reason mask each
+
+_active_log = contextvars.ContextVar("clearvue_active_reject_log", default=None)
+
+
+def _as_tuple(columns):
+    return (columns,) if isinstance(columns, str) else tuple(columns)
+
+
+@dataclass(frozen=True)
+class ForeignKey:
+    """Child columns that must match a key of a parent table.
+
+    reason is the code reported for violating rows. parent names an entry of
+    the parents mapping given to check_foreign_keys(): a DataFrame (holding
+    parent_columns, by default the child's column names) or, for a single
+    column key, any array of valid values. With reject=False violating rows
+    are recorded but kept.
+    """
+    reason: str
+    columns: tuple
+    parent: str
+    parent_columns: tuple = None
+    reject: bool = True
+
+    def __post_init__(self):
+        object.__setattr__(self, "columns", _as_tuple(self.columns))
+        object.__setattr__(self, "parent_columns", _as_tuple(self.parent_columns or self.columns))
+        if len(self.columns) != len(self.parent_columns):
+            raise ValueError(f"{self.reason}: {len(self.columns)} child columns but "
+                             f"{len(self.parent_columns)} parent columns")
+
+    @property
+    def label(self):
+        return ", ".join(self.columns)
+
+
+@dataclass
+class ForeignKeyResult:
+    """Outcome of check_foreign_keys() for one child table."""
+    table: str
+    rows: int
+    valid: pd.DataFrame
+    rejects: pd.DataFrame  # every row that broke a key (kept or not), with REJECT_REASONS
+    constraints: list
+    violations: dict = field(default_factory=dict)  # reason -> violating rows
+
+    @property
+    def rejected(self):
+        """Rows removed from the table."""
+        return self.rows - len(self.valid)
+
+
+def _parent_keys(parent, columns):
+    # distinct parent keys as a hashed Index (MultiIndex for composite keys)
+    if isinstance(parent, pd.DataFrame):
+        if len(columns) == 1:
+            return pd.Index(parent[columns[0]]).unique()
+        return pd.MultiIndex.from_frame(parent[list(columns)]).unique()
+    if len(columns) != 1:
+        raise ValueError("a composite key needs its parent as a DataFrame")
+    return pd.Index(parent).unique()
+
+
+def _child_matches(child_df, columns, keys):
+    if len(columns) == 1:
+        return child_df[columns[0]].isin(keys).to_numpy()
+    return pd.MultiIndex.from_frame(child_df[list(columns)]).isin(keys)
+
+
+def _reason_labels(mask, constraints):
+    # 'reason_a|reason_b' per row, built once per distinct mask value
+    labels = {
+        value: "|".join(fk.reason for bit, fk in enumerate(constraints) if value >> bit & 1)
+        for value in np.unique(mask).tolist()
+    }
+    return pd.Series(mask).map(labels).to_numpy(dtype=object)
+
+
+def check_foreign_keys(table, child_df, constraints, parents):
+    """Validate child_df against every ForeignKey in constraints in one pass.
+
+    parents maps the constraints' parent names to their frames (or value
+    arrays). Returns a ForeignKeyResult whose valid frame keeps the rows that
+    broke no rejecting key, in their original order and with their index.
+    """
+    constraints = list(constraints)
+    if len(constraints) > MAX_CONSTRAINTS:
+        raise ValueError(f"{table}: at most {MAX_CONSTRAINTS} foreign keys per table")
+
+    mask = np.zeros(len(child_df), dtype=np.uint32)
+    reject_bits = np.uint32(0)
+    violations = {}
+    for bit, fk in enumerate(constraints):
+        keys = _parent_keys(parents[fk.parent], fk.parent_columns)
+        broken = ~_child_matches(child_df, fk.columns, keys)
+        violations[fk.reason] = int(broken.sum())
+        mask |= broken.astype(np.uint32) << np.uint32(bit)
+        if fk.reject:
+            reject_bits |= np.uint32(1 << bit)
+
+    flagged = mask != 0
+    rejects = child_df[flagged].copy()
+    rejects[REASON_COLUMN] = _reason_labels(mask[flagged], constraints)
+    valid = child_df[(mask & reject_bits) == 0] if mask.any() else child_df
+
+    result = ForeignKeyResult(table, len(child_df), valid, rejects, constraints, violations)
+    log = _active_log.get()
+    if log is not None:
+        log.record(result)
+    return result
+
+
+def print_report(result, noun=None):
+    """The transforms' phase 3 lines: one warning or check mark per key."""
+    noun = noun or result.table.replace("_", " ")
+    for fk in result.constraints:
+        count = result.violations[fk.reason]
+        if count:
+            print(f"⚠ WARNING: {count} {noun} have invalid {fk.label}")
+            print(f"  Action: {'Removing' if fk.reject else 'Keeping'} records with invalid {fk.label}")
+        else:
+            print(f"✓ All {fk.label} values are valid")
+    if result.rejected:
+        print(f"  {result.rows} -> {len(result.valid)} {noun} "
+              f"({len(result.rejects)} rows in the reject sidecar)")
+
+
+# ============================================================================
+# REJECT SIDECARS
+# ============================================================================
+
+def _json_ready(df):
+    # plain Python values with None where missing, dates as ISO strings
+    out = {}
+    for name, column in df.items():
+        if pd.api.types.is_datetime64_any_dtype(column):
+            column = column.dt.strftime("%Y-%m-%dT%H:%M:%S")
+        out[str(name)] = column.astype(object).where(column.notna(), None).tolist()
+    return [dict(zip(out, row)) for row in zip(*out.values())]
+
+
+def write_rejects(rejects, path_stem):
+    """Write a rejects frame next to path_stem as .parquet, else .ndjson; returns the path."""
+    path_stem = Path(path_stem)
+    path_stem.parent.mkdir(parents=True, exist_ok=True)
+    parquet_path = path_stem.with_suffix(".parquet")
+    try:
+        rejects.to_parquet(parquet_path, index=False)
+        return parquet_path
+    except Exception:
+        # no parquet engine or mixed-type object columns
+        if parquet_path.exists():
+            parquet_path.unlink()
+
+    ndjson_path = path_stem.with_suffix(".ndjson")
+    with open(ndjson_path, "w", encoding="utf-8") as handle:
+        for row in _json_ready(rejects):
+            handle.write(json.dumps(row, default=str) + "\n")
+    return ndjson_path
+
+
+def read_rejects(path):
+    """A sidecar written by write_rejects() as a DataFrame."""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_json(path, lines=True, dtype=False)
+
+
+@dataclass
+class RejectLog:
+    """Collects the rejects of one transform run; a context manager like RunMetrics.
+
+    keys (a KeyDictionary) adds the CUSTOMER_NUMBER of rows that only carry a
+    CUSTOMER_KEY, so the sidecars can be read without the key dictionary.
+    """
+    job: str
+    output_dir: Path = None
+    keys: object = None
+    tables: dict = field(default_factory=dict)  # table -> {"rows", "rejected", "violations", "path"}
+
+    @property
+    def directory(self):
+        return Path(self.output_dir) / REJECTS_DIR_NAME / self.job
+
+    def __enter__(self):
+        self._token = _active_log.set(self)
+        if self.output_dir is not None and self.directory.exists():
+            for stale in self.directory.iterdir():
+                stale.unlink()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _active_log.reset(self._token)
+        if self.output_dir is not None and self.tables:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            (self.directory / "summary.json").write_text(json.dumps(
+                {"job": self.job, "success": exc_type is None, "tables": self.tables}, indent=2
+            ))
+
+    def record(self, result):
+        entry = {"rows": result.rows, "rejected": result.rejected, "violations": result.violations, "path": None}
+        if self.output_dir is not None and len(result.rejects):
+            rejects = result.rejects
+            if self.keys is not None and "CUSTOMER_KEY" in rejects and "CUSTOMER_NUMBER" not in rejects:
+                rejects = rejects.assign(CUSTOMER_NUMBER=self.keys.decode(rejects["CUSTOMER_KEY"]))
+            entry["path"] = str(write_rejects(rejects, self.directory / result.table))
+        self.tables[result.table] = entry
@@ -0,0 +1,178 @@
+"""
+=============================================================================
+INCREMENTAL REFRESH STATE
+ClearVue BI System - FIN_PERIOD watermarks for the batch transforms
+=============================================================================
+
+Sales Header and Age Analysis mostly grow by whole financial periods, so a
+nightly refresh does not need to rebuild every document. For each collection
+a small JSON state file records:
+
+  - the watermark: the latest FIN_PERIOD that has been exported;
+  - a fingerprint per FIN_PERIOD of the source rows that feed it;
+  - a fingerprint of each whole-table input (e.g. account parameters) whose
+    change affects every period.
+
+changed_periods() compares fresh fingerprints against the state: periods
+after the watermark are new, periods at or before it are rebuilt only when
+their fingerprint moved (a restated period). The state is committed only
+after the delta export has been written, so a failed run is simply redone.
+
+Usage:
+    state = PeriodState.load(STATE_DIR, "sales_collection")
+    fingerprints = period_fingerprints(header_df, "FIN_PERIOD")
+    periods = state.changed_periods(fingerprints)
+    ...  # build and export only the documents of those periods
+    state.stage(fingerprints)
+    state.commit()
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from etl_scripts.batch_etl.dtype_planner import widen
+
+STATE_DIR_NAME = ".etl_state"
+MISSING_PERIOD = "none"
+
+
+def period_keys(periods):
+    """FIN_PERIOD values as the state's string keys ('202401'), 'none' where missing."""
+    periods = pd.Series(periods)
+    numeric = pd.to_numeric(periods, errors="coerce").astype("Int64")
+    return numeric.astype(str).where(numeric.notna(), MISSING_PERIOD).reset_index(drop=True)
+
+
+def row_hashes(df):
+    """uint64 hash of each row, independent of the storage width of its numeric columns."""
+    # narrowed numeric columns (see dtype_planner) hash as int64/float64, so a
+    # fingerprint does not change when a column's planned storage width does
+    # (an int8 -1 and an int64 -1 hash differently)
+    narrow = [name for name, dtype in df.dtypes.items()
+              if dtype.kind in "iuf" and dtype not in (np.int64, np.float64)]
+    if narrow:
+        df = df.copy(deep=False)
+        for name in narrow:
+            df[name] = widen(df[name])
+    return pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64)
+
+
+def _fingerprint(count, digest):
+    return f"{count}-{digest:016x}"
+
+
+def frame_fingerprint(df):
+    """Order-independent fingerprint of a whole frame's rows."""
+    hashes = row_hashes(df)
+    return _fingerprint(len(hashes), int(np.add.reduce(hashes, dtype=np.uint64)) if len(hashes) else 0)
+
+
+def period_fingerprints(df, period_column=None, periods=None):
+    """{period key: fingerprint} over the rows of each period.
+
+    The period of each row comes from df[period_column], or from the aligned
+    periods array when the rows carry no period themselves (e.g. sales lines,
+    whose period is their header's). Row order does not affect the result.
+    """
+    if periods is None:
+        periods = df[period_column]
+    keys = period_keys(periods)
+    codes, uniques = pd.factorize(keys)
+    hashes = row_hashes(df)
+
+    digests = np.zeros(len(uniques), dtype=np.uint64)
+    np.add.at(digests, codes, hashes)  # wraps modulo 2**64
+    counts = np.bincount(codes, minlength=len(uniques))
+    return {
+        key: _fingerprint(count, digest)
+        for key, count, digest in zip(uniques, counts.tolist(), digests.tolist())
+    }
+
+
+def combine_fingerprints(*fingerprint_maps):
+    """Merge per-period fingerprints of several inputs into one map."""
+    periods = sorted(set().union(*fingerprint_maps))
+    return {
+        period: "|".join(fingerprints.get(period, "") for fingerprints in fingerprint_maps)
+        for period in periods
+    }
+
+
+def _period_sort_key(period):
+    return (period == MISSING_PERIOD, period)
+
+
+class PeriodState:
+    """Watermark and per-period fingerprints of one exported collection."""
+
+    def __init__(self, path, watermark=None, periods=None, sources=None):
+        self.path = Path(path)
+        self.watermark = watermark
+        self.periods = dict(periods or {})
+        self.sources = dict(sources or {})
+        self._staged = None
+
+    @classmethod
+    def load(cls, state_dir, collection):
+        path = Path(state_dir) / f"{collection}.json"
+        if not path.exists():
+            return cls(path)
+        try:
+            state = json.loads(path.read_text())
+        except ValueError:
+            return cls(path)  # unreadable state: treat as a first run
+        return cls(path, state.get("watermark"), state.get("periods"), state.get("sources"))
+
+    @property
+    def is_first_run(self):
+        return self.watermark is None and not self.periods
+
+    def sources_changed(self, sources):
+        """Names of whole-table inputs whose fingerprint differs from the last run."""
+        return sorted(name for name, fingerprint in sources.items() if self.sources.get(name) != fingerprint)
+
+    def changed_periods(self, fingerprints, sources=None):
+        """Periods to rebuild: new ones, restated ones, or all when a whole-table input changed."""
+        if sources and self.sources_changed(sources):
+            return sorted(fingerprints, key=_period_sort_key)
+        return sorted(
+            (period for period, fingerprint in fingerprints.items() if self.periods.get(period) != fingerprint),
+            key=_period_sort_key,
+        )
+
+    def vanished_periods(self, fingerprints):
+        """Periods exported before that no longer have any source rows."""
+        return sorted(set(self.periods) - set(fingerprints), key=_period_sort_key)
+
+    def is_new(self, period):
+        return self.watermark is None or (period != MISSING_PERIOD and period > self.watermark)
+
+    def stage(self, fingerprints, sources=None):
+        """Remember the fingerprints of this run; written by commit() once the export succeeded."""
+        self._staged = (dict(fingerprints), dict(sources or {}))
+
+    def commit(self):
+        if self._staged is None:
+            return
+        self.periods, self.sources = self._staged
+        known = [period for period in self.periods if period != MISSING_PERIOD]
+        self.watermark = max(known) if known else None
+        self._staged = None
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(
+            {"watermark": self.watermark, "periods": self.periods, "sources": self.sources}, indent=2
+        ))
+        os.replace(tmp, self.path)
+
+    def summary(self, changed):
+        """One-line description of a refresh for the console banners."""
+        new = [period for period in changed if self.is_new(period)]
+        restated = len(changed) - len(new)
+        return (f"{len(changed)} period(s) to rebuild: {len(new)} new after watermark "
+                f"{self.watermark}, {restated} restated")
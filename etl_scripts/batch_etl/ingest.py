@@ -0,0 +1,338 @@
+"""
+=============================================================================
+SHARED INGESTION LAYER
+ClearVue BI System - Cached access to the raw_data Excel workbooks
+=============================================================================
+
+Parsing the workbooks with pd.read_excel is the slowest part of every batch
+script (Sales Header.xlsx and Age Analysis.xlsx take several seconds each).
+read_excel_cached() parses a sheet once and keeps a columnar snapshot of it
+next to the workbook; later runs (and the other scripts) read the snapshot.
+
+A snapshot is reused while the workbook's size and mtime are unchanged. If
+either changed, the workbook is re-hashed and the snapshot is still reused
+when the content hash matches (e.g. the file was only copied or touched).
+
+Snapshots are stored as Parquet when pyarrow can round-trip the frame
+exactly. Sheets Parquet cannot hold (e.g. an object column mixing ints and
+strings) fall back to a pickle snapshot, so the cached frame is always
+identical to what pd.read_excel returned.
+
+iter_excel_chunks() reads a sheet as a stream of DataFrame chunks instead:
+rows come from openpyxl's read-only mode (or python-calamine when it is
+installed) and are typed in one call of the parser pd.read_excel uses, so
+the chunks concatenate to the frame read_excel would return wherever the
+chunk boundaries fall. Each chunk is snapshotted as its own part, so a
+cached read holds only one raw chunk at a time. RawFrames uses it for
+frames that have a chunk cleaner: the cleaner runs on each chunk, and only
+cleaned rows are kept.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # optional faster engine; openpyxl read-only mode otherwise
+    CalamineWorkbook = None
+
+from etl_scripts.batch_etl.dtype_planner import compact_frame, memory_report
+
+SNAPSHOT_DIR_NAME = ".snapshots"
+CHUNK_ROWS = 50_000
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _snapshot_stem(path, sheet_name, read_kwargs):
+    key = f"{path.resolve()}::{sheet_name}::{sorted(read_kwargs.items())}"
+    return f"{path.stem}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+
+
+def _restore_missing(df):
+    # Parquet hands back None for missing cells in object columns, read_excel uses NaN
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+def _atomic_write(target, write):
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, target)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def _write_snapshot(df, stem_path):
+    parquet_path = stem_path.with_suffix(".parquet")
+    try:
+        _atomic_write(parquet_path, lambda p: df.to_parquet(p, index=True))
+        if _restore_missing(pd.read_parquet(parquet_path)).equals(df):
+            return parquet_path
+        parquet_path.unlink()
+    except Exception:
+        # no parquet engine, non-string column names or mixed-type object columns
+        if parquet_path.exists():
+            parquet_path.unlink()
+
+    pickle_path = stem_path.with_suffix(".pkl")
+    _atomic_write(pickle_path, lambda p: df.to_pickle(p))
+    return pickle_path
+
+
+def _read_snapshot(snapshot_path):
+    if snapshot_path.suffix == ".parquet":
+        return _restore_missing(pd.read_parquet(snapshot_path))
+    return pd.read_pickle(snapshot_path)
+
+
+def _snapshot_parts(cache_dir, manifest):
+    # a streamed sheet is snapshotted as one file per chunk
+    return [cache_dir / name for name in manifest.get("parts", [manifest.get("snapshot")])]
+
+
+def _cached_manifest(path, stem_path):
+    """(manifest, content_hash): the manifest when its snapshot still matches the workbook, else None."""
+    manifest_path = stem_path.with_suffix(".json")
+    if not manifest_path.exists():
+        return None, None
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except ValueError:
+        return None, None
+    if not all(part.exists() for part in _snapshot_parts(stem_path.parent, manifest)):
+        return None, None
+
+    stat = path.stat()
+    if manifest["size"] == stat.st_size and manifest["mtime_ns"] == stat.st_mtime_ns:
+        return manifest, None
+
+    content_hash = _file_digest(path)
+    if manifest["sha256"] != content_hash:
+        return None, content_hash
+    manifest.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    _atomic_write(manifest_path, lambda p: p.write_text(json.dumps(manifest, indent=2)))
+    return manifest, content_hash
+
+
+def _write_manifest(path, sheet_name, stem_path, content_hash, **snapshot):
+    stat = path.stat()
+    manifest = {
+        "source": str(path.resolve()),
+        "sheet_name": sheet_name,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": content_hash or _file_digest(path),
+        **snapshot,
+    }
+    _atomic_write(stem_path.with_suffix(".json"), lambda p: p.write_text(json.dumps(manifest, indent=2)))
+
+
+def _remove_snapshots(stem_path):
+    for stale in stem_path.parent.glob(f"{stem_path.name}.*"):
+        if stale.suffix in (".parquet", ".pkl"):
+            stale.unlink()
+    for stale in stem_path.parent.glob(f"{stem_path.name}-part*"):
+        stale.unlink()
+
+
+def _cache_paths(path, sheet_name, cache_dir, read_kwargs):
+    cache_dir = Path(cache_dir) if cache_dir is not None else path.parent / SNAPSHOT_DIR_NAME
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir / _snapshot_stem(path, sheet_name, read_kwargs)
+
+
+def read_excel_cached(path, sheet_name=0, cache_dir=None, **read_kwargs):
+    """Drop-in replacement for pd.read_excel(path, sheet_name=...) for a single sheet."""
+    path = Path(path)
+    if sheet_name is None or isinstance(sheet_name, list):
+        raise ValueError("read_excel_cached reads one sheet at a time")
+
+    stem_path = _cache_paths(path, sheet_name, cache_dir, read_kwargs)
+    manifest, content_hash = _cached_manifest(path, stem_path)
+    if manifest is not None:
+        parts = [_read_snapshot(part) for part in _snapshot_parts(stem_path.parent, manifest)]
+        return parts[0] if len(parts) == 1 else pd.concat(parts)
+
+    df = pd.read_excel(path, sheet_name=sheet_name, **read_kwargs)
+
+    _remove_snapshots(stem_path)
+    snapshot_path = _write_snapshot(df, stem_path)
+    _write_manifest(path, sheet_name, stem_path, content_hash, snapshot=snapshot_path.name)
+    return df
+
+
+def _cell_value(value):
+    # the cell conversions of pandas' Excel readers: blanks are missing, whole floats are ints
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return datetime.datetime.combine(value, datetime.time())
+    return value
+
+
+def _sheet_rows(path, sheet_name):
+    """Rows of one sheet as tuples of cell values, header row first; the workbook is never fully loaded."""
+    if CalamineWorkbook is not None:
+        workbook = CalamineWorkbook.from_path(str(path))
+        if isinstance(sheet_name, int):
+            sheet = workbook.get_sheet_by_index(sheet_name)
+        else:
+            sheet = workbook.get_sheet_by_name(sheet_name)
+        yield from sheet.iter_rows()
+        return
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _stream_sheet(path, sheet_name, chunksize):
+    """Parse the sheet once and hand it out in chunks of chunksize rows.
+
+    The parser infers each column's dtype from the values it sees, so parsing
+    chunk by chunk would turn a chunk of '001', '002' codes into ints while
+    the whole column (which also holds 'A01') stays text. The rows are
+    therefore streamed from the workbook into one parser call, which types
+    every column as pd.read_excel would, and only then split into chunks.
+    """
+    rows = _sheet_rows(path, sheet_name)
+    header = next(rows, None)
+    if header is None:
+        return
+    cells = [[_cell_value(v) for v in header]]
+    cells.extend([_cell_value(v) for v in row] for row in rows)
+    sheet = TextParser(cells, header=0).read()
+    del cells
+    for start in range(0, len(sheet), chunksize):
+        yield sheet.iloc[start:start + chunksize]
+
+
+def _sanitize_columns(df):
+    # strip all whitespace and standardise to uppercase
+    df.columns = df.columns.str.strip().str.upper()
+    return df
+
+
+def iter_excel_chunks(path, sheet_name=0, chunksize=CHUNK_ROWS, cache_dir=None):
+    """Yield one sheet as DataFrames of at most chunksize rows, with standardised column names.
+
+    The chunks concatenate to load_and_sanitize(path, sheet_name). The sheet is
+    streamed and snapshotted part by part on a cache miss; a cached sheet is
+    read back one part at a time.
+    """
+    path = Path(path)
+    stem_path = _cache_paths(path, sheet_name, cache_dir, {})
+    manifest, content_hash = _cached_manifest(path, stem_path)
+    if manifest is not None:
+        for part in _snapshot_parts(stem_path.parent, manifest):
+            df = _sanitize_columns(_read_snapshot(part))
+            for start in range(0, len(df), chunksize):
+                yield df.iloc[start:start + chunksize]
+        return
+
+    _remove_snapshots(stem_path)
+    parts = []
+    for i, chunk in enumerate(_stream_sheet(path, sheet_name, chunksize)):
+        parts.append(_write_snapshot(chunk, stem_path.with_name(f"{stem_path.name}-part{i:05d}")).name)
+        yield _sanitize_columns(chunk)
+    # only a completely streamed sheet is recorded as cached
+    _write_manifest(path, sheet_name, stem_path, content_hash, parts=parts)
+
+
+def load_and_sanitize(path, sheet_name=0, cache_dir=None):
+    """Load one sheet through the snapshot cache and standardise its column names."""
+    return _sanitize_columns(read_excel_cached(path, sheet_name=sheet_name, cache_dir=cache_dir))
+
+
+class RawFrames(Mapping):
+    """Named raw frames that are only read when a stage first asks for them.
+
+    sources maps a frame name to its (workbook, sheet_name) in raw_data_dir.
+    Nothing is read at construction time, so importing a transform or building
+    its extract() result costs nothing until a stage indexes the mapping.
+    Frames are read through load_and_sanitize (snapshot cache, standardised
+    column names), given compact dtypes by the dtype planner unless
+    compact=False, and kept for later accesses. A plain dict of DataFrames can
+    be passed to the transform stages instead, e.g. in tests and benchmarks.
+
+    cleaners maps a frame name to a row-wise cleaning function. Those frames
+    are read with iter_excel_chunks instead and each chunk is cleaned before
+    the chunks are joined; the stages read them through cleaned_frame().
+    """
+
+    def __init__(self, raw_data_dir, sources, loader=load_and_sanitize, compact=True, cleaners=None,
+                 chunksize=CHUNK_ROWS):
+        self.raw_data_dir = Path(raw_data_dir)
+        self.sources = dict(sources)
+        self._loader = loader
+        self.compact = compact
+        self.cleaners = dict(cleaners or {})
+        self.chunksize = chunksize
+        self._frames = {}
+
+    def _read(self, name, workbook, sheet_name):
+        path = self.raw_data_dir / workbook
+        if name not in self.cleaners:
+            return self._loader(path, sheet_name)
+        clean = self.cleaners[name]
+        chunks = [clean(chunk) for chunk in iter_excel_chunks(path, sheet_name, self.chunksize)]
+        if not chunks:
+            # an empty sheet: its header only, through the whole-frame reader
+            return clean(self._loader(path, sheet_name))
+        return chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+
+    def __getitem__(self, name):
+        if name not in self._frames:
+            workbook, sheet_name = self.sources[name]
+            try:
+                df = self._read(name, workbook, sheet_name)
+            except FileNotFoundError as e:
+                print(f"✗ FILE NOT FOUND: {e}")
+                print("Make sure all required Excel files are in the raw_data directory")
+                raise
+            print(f"✓ Loaded {workbook}: {len(df)} records")
+            if self.compact:
+                df, before, after = compact_frame(df)
+                print(f"  {memory_report(name, before, after)}")
+            self._frames[name] = df
+        return self._frames[name]
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def is_loaded(self, name):
+        return name in self._frames
+
+
+def cleaned_frame(frames, name, clean):
+    """frames[name] passed through clean(), unless RawFrames already cleaned it chunk by chunk."""
+    if isinstance(frames, RawFrames) and frames.cleaners.get(name) is clean:
+        return frames[name]
+    return clean(frames[name])
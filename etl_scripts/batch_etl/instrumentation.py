@@ -0,0 +1,270 @@
+"""
+=============================================================================
+PHASE INSTRUMENTATION
+ClearVue BI System - Per-phase timings and metrics for the batch transforms
+=============================================================================
+
+The transforms print PHASE banners but recorded no numbers. A RunMetrics
+collects, for every phase of one run:
+
+  - wall time and CPU time (time.perf_counter / time.process_time);
+  - the process's peak RSS at the end of the phase and how much the phase
+    raised it (resource.getrusage; not available on Windows);
+  - with trace_memory=True, the peak Python allocation above the phase's
+    starting point (tracemalloc - slower, so off by default);
+  - rows in and out: the rows of the DataFrame arguments and results (a
+    list or tuple of frames counts all of them, a CollectionWriter counts
+    its documents). Other values - lists of documents, lookups, lazy
+    generators - have no row count unless the phase passes rows_in /
+    rows_out to say how to count them.
+
+Phase functions are wrapped once with the @phase decorator. It records into
+the RunMetrics that is active (`with RunMetrics(...)`) and costs nothing
+otherwise, so tests and ad-hoc calls of the phases are unaffected.
+
+When the run ends its report is written as JSON to
+<output_dir>/.etl_metrics/<job>.json. If CLEARVUE_PROM_TEXTFILE_DIR is set
+(a node_exporter textfile collector directory), the run is also written
+there as clearvue_<job>.prom, one series per phase name: a phase that runs
+more than once is summed over its calls.
+
+Usage:
+    @phase("standardize")
+    def standardize(frames): ...
+
+    with RunMetrics("sales_collection", output_dir) as run:
+        ...
+    print(run.report())
+"""
+
+import contextvars
+import functools
+import json
+import operator
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, peak RSS is not reported
+    resource = None
+
+METRICS_DIR_NAME = ".etl_metrics"
+PROM_TEXTFILE_DIR = os.environ.get("CLEARVUE_PROM_TEXTFILE_DIR") or None
+
+_active_run = contextvars.ContextVar("clearvue_active_run", default=None)
+
+
+def peak_rss_bytes():
+    """High-water mark of this process's resident set size, None where unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def count_rows(value):
+    """Rows in a phase argument or result; None for values that have no row count.
+
+    A list or tuple (e.g. the arguments of a phase) counts the rows of the
+    DataFrames it holds; a Series next to a frame is taken to be one of its
+    columns (e.g. aligned periods), so Series only count when there is no frame.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(getattr(value, "documents", None), int):
+        return value.documents  # CollectionWriter
+    if isinstance(value, (list, tuple)):
+        for kind in (pd.DataFrame, pd.Series):
+            counts = [len(item) for item in value if isinstance(item, kind)]
+            if counts:
+                return sum(counts)
+    return None
+
+
+@dataclass
+class PhaseMetrics:
+    name: str
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    rows_in: int = None
+    rows_out: int = None
+    peak_rss_bytes: int = None
+    rss_growth_bytes: int = None  # how far the phase raised the process peak
+    traced_peak_bytes: int = None
+    error: str = None
+
+
+@dataclass
+class RunMetrics:
+    """Phase metrics of one transform run; a context manager that writes the reports on exit."""
+    job: str
+    output_dir: Path = None
+    trace_memory: bool = False
+    prom_textfile_dir: Path = PROM_TEXTFILE_DIR
+    phases: list = field(default_factory=list)
+    started_at: float = 0.0
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    success: bool = None
+
+    def __enter__(self):
+        self._token = _active_run.set(self)
+        self._started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        self.started_at = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall_time = time.perf_counter() - self._wall
+        self.cpu_time = time.process_time() - self._cpu
+        self.success = exc_type is None
+        if self._started_tracing:
+            tracemalloc.stop()
+        _active_run.reset(self._token)
+        if self.output_dir is not None:
+            self.write_json(Path(self.output_dir) / METRICS_DIR_NAME / f"{self.job}.json")
+        if self.prom_textfile_dir is not None:
+            self.write_prometheus(Path(self.prom_textfile_dir) / f"clearvue_{self.job}.prom")
+
+    def record(self, name, func, args, kwargs, rows_out=count_rows, rows_in=count_rows):
+        metrics = PhaseMetrics(name)
+        metrics.rows_in = rows_in(tuple(args) + tuple(kwargs.values()))
+        rss_before = peak_rss_bytes()
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            traced_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            metrics.error = f"{type(e).__name__}: {e}"
+            raise
+        else:
+            metrics.rows_out = rows_out(result)
+            return result
+        finally:
+            metrics.wall_time = time.perf_counter() - wall
+            metrics.cpu_time = time.process_time() - cpu
+            metrics.peak_rss_bytes = peak_rss_bytes()
+            if rss_before is not None:
+                metrics.rss_growth_bytes = metrics.peak_rss_bytes - rss_before
+            if tracing:
+                metrics.traced_peak_bytes = tracemalloc.get_traced_memory()[1] - traced_start
+            self.phases.append(metrics)
+
+    def to_dict(self):
+        return {
+            "job": self.job,
+            "started_at": self.started_at,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "success": self.success,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "phases": [asdict(metrics) for metrics in self.phases],
+        }
+
+    def write_json(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), indent=2))
+        return path
+
+    def prometheus_lines(self):
+        job = self.job.replace("\\", "\\\\").replace('"', '\\"')
+        lines = []
+
+        def gauge(metric, help_text, samples):
+            samples = [(labels, value) for labels, value in samples if value is not None]
+            if not samples:
+                return
+            lines.append(f"# HELP clearvue_etl_{metric} {help_text}")
+            lines.append(f"# TYPE clearvue_etl_{metric} gauge")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in {"job": job, **labels}.items())
+                lines.append(f"clearvue_etl_{metric}{{{label_text}}} {float(value)!r}")
+
+        gauge("run_wall_seconds", "Wall time of the last run.", [({}, self.wall_time)])
+        gauge("run_success", "1 if the last run finished without an error.", [({}, int(bool(self.success)))])
+        gauge("run_started_timestamp_seconds", "Unix time the last run started.", [({}, self.started_at)])
+        totals = self.phase_totals()
+        for metric, attribute, help_text in (
+            ("phase_calls", "calls", "Times an ETL phase ran in the last run."),
+            ("phase_wall_seconds", "wall_time", "Wall time of an ETL phase."),
+            ("phase_cpu_seconds", "cpu_time", "CPU time of an ETL phase."),
+            ("phase_rows_in", "rows_in", "Rows passed into an ETL phase."),
+            ("phase_rows_out", "rows_out", "Rows returned by an ETL phase."),
+            ("phase_peak_rss_bytes", "peak_rss_bytes", "Process peak RSS at the end of an ETL phase."),
+            ("phase_traced_peak_bytes", "traced_peak_bytes", "Peak traced Python allocation during an ETL phase."),
+        ):
+            gauge(metric, help_text, [({"phase": name}, total[attribute]) for name, total in totals.items()])
+        return lines
+
+    def phase_totals(self):
+        """{phase name: totals} over every call of each phase, in first-call order.
+
+        A phase can run more than once in a run (e.g. once per stream), but a
+        Prometheus series must be unique: times and rows are summed, peaks are
+        the maximum over the calls.
+        """
+        totals = {}
+        for metrics in self.phases:
+            total = totals.setdefault(metrics.name, {"calls": 0})
+            total["calls"] += 1
+            for attribute, combine in (("wall_time", operator.add), ("cpu_time", operator.add),
+                                       ("rows_in", operator.add), ("rows_out", operator.add),
+                                       ("peak_rss_bytes", max), ("traced_peak_bytes", max)):
+                value = getattr(metrics, attribute)
+                if value is not None:
+                    total[attribute] = value if total.get(attribute) is None else combine(total[attribute], value)
+                else:
+                    total.setdefault(attribute, None)
+        return totals
+
+    def write_prometheus(self, path):
+        # written under a temporary name and renamed, so the collector never reads half a file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text("\n".join(self.prometheus_lines()) + "\n")
+        os.replace(tmp, path)
+        return path
+
+    def report(self):
+        """Console table of the phases, slowest first."""
+        lines = [f"PHASE TIMINGS ({self.job}): {self.wall_time:.2f}s wall, {self.cpu_time:.2f}s CPU"]
+        for metrics in sorted(self.phases, key=lambda m: -m.wall_time):
+            rows = f"{metrics.rows_in if metrics.rows_in is not None else '-'} -> " \
+                   f"{metrics.rows_out if metrics.rows_out is not None else '-'}"
+            rss = f"{metrics.peak_rss_bytes / 1024 ** 2:8.1f} MB" if metrics.peak_rss_bytes is not None else ""
+            lines.append(f"  {metrics.name:<28} {metrics.wall_time:8.3f}s {metrics.cpu_time:8.3f}s cpu  "
+                         f"rows {rows:<20} {rss}")
+        return "\n".join(lines)
+
+
+def phase(name, rows_out=count_rows, rows_in=count_rows):
+    """Decorator: record the wrapped function as a phase of the active RunMetrics, if any.
+
+    rows_out counts the rows of the phase's result when count_rows() would not
+    (e.g. a result tuple that also carries samples, or a list of documents);
+    rows_in does the same for the tuple of the phase's arguments (positional,
+    then keyword values).
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            run = _active_run.get()
+            if run is None:
+                return func(*args, **kwargs)
+            return run.record(name, func, args, kwargs, rows_out, rows_in)
+        return wrapper
+    return decorate
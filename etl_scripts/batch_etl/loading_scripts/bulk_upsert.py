@@ -0,0 +1,257 @@
+"""
+=============================================================================
+CHUNKED BULK UPSERT ENGINE
+ClearVue BI System - Streaming exported collections into MongoDB
+=============================================================================
+
+bulk_upsert() reads documents from any iterable (normally read_collection()
+over an NDJSON export) and writes them in fixed-size batches of
+ReplaceOne({"_id": ...}, doc, upsert=True) operations:
+
+  - reloading an export replaces documents in place, so a collection never
+    has to be wiped first and duplicate _ids are not errors;
+  - batches are unordered bulk writes, so the server can apply them in any
+    order and one bad document does not stop the rest of its batch;
+  - with workers > 1 several batches are in flight at once over the client's
+    connection pool (MongoClient is thread-safe); at most 2 x workers
+    batches are held in memory.
+
+sync_collection() goes one step further for exports whose documents carry a
+content_hash (see collection_writer): it reads the stored {_id: content_hash}
+digests once, then sends only InsertOne for new _ids, ReplaceOne for
+documents whose hash changed and DeleteOne for _ids the export no longer
+contains. Unchanged documents never leave the machine, so a reload costs
+roughly the size of the change instead of the size of the collection.
+
+The engine only calls collection.bulk_write(), so it can be exercised against
+a local mongod or an in-process stand-in collection.
+
+Usage:
+    python etl_scripts/batch_etl/loading_scripts/bulk_upsert.py sales_collection_delta --collection sales
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+
+from pymongo import DeleteOne, InsertOne, MongoClient, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+if __package__ in (None, ""):
+    # allow running this file directly: python etl_scripts/batch_etl/loading_scripts/bulk_upsert.py
+    sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from etl_scripts.batch_etl.collection_writer import HASH_FIELD, content_hash, find_collection, read_collection
+
+DEFAULT_BATCH_SIZE = 1000
+DATABASE_NAME = "clearvue_bi_system"
+EXPORT_DIR = Path(__file__).resolve().parents[3]
+
+
+@dataclass
+class UpsertStats:
+    """Counters of one bulk_upsert() run."""
+    documents: int = 0
+    batches: int = 0
+    inserted: int = 0   # inserts and upserts that created a document
+    matched: int = 0    # existing _ids that were found
+    modified: int = 0   # existing documents whose content changed
+    deleted: int = 0    # documents whose _id vanished from the export
+    skipped: int = 0    # unchanged documents that were not sent at all
+    write_errors: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def docs_per_sec(self):
+        return self.documents / self.elapsed if self.elapsed else 0.0
+
+    def add(self, result):
+        self.batches += 1
+        self.inserted += result.get("nUpserted", 0) + result.get("nInserted", 0)
+        self.matched += result.get("nMatched", 0)
+        self.modified += result.get("nModified", 0)
+        self.deleted += result.get("nRemoved", 0)
+        self.write_errors.extend(result.get("writeErrors", []))
+
+
+def batched(docs, batch_size):
+    """Yield lists of up to batch_size documents from any iterable."""
+    iterator = iter(docs)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def write_batch(collection, requests):
+    """One unordered bulk write; returns the raw result counts."""
+    try:
+        return collection.bulk_write(requests, ordered=False).bulk_api_result
+    except BulkWriteError as e:
+        # unordered: everything but the failing documents was applied
+        return e.details
+
+
+def upsert_batch(collection, batch):
+    """One unordered bulk write of ReplaceOne upserts; returns the raw result counts."""
+    return write_batch(collection, [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in batch])
+
+
+def _execute(collection, request_batches, workers, stats, progress):
+    start = time.perf_counter()
+
+    def finished(result):
+        stats.add(result)
+        stats.elapsed = time.perf_counter() - start
+        if progress is not None:
+            progress(stats)
+
+    if workers == 1:
+        for requests in request_batches:
+            finished(write_batch(collection, requests))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            in_flight = set()
+            for requests in request_batches:
+                if len(in_flight) >= 2 * workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finished(future.result())
+                in_flight.add(pool.submit(write_batch, collection, requests))
+            for future in in_flight:
+                finished(future.result())
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def _check_sizes(batch_size, workers):
+    if batch_size < 1 or workers < 1:
+        raise ValueError("batch_size and workers must be at least 1")
+
+
+def bulk_upsert(collection, docs, batch_size=DEFAULT_BATCH_SIZE, workers=1, progress=None):
+    """Upsert every document by _id in batches; returns UpsertStats.
+
+    progress, if given, is called with the running stats after each batch.
+    """
+    _check_sizes(batch_size, workers)
+    stats = UpsertStats()
+
+    def request_batches():
+        for batch in batched(docs, batch_size):
+            stats.documents += len(batch)
+            yield [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in batch]
+
+    return _execute(collection, request_batches(), workers, stats, progress)
+
+
+def stored_digests(collection, hash_field=HASH_FIELD):
+    """{_id: content_hash} of every stored document (None for documents loaded without one)."""
+    # the compound (_id, hash) index lets the server answer this from the index alone
+    collection.create_index([("_id", 1), (hash_field, 1)], name=f"{hash_field}_digest")
+    return {doc["_id"]: doc.get(hash_field) for doc in collection.find({}, {hash_field: 1})}
+
+
+def sync_collection(collection, docs, batch_size=DEFAULT_BATCH_SIZE, workers=1,
+                    delete_missing=True, progress=None, hash_field=HASH_FIELD, scope_field=None):
+    """Make the collection match the export, sending only what changed; returns UpsertStats.
+
+    Documents without a stored hash field get one computed here. Pass
+    delete_missing=False for partial exports (e.g. an incremental delta),
+    where an _id missing from the export does not mean it was removed.
+    A partial export that is complete for each value of scope_field (e.g. a
+    rollup delta holds every row of its fin_periods) still deletes the stored
+    documents of those values that it no longer contains.
+    """
+    _check_sizes(batch_size, workers)
+    stats = UpsertStats()
+    digests = stored_digests(collection, hash_field)
+    seen = set()
+    scopes = set()
+
+    def requests():
+        for doc in docs:
+            stats.documents += 1
+            doc_id = doc["_id"]
+            seen.add(doc_id)
+            if scope_field is not None:
+                scopes.add(doc.get(scope_field))
+            digest = doc.get(hash_field) or content_hash(doc, hash_field)
+            if doc_id not in digests:
+                yield InsertOne({**doc, hash_field: digest})
+            elif digests[doc_id] != digest:
+                yield ReplaceOne({"_id": doc_id}, {**doc, hash_field: digest}, upsert=True)
+            else:
+                stats.skipped += 1
+                continue
+            digests[doc_id] = digest  # a repeated _id later in the export is a replacement
+        if delete_missing:
+            for doc_id in digests.keys() - seen:
+                yield DeleteOne({"_id": doc_id})
+        elif scopes:
+            for doc in collection.find({scope_field: {"$in": list(scopes)}}, {"_id": 1}):
+                if doc["_id"] not in seen:
+                    yield DeleteOne({"_id": doc["_id"]})
+
+    return _execute(collection, batched(requests(), batch_size), workers, stats, progress)
+
+
+def print_stats(stats):
+    print(f"✓ Loaded {stats.documents} documents in {stats.batches} batch(es)")
+    print(f"  Inserted: {stats.inserted}, replaced: {stats.modified}, deleted: {stats.deleted}, "
+          f"unchanged: {stats.skipped + stats.matched - stats.modified}")
+    print(f"  Throughput: {stats.docs_per_sec:,.0f} docs/sec ({stats.elapsed:.2f}s)")
+    if stats.write_errors:
+        print(f"⚠ {len(stats.write_errors)} document(s) failed, first error: {stats.write_errors[0].get('errmsg')}")
+
+
+def add_arguments(parser, default_uri=None):
+    """Connection and batching options shared by the loading scripts."""
+    parser.add_argument("--uri", default=os.environ.get("MONGODB_URI", default_uri),
+                        help="MongoDB connection string (default: $MONGODB_URI)")
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="documents per bulk write")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="batches written concurrently over the client's connection pool")
+    parser.add_argument("--export-dir", type=Path, default=EXPORT_DIR,
+                        help="directory holding the transform exports")
+    parser.add_argument("--keep-missing", action="store_true",
+                        help="do not delete stored documents whose _id is no longer exported")
+    return parser
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upsert an exported collection into MongoDB")
+    parser.add_argument("export", help="export name, e.g. sales_collection or sales_collection_delta "
+                                       "(a *_delta export never deletes)")
+    parser.add_argument("--collection", required=True, help="target MongoDB collection")
+    parser.add_argument("--scope-field", default=None,
+                        help="a *_delta export is complete per value of this field (e.g. fin_period for "
+                             "rollups): stored documents of those values it no longer holds are deleted")
+    args = add_arguments(parser).parse_args(argv)
+    if not args.uri:
+        parser.error("no connection string: pass --uri or set MONGODB_URI")
+
+    path = find_collection(args.export_dir, args.export)
+    print(f"Loading {path} into {args.database}.{args.collection}")
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=5000, maxPoolSize=max(args.workers, 1) + 1)
+    try:
+        stats = sync_collection(client[args.database][args.collection], read_collection(path),
+                                batch_size=args.batch_size, workers=args.workers,
+                                delete_missing=not (args.keep_missing or args.export.endswith("_delta")),
+                                scope_field=None if args.keep_missing else args.scope_field)
+    finally:
+        client.close()
+    print_stats(stats)
+    return 1 if stats.write_errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+=============================================================================
+MONGODB ROLLUP UPLOAD SCRIPT
+Load the sales_rollup and finance_rollup exports next to the base collections
+=============================================================================
+
+The transforms export the rollups (see etl_scripts/batch_etl/rollups.py)
+with their base collections. A full export is synced like any collection.
+A --delta export holds every rollup row of the periods it rebuilt, so it is
+synced with scope_field="fin_period": rows that vanished from a rebuilt
+period are deleted, and the other periods are not touched.
+
+Usage:
+    python etl_scripts/batch_etl/loading_scripts/rollups.py
+    python etl_scripts/batch_etl/loading_scripts/rollups.py --delta --only sales_rollup
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from pymongo import MongoClient
+
+if __package__ in (None, ""):
+    # allow running this file directly: python etl_scripts/batch_etl/loading_scripts/rollups.py
+    sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from etl_scripts.batch_etl.collection_writer import find_collection, read_collection
+from etl_scripts.batch_etl.loading_scripts.bulk_upsert import add_arguments, print_stats, sync_collection
+from etl_scripts.batch_etl.rollups import FINANCE_ROLLUP, PERIOD_FIELD, SALES_ROLLUP
+
+# rollup export -> the fields dashboards filter on besides fin_period
+ROLLUPS = {
+    SALES_ROLLUP: ("rep_code", "customer_number"),
+    FINANCE_ROLLUP: ("region_code",),
+}
+
+
+def sync_rollup(db, export_dir, name, delta=False, batch_size=1000, workers=1, keep_missing=False):
+    """Sync one rollup export into db[name]; returns UpsertStats."""
+    path = find_collection(export_dir, f"{name}_delta" if delta else name)
+    print(f"Loading {path.name} into {db.name}.{name}")
+    collection = db[name]
+    stats = sync_collection(
+        collection, read_collection(path), batch_size=batch_size, workers=workers,
+        delete_missing=not (delta or keep_missing),
+        scope_field=PERIOD_FIELD if delta and not keep_missing else None,
+    )
+    print_stats(stats)
+
+    collection.create_index(PERIOD_FIELD)
+    for field in ROLLUPS[name]:
+        collection.create_index([(PERIOD_FIELD, 1), (field, 1)])
+    print(f"✓ Indexed {PERIOD_FIELD} and ({PERIOD_FIELD}, {', '.join(ROLLUPS[name])})\n")
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upsert the BI rollup exports into MongoDB")
+    parser.add_argument("--delta", action="store_true",
+                        help="load the incremental rollups (transforms run with --incremental)")
+    parser.add_argument("--only", nargs="+", choices=sorted(ROLLUPS), default=sorted(ROLLUPS))
+    args = add_arguments(parser).parse_args(argv)
+    if not args.uri:
+        parser.error("no connection string: pass --uri or set MONGODB_URI")
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=5000, maxPoolSize=max(args.workers, 1) + 1)
+    try:
+        results = [
+            sync_rollup(client[args.database], args.export_dir, name, delta=args.delta,
+                        batch_size=args.batch_size, workers=args.workers, keep_missing=args.keep_missing)
+            for name in args.only
+        ]
+    finally:
+        client.close()
+    return 1 if any(stats.write_errors for stats in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""
+=============================================================================
+BATCH ETL ORCHESTRATOR
+ClearVue BI System - Nightly refresh of all MongoDB collections
+=============================================================================
+
+Runs the collection builds as a small DAG instead of four scripts by hand:
+
+  1. every raw workbook any selected node reads is parsed once, in parallel,
+     into the ingest snapshot cache - the nodes then share those decoded
+     frames instead of each re-parsing its own Excel sources;
+  2. nodes whose dependencies are done run concurrently in a process pool,
+     with their console output captured to logs/<node>.log;
+  3. per-node wall time is reported, plus the total against the sequential sum.
+
+Usage:
+    python etl_scripts/batch_etl/orchestrator.py
+    python etl_scripts/batch_etl/orchestrator.py --only customer finance --workers 2
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import redirect_stderr, redirect_stdout
+from dataclasses import dataclass, field
+from pathlib import Path
+
+if __package__ in (None, ""):
+    # allow running this file directly: python etl_scripts/batch_etl/orchestrator.py
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from etl_scripts.batch_etl.ingest import read_excel_cached
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+RAW_DATA_DIR = SCRIPT_DIR.parent.parent / "raw_data"
+LOG_DIR = SCRIPT_DIR / "logs"
+
+
+@dataclass(frozen=True)
+class Node:
+    """One collection build: the transform module that produces it and the sheets it reads."""
+    name: str
+    module: str  # etl_scripts.batch_etl.<module>, run through its main()
+    inputs: tuple  # (workbook, sheet_name) pairs, exactly as the module reads them
+    deps: tuple = field(default=())
+    incremental: bool = False  # main() accepts incremental=True (FIN_PERIOD watermark refresh)
+
+
+NODES = (
+    Node("sales", "transform_sales", (
+        ("Sales Header.xlsx", "Sales_Header"),
+        ("Sales Line.xlsx", "Sales_Line"),
+        ("Trans Types.xlsx", "Trans_Types"),
+        ("Representatives.xlsx", "Representatives"),
+        ("Products.xlsx", "Products"),
+        ("Products Styles.xlsx", "Products_Styles"),
+        ("Product Categories.xlsx", "Product_Categories"),
+        ("Product Brands.xlsx", "Product_Brands"),
+        ("Product Ranges.xlsx", "Product_Ranges"),
+    ), incremental=True),
+    Node("customer", "transform_customer", (
+        ("Customer.xlsx", "Customer"),
+        ("Customer Categories.xlsx", "Customer_Categories"),
+        ("Customer Regions.xlsx", "Customer_Regions"),
+        ("Customer Account Parameters.xlsx", "Customer_Account_Parameters"),
+        ("Representatives.xlsx", "Representatives"),
+    )),
+    Node("finance", "transform_finance", (
+        ("Payment Header.xlsx", "Payment_Header"),
+        ("Payment Lines.xlsx", "Payment_Lines"),
+        ("Age Analysis.xlsx", "Age_Analysis"),
+        ("Customer Account Parameters.xlsx", "Customer_Account_Parameters"),
+        ("Customer.xlsx", "Customer"),
+    ), incremental=True),
+    Node("supplier", "transform_supplier", (
+        ("Suppliers.xlsx", 0),
+        ("Purchases Headers.xlsx", 0),
+        ("Purchases Lines.xlsx", 0),
+    )),
+    Node("dim_time", "fin_calendar", (
+        ("Sales Header.xlsx", "Sales_Header"),
+        ("Age Analysis.xlsx", "Age_Analysis"),
+        ("Payment Lines.xlsx", "Payment_Lines"),
+    )),
+)
+
+
+def _warm_input(workbook, sheet_name):
+    start = time.perf_counter()
+    read_excel_cached(RAW_DATA_DIR / workbook, sheet_name=sheet_name)
+    return time.perf_counter() - start
+
+
+def _run_node(node, log_dir, incremental=False):
+    log_path = Path(log_dir) / f"{node.name}.log"
+    start = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log, redirect_stdout(log), redirect_stderr(log):
+        try:
+            module = importlib.import_module(f"etl_scripts.batch_etl.{node.module}")
+            if incremental and node.incremental:
+                module.main(incremental=True)
+            else:
+                module.main()
+            error = None
+        except BaseException:  # SystemExit included - a node must never take the pool down
+            traceback.print_exc()
+            error = traceback.format_exc(limit=1).strip().splitlines()[-1]
+    return {"wall_time": time.perf_counter() - start, "error": error, "log": str(log_path)}
+
+
+def _topological_check(nodes):
+    names = {node.name for node in nodes}
+    for node in nodes:
+        missing = [dep for dep in node.deps if dep not in names]
+        if missing:
+            raise ValueError(f"Node {node.name} depends on unselected node(s): {missing}")
+
+
+def run_pipeline(nodes=NODES, workers=None, log_dir=LOG_DIR, incremental=False):
+    """Warm the shared snapshot cache, run the DAG, and return a per-node report.
+
+    With incremental=True the nodes that support it export only changed FIN_PERIODs.
+    """
+    nodes = list(nodes)
+    _topological_check(nodes)
+    Path(log_dir).mkdir(parents=True, exist_ok=True)
+    workers = workers or min(len(nodes), multiprocessing.cpu_count()) or 1
+    report = {node.name: {"status": "pending", "wall_time": 0.0, "error": None} for node in nodes}
+    pipeline_start = time.perf_counter()
+
+    context = multiprocessing.get_context("spawn")
+
+    # 1. parse every distinct input once, largest workbooks first; nodes missing an input fail up front
+    inputs = {source for node in nodes for source in node.inputs}
+    missing_inputs = {source for source in inputs if not (RAW_DATA_DIR / source[0]).exists()}
+    failed_inputs = set(missing_inputs)
+    parse_times = {}
+    warm_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        ordered = sorted(inputs - missing_inputs, key=lambda source: -(RAW_DATA_DIR / source[0]).stat().st_size)
+        futures = {pool.submit(_warm_input, *source): source for source in ordered}
+        for future, source in futures.items():
+            try:
+                parse_times[source] = future.result()
+            except Exception:
+                failed_inputs.add(source)
+    warm_time = time.perf_counter() - warm_start
+
+    for node in nodes:
+        bad = [source[0] for source in node.inputs if source in failed_inputs]
+        if bad:
+            report[node.name].update(status="failed", error=f"Unreadable or missing input(s): {bad}")
+
+    # fresh interpreter per node: transforms configure logging and mutate their cached frames
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, max_tasks_per_child=1) as pool:
+        # 2. run nodes as soon as their dependencies have succeeded
+        running = {}
+        while True:
+            for node in nodes:
+                state = report[node.name]
+                if state["status"] != "pending":
+                    continue
+                dep_states = [report[dep]["status"] for dep in node.deps]
+                if any(status == "failed" for status in dep_states):
+                    state.update(status="failed", error=f"Dependency failed: {node.deps}")
+                elif all(status == "done" for status in dep_states):
+                    state["status"] = "running"
+                    running[pool.submit(_run_node, node, str(log_dir), incremental)] = node
+
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                result = future.result()
+                report[node.name].update(
+                    status="failed" if result["error"] else "done",
+                    wall_time=result["wall_time"],
+                    error=result["error"],
+                    log=result["log"],
+                )
+
+    return {
+        "warm_time": warm_time,
+        "parse_time": sum(parse_times.values()),
+        "total_time": time.perf_counter() - pipeline_start,
+        "nodes": report,
+    }
+
+
+def print_report(result):
+    print("\n" + "=" * 80)
+    print("BATCH ETL SUMMARY")
+    print("=" * 80)
+    print(f"Input parsing (shared snapshot cache): {result['warm_time']:.2f}s")
+    for name, state in result["nodes"].items():
+        mark = "✓" if state["status"] == "done" else "✗"
+        line = f"{mark} {name:<10} {state['status']:<8} {state['wall_time']:8.2f}s"
+        if state["error"]:
+            line += f"  {state['error']}"
+        print(line)
+    sequential = result["parse_time"] + sum(state["wall_time"] for state in result["nodes"].values())
+    print("-" * 80)
+    print(f"Total wall time: {result['total_time']:.2f}s (sequential would be ~{sequential:.2f}s)\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the ClearVue batch collection builds")
+    parser.add_argument("--only", nargs="+", choices=[node.name for node in NODES],
+                        help="build only these collections")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size")
+    parser.add_argument("--report", type=Path, default=None, help="also write the report as JSON")
+    parser.add_argument("--incremental", action="store_true",
+                        help="sales and finance export only new or restated FIN_PERIODs (<name>_delta)")
+    args = parser.parse_args(argv)
+
+    nodes = [node for node in NODES if not args.only or node.name in args.only]
+    result = run_pipeline(nodes, workers=args.workers, incremental=args.incremental)
+    print_report(result)
+    if args.report:
+        args.report.write_text(json.dumps(result, indent=2))
+    return 0 if all(state["status"] == "done" for state in result["nodes"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+=============================================================================
+PRODUCT DIMENSION
+ClearVue BI System - Product attributes on every sales line item
+=============================================================================
+
+Dashboards that filter sales by product category, brand or style had to
+fetch the product workbooks separately. build_product_dimension() joins the
+five product sheets once per run into a frame indexed by INVENTORY_CODE:
+
+  Products.xlsx            INVENTORY_CODE -> PRODCAT_CODE
+  Product Categories.xlsx  PRODCAT_CODE -> PRODCAT_DESC, BRAND_CODE, PRAN_CODE
+  Product Brands.xlsx      PRODBRA_CODE (= BRAND_CODE) -> PRODBRA_DESC
+  Product Ranges.xlsx      PRAN_CODE -> PRAN_DESC
+  Products Styles.xlsx     INVENTORY_CODE -> GENDER, MATERIAL, STYLE, COLOUR, BRANDING
+
+The small lookups are mapped onto the products column-wise; each repeated
+code keeps its last row, like the other lookups. product_attributes() then
+attaches the PRODUCT_FIELDS to a whole INVENTORY_CODE column with one
+hashed Index lookup, before the sales lines are nested by document. Unknown
+products and missing attributes are None.
+
+Usage:
+    product_dimension = build_product_dimension(products_df, styles_df, categories_df, brands_df, ranges_df)
+    attributes = product_attributes(sales_lines_df["INVENTORY_CODE"], product_dimension)
+"""
+
+import numpy as np
+import pandas as pd
+
+from etl_scripts.batch_etl.instrumentation import phase
+
+# frame name -> (file, sheet), merged into the sales SOURCES
+PRODUCT_SOURCES = {
+    "products": ("Products.xlsx", "Products"),
+    "product_styles": ("Products Styles.xlsx", "Products_Styles"),
+    "product_categories": ("Product Categories.xlsx", "Product_Categories"),
+    "product_brands": ("Product Brands.xlsx", "Product_Brands"),
+    "product_ranges": ("Product Ranges.xlsx", "Product_Ranges"),
+}
+# line item field -> dimension column
+PRODUCT_FIELDS = {
+    "prodcat_code": "PRODCAT_CODE",
+    "product_category": "PRODCAT_DESC",
+    "brand": "PRODBRA_DESC",
+    "product_range": "PRAN_DESC",
+    "gender": "GENDER",
+    "material": "MATERIAL",
+    "style": "STYLE",
+    "colour": "COLOUR",
+    "branding": "BRANDING",
+}
+STYLE_COLUMNS = ("GENDER", "MATERIAL", "STYLE", "COLOUR", "BRANDING")
+
+
+def _upper_columns(df):
+    return df.set_axis(df.columns.str.strip().str.upper(), axis=1)
+
+
+def _text(column):
+    # stripped text as plain objects, None where missing
+    column = column.astype(object)
+    return column.where(column.isna(), column.astype(str).str.strip()).where(column.notna(), None)
+
+
+def _code(column):
+    # integer codes as plain ints (Int64 keeps missing ones), else stripped text
+    column = column.astype(object)
+    numeric = pd.to_numeric(column, errors="coerce")
+    if numeric.notna().sum() == column.notna().sum() and (numeric.dropna() % 1 == 0).all():
+        return numeric.astype("Int64")
+    return _text(column)
+
+
+def _lookup(df, code_column, columns):
+    # code -> columns, a repeated code keeps its last row
+    df = _upper_columns(df)
+    lookup = pd.DataFrame(
+        {column: df[column] if column in df.columns else None for column in columns}, index=df.index
+    )
+    lookup.index = _code(df[code_column])
+    return lookup[~lookup.index.duplicated(keep="last")]
+
+
+def inventory_codes(codes):
+    """INVENTORY_CODE text as the dimension stores it; missing codes stay missing."""
+    codes = pd.Series(codes).astype(object)
+    return codes.where(codes.isna(), codes.astype(str).str.strip())
+
+
+@phase("build_product_dimension")
+def build_product_dimension(products_df, styles_df, categories_df, brands_df, ranges_df):
+    """Product attributes indexed by INVENTORY_CODE, one column per PRODUCT_FIELDS entry."""
+    print("Building product dimension..")
+    products = _upper_columns(products_df)
+    categories = _lookup(categories_df, "PRODCAT_CODE", ("PRODCAT_DESC", "BRAND_CODE", "PRAN_CODE"))
+    brands = _lookup(brands_df, "PRODBRA_CODE", ("PRODBRA_DESC",))
+    ranges = _lookup(ranges_df, "PRAN_CODE", ("PRAN_DESC",))
+    styles = _lookup(styles_df, "INVENTORY_CODE", STYLE_COLUMNS)
+    styles.index = inventory_codes(styles.index)
+
+    dimension = pd.DataFrame({
+        "INVENTORY_CODE": inventory_codes(products["INVENTORY_CODE"]),
+        "PRODCAT_CODE": _code(products["PRODCAT_CODE"]),
+    })
+    dimension = dimension[dimension["INVENTORY_CODE"].notna().to_numpy()]
+    dimension = dimension.drop_duplicates(subset="INVENTORY_CODE", keep="last").set_index("INVENTORY_CODE", drop=False)
+
+    # each lookup is one hashed map over the whole column
+    category = categories.reindex(dimension["PRODCAT_CODE"])
+    dimension["PRODCAT_DESC"] = _text(category["PRODCAT_DESC"]).to_numpy()
+    dimension["PRODBRA_DESC"] = _text(brands["PRODBRA_DESC"].reindex(_code(category["BRAND_CODE"]))).to_numpy()
+    dimension["PRAN_DESC"] = _text(ranges["PRAN_DESC"].reindex(_code(category["PRAN_CODE"]))).to_numpy()
+    style = styles.reindex(dimension.index)
+    for column in STYLE_COLUMNS:
+        dimension[column] = _text(style[column]).to_numpy()
+    dimension["PRODCAT_CODE"] = dimension["PRODCAT_CODE"].astype(object).where(dimension["PRODCAT_CODE"].notna(), None)
+
+    print(f"  ✓ {len(dimension)} products, {int(dimension['PRODCAT_DESC'].notna().sum())} with a category, "
+          f"{int(style['STYLE'].notna().sum())} with a style\n")
+    return dimension
+
+
+def product_attributes(codes, product_dimension):
+    """{line item field: column} of product attributes aligned with codes (None when unknown)."""
+    positions = product_dimension.index.get_indexer(inventory_codes(codes))
+    found = positions >= 0
+    safe = np.where(found, positions, 0)
+    attributes = {}
+    for field, column in PRODUCT_FIELDS.items():
+        values = product_dimension[column].to_numpy(dtype=object)
+        attributes[field] = (
+            np.where(found, values[safe], None) if len(values) else np.full(len(positions), None, dtype=object)
+        )
+    return attributes
@@ -0,0 +1,121 @@
+"""
+=============================================================================
+REPRESENTATIVE DIMENSION
+ClearVue BI System - Sales representatives embedded in CUSTOMER and SALES
+=============================================================================
+
+Rep-level dashboards had to $lookup Representatives.xlsx at query time, and
+merge_customer.ipynb merged COMM_METHOD, COMMISSION and REP_GROUP into the
+customers by hand. build_rep_dimension() cleans the sheet once per run into
+a frame indexed by REP_CODE:
+
+  rep_code, rep_desc, rep_group, comm_method, commission
+
+rep_group follows the groups of representatives_cleaned.ipynb (Sales Rep,
+Internal Sales, Channel: Consignment, ..., Unclassified), derived from
+REP_DESC with ordered patterns instead of its hand-kept map; every rep the
+notebook kept gets the group it has in representatives_clean.csv. The codes
+the notebook threw away ('do not use', bad debts, repairs, ...) stay in the
+dimension with their own groups (Unwanted, Problem Account, Other), so no
+document loses its rep.
+
+embed_representatives() joins a whole REP_CODE column onto the dimension
+with one hashed Index lookup and returns the embedded sub-documents
+({} for codes that are not in the sheet), like the region and category
+lookups of the customer build.
+
+Usage:
+    rep_dimension = build_rep_dimension(frames["representatives"])
+    representatives = embed_representatives(customers_df["REP_CODE"], rep_dimension)
+"""
+
+import numpy as np
+import pandas as pd
+
+from etl_scripts.batch_etl.instrumentation import phase
+
+# frame name -> (file, sheet), shared by the customer and sales SOURCES
+REP_SOURCE = ("Representatives.xlsx", "Representatives")
+REP_FIELDS = ("rep_code", "rep_desc", "rep_group", "comm_method", "commission")
+
+# (group, pattern on the upper-cased REP_DESC); the first matching pattern wins
+REP_GROUPS = (
+    ("Unwanted", r"DO NOT USE|FAULTY CODE"),
+    ("Problem Account", r"^PROBLEM|BAD DEBT|BAD CREDIT|^CLOSED$"),
+    # the notebook's own groups for the sale-goods accounts (01S01..01SMC) and for
+    # the two descriptions it could not reduce to initials or a channel (01DIS, CITC)
+    ("Unclassified", r"^SALE |SALE GOODS$"),
+    ("Unclassified_Missing_Data", r"^DISC\. FOR |^C- "),
+    ("Other", r"^SALES |^DISC|PROMOTION|REPAIR|SAMPLES|STOCK MOVEMENT|CREDIT CARD|^UNKNOWN$|^01 N$|^C[- ]"),
+    ("Internal Sales", r"^HEAD OFFICE|^HO\b"),
+    ("Channel: Catalogue", r"^CAT\b|^CATALOGUE|^CM$"),
+    ("Channel: Consignment", r"^CONSIGNMENT|^STANDS?\b|^HOUSE CONSIGNMENT|^LL\b"),
+    ("Channel: Wholesaler", r"WHOLESALER"),
+    ("Channel: Export", r"EXPORT"),
+    # a rep's initials, alone or ahead of their own accounts ("BJ CONSIGNMENTS", "07-GROUP-LA")
+    ("Sales Rep", r"^[A-Z]{1,2}\b|-GROUP-[A-Z]{1,2}$"),
+)
+UNCLASSIFIED = "Unclassified"
+
+
+def rep_codes(codes):
+    """REP_CODE text as the dimension stores it; missing codes stay missing."""
+    codes = pd.Series(codes).astype(object)
+    return codes.where(codes.isna(), codes.astype(str).str.strip())
+
+
+def rep_group(descriptions):
+    """REP_GROUP of each REP_DESC, one vectorised pattern match per group."""
+    text = pd.Series(descriptions).astype(object).fillna("").astype(str).str.strip().str.upper()
+    matches = [text.str.contains(pattern, regex=True).to_numpy() for _, pattern in REP_GROUPS]
+    return np.select(matches, [group for group, _ in REP_GROUPS], default=UNCLASSIFIED).astype(object)
+
+
+@phase("build_rep_dimension")
+def build_rep_dimension(representatives_df):
+    """Cleaned Representatives sheet indexed by REP_CODE, with the REP_FIELDS columns."""
+    print("Building representative dimension..")
+    reps = representatives_df.set_axis(representatives_df.columns.str.strip().str.upper(), axis=1)
+    codes = rep_codes(reps["REP_CODE"])
+    desc = (
+        reps["REP_DESC"].astype(object).fillna("Unknown").astype(str).str.strip().str.replace(r"\s+", " ", regex=True)
+        if "REP_DESC" in reps.columns else pd.Series("Unknown", index=reps.index, dtype=object)
+    )
+    comm_method = (
+        reps["COMM_METHOD"].astype(object).fillna("Unknown").astype(str).str.strip()
+        if "COMM_METHOD" in reps.columns else pd.Series("Unknown", index=reps.index, dtype=object)
+    )
+    commission = (
+        pd.to_numeric(reps["COMMISSION"], errors="coerce").astype("float64")
+        if "COMMISSION" in reps.columns else pd.Series(np.nan, index=reps.index)
+    )
+
+    dimension = pd.DataFrame({
+        "rep_code": codes,
+        "rep_desc": desc,
+        "rep_group": rep_group(desc),
+        "comm_method": comm_method,
+        "commission": commission.astype(object).where(commission.notna(), None),
+    })
+    # a repeated code keeps its last row, like the other lookups
+    dimension = dimension[codes.notna().to_numpy()]
+    dimension = dimension.drop_duplicates(subset="rep_code", keep="last").set_index("rep_code", drop=False)
+
+    groups = dimension["rep_group"].value_counts()
+    print(f"  ✓ {len(dimension)} representatives in {len(groups)} groups "
+          f"({', '.join(f'{group}: {count}' for group, count in groups.items())})\n")
+    return dimension
+
+
+def embed_representatives(codes, rep_dimension):
+    """{rep_code, rep_desc, rep_group, comm_method, commission} per REP_CODE, {} when unknown."""
+    positions = rep_dimension.index.get_indexer(rep_codes(codes))
+    found = (positions >= 0).tolist()
+    if not len(rep_dimension):
+        return [{} for _ in found]
+    safe = np.where(positions >= 0, positions, 0)
+    columns = [rep_dimension[field].to_numpy(dtype=object)[safe].tolist() for field in REP_FIELDS]
+    return [
+        dict(zip(REP_FIELDS, values)) if hit else {}
+        for hit, *values in zip(found, *columns)
+    ]
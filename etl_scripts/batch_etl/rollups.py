@@ -0,0 +1,134 @@
+"""
+=============================================================================
+BI ROLLUP COLLECTIONS
+ClearVue BI System - Pre-aggregated sales and finance measures for dashboards
+=============================================================================
+
+Power BI used to aggregate the full SALES and FINANCE collections at query
+time. The transforms now build small rollup collections while their frames
+are still in memory, with one groupby each:
+
+  sales_rollup    revenue, cost, profit and document count per
+                  fin_period x rep_code x customer_number
+                  (from the sales header frame with its document totals)
+  finance_rollup  total_due, amt_current and customer count per
+                  fin_period x region_code
+                  (age analysis rows with their customer's REGION_CODE)
+
+Every rollup row belongs to exactly one fin_period, so the rollups follow
+the transforms' incremental refresh: a delta run re-aggregates the periods
+it rebuilt and exports them as <rollup>_delta. Loading a delta with
+scope_field="fin_period" (see bulk_upsert.sync_collection) replaces those
+periods completely, including rows that disappeared from a period, and
+leaves every other period alone.
+
+Usage:
+    header_df, documents = transform_sales.transform(frames, state, keys)
+    load_rollup(build_sales_rollup(header_df, keys), output_dir, SALES_ROLLUP)
+"""
+
+import pandas as pd
+
+from etl_scripts.batch_etl.collection_writer import CollectionWriter, collection_path
+from etl_scripts.batch_etl.instrumentation import phase
+
+SALES_ROLLUP = "sales_rollup"
+FINANCE_ROLLUP = "finance_rollup"
+PERIOD_FIELD = "fin_period"
+
+
+def _json_column(column):
+    # plain Python values with None where missing
+    return column.astype(object).where(column.notna(), None)
+
+
+def _period_column(periods):
+    # '202401' like the fin_period of the base collections
+    return periods.astype("Int64").astype(str).astype(object).where(periods.notna(), None)
+
+
+def rollup_documents(rollup_df, dimensions, measures):
+    """Documents of an aggregated frame; dimensions and measures map a column to its field.
+
+    The _id joins the dimension values with '|', so reloading a rollup replaces
+    each row in place.
+    """
+    dimension_values = [_json_column(rollup_df[column]).tolist() for column in dimensions]
+    measure_values = [_json_column(rollup_df[column]).tolist() for column in measures]
+    fields = list(dimensions.values()) + list(measures.values())
+    for row in zip(*dimension_values, *measure_values):
+        doc = {"_id": "|".join("" if value is None else str(value) for value in row[:len(dimensions)])}
+        doc.update(zip(fields, row))
+        yield doc
+
+
+@phase("build_sales_rollup")
+def build_sales_rollup(sales_header_df, keys):
+    """sales_rollup documents from the header frame build_documents() returns."""
+    print("Building sales rollup (fin_period x rep_code x customer)..")
+    totals = (
+        pd.DataFrame({
+            "FIN_PERIOD": _period_column(sales_header_df["FIN_PERIOD"]),
+            "REP_CODE": _json_column(sales_header_df["REP_CODE"]),
+            "CUSTOMER_KEY": sales_header_df["CUSTOMER_KEY"],
+            "TOTAL_REVENUE": sales_header_df["TOTAL_REVENUE"].astype("float64"),
+            "TOTAL_COST": sales_header_df["TOTAL_COST"].astype("float64"),
+            "TOTAL_PROFIT": sales_header_df["TOTAL_PROFIT"].astype("float64"),
+        })
+        .groupby(["FIN_PERIOD", "REP_CODE", "CUSTOMER_KEY"], dropna=False, sort=True)
+        .agg(TOTAL_REVENUE=("TOTAL_REVENUE", "sum"), TOTAL_COST=("TOTAL_COST", "sum"),
+             TOTAL_PROFIT=("TOTAL_PROFIT", "sum"), DOCUMENTS=("TOTAL_REVENUE", "size"))
+        .reset_index()
+    )
+    totals["CUSTOMER_NUMBER"] = keys.decode(totals["CUSTOMER_KEY"])
+    print(f"  ✓ {len(sales_header_df)} sales documents -> {len(totals)} rollup rows\n")
+    return rollup_documents(
+        totals,
+        {"FIN_PERIOD": PERIOD_FIELD, "REP_CODE": "rep_code", "CUSTOMER_NUMBER": "customer_number"},
+        {"TOTAL_REVENUE": "total_revenue", "TOTAL_COST": "total_cost", "TOTAL_PROFIT": "total_profit",
+         "DOCUMENTS": "documents"},
+    )
+
+
+def customer_regions(customers_df, keys):
+    """REGION_CODE per CUSTOMER_KEY from the Customer sheet (first row of a repeated customer)."""
+    regions = pd.DataFrame({
+        "CUSTOMER_KEY": keys.encode(customers_df["CUSTOMER_NUMBER"]),
+        "REGION_CODE": customers_df["REGION_CODE"].astype(object).str.strip(),
+    })
+    return regions.drop_duplicates("CUSTOMER_KEY").set_index("CUSTOMER_KEY")["REGION_CODE"]
+
+
+@phase("build_finance_rollup")
+def build_finance_rollup(finance_data):
+    """finance_rollup documents from the merged finance frame (which carries REGION_CODE)."""
+    print("Building finance rollup (fin_period x region)..")
+    totals = (
+        pd.DataFrame({
+            "FIN_PERIOD": _period_column(finance_data["FIN_PERIOD"]),
+            "REGION_CODE": _json_column(finance_data["REGION_CODE"]),
+            "CUSTOMER_KEY": finance_data["CUSTOMER_KEY"],
+            "TOTAL_DUE": finance_data["TOTAL_DUE"].astype("float64").fillna(0.0),
+            "AMT_CURRENT": finance_data["AMT_CURRENT"].astype("float64").fillna(0.0),
+        })
+        .groupby(["FIN_PERIOD", "REGION_CODE"], dropna=False, sort=True)
+        .agg(TOTAL_DUE=("TOTAL_DUE", "sum"), AMT_CURRENT=("AMT_CURRENT", "sum"),
+             CUSTOMERS=("CUSTOMER_KEY", "nunique"))
+        .reset_index()
+    )
+    print(f"  ✓ {len(finance_data)} finance documents -> {len(totals)} rollup rows\n")
+    return rollup_documents(
+        totals,
+        {"FIN_PERIOD": PERIOD_FIELD, "REGION_CODE": "region_code"},
+        {"TOTAL_DUE": "total_due", "AMT_CURRENT": "amt_current", "CUSTOMERS": "customers"},
+    )
+
+
+@phase("load_rollup")
+def load_rollup(documents, output_dir, name):
+    """Stream rollup documents to <name>.ndjson; returns the writer."""
+    output_file = collection_path(output_dir, name)
+    with CollectionWriter(output_file) as writer:
+        writer.write_all(documents)
+    print(f"✓ Exported {writer.documents} {name} documents to {output_file}\n")
+    return writer
@@ -0,0 +1,418 @@
+"""
+=============================================================================
+STAGED PIPELINE WITH AN ARTIFACT CACHE
+ClearVue BI System - Rerun a stage only when its inputs or its code change
+=============================================================================
+
+A pipeline is a list of Stage objects: a function that returns a
+DataFrame from its upstream stages' frames and the workbook sheets it reads.
+run_stages() executes them in dependency order against a content-addressed
+cache:
+
+  - a stage's key is a SHA-256 over its code, the bytes of its source
+    workbooks and the content digests of its upstream artifacts. The code
+    part covers the stage function, the functions and classes it uses from
+    its own module and the other etl_scripts modules, and the constants
+    (lookup maps, patterns) they refer to, so editing a map or a shared
+    helper reruns the stages that use it and nothing else;
+  - every result is stored once, columnar, under its key in
+    <cache_dir>/<stage>/<key>.parquet (pickle when Parquet cannot hold the
+    frame exactly), with a small JSON manifest holding its content digest;
+  - a stage whose key is in the cache is not run and its frame is only read
+    when a stage downstream of it has to run. An upstream stage that reruns
+    but produces the same rows keeps its digest, so its dependants stay
+    cached;
+  - stages with an export name are also written as NDJSON to the export
+    directory, only when the exported content changed.
+
+targets= limits a run to some stages and the stages they depend on.
+
+Usage:
+    stages = [
+        Stage("customers", clean_customers, sources=(("customer_df", "Customer.xlsx", "Customer"),)),
+        Stage("customer_merged", merge_customer, deps=("customers", ...), export="customer_merged.json"),
+    ]
+    runs = run_stages(stages, data_dir, cache_dir, export_dir, targets=["customer_merged"])
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import sys
+import time
+import types
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from etl_scripts.batch_etl.ingest import read_excel_cached
+
+CACHE_DIR_NAME = ".stage_cache"
+EXPORTS_MANIFEST = "exports.json"
+CACHE_FORMAT = 1  # bump to invalidate every artifact (e.g. a new storage layout)
+
+
+@dataclass(frozen=True)
+class Stage:
+    """One pipeline step: func(**upstream frames, **source frames) -> DataFrame.
+
+    deps names upstream stages, passed to func under their names. sources are
+    (argument, workbook, sheet_name) triples read from the data directory.
+    export is the file name the result is written to as NDJSON, if any.
+    """
+    name: str
+    func: object
+    deps: tuple = ()
+    sources: tuple = ()
+    export: str = None
+
+
+@dataclass
+class StageRun:
+    """What run_stages() did for one stage."""
+    name: str
+    key: str
+    status: str  # "cached" or "ran"
+    rows: int
+    digest: str
+    wall_time: float = 0.0
+    exported: str = None
+
+
+# ============================================================================
+# DIGESTS
+# ============================================================================
+
+def _stable_repr(value):
+    # repr that does not depend on hash randomisation (set ordering)
+    if isinstance(value, (set, frozenset)):
+        return "{" + ", ".join(sorted(_stable_repr(item) for item in value)) + "}"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{_stable_repr(k)}: {_stable_repr(v)}" for k, v in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__ + "(" + ", ".join(_stable_repr(item) for item in value) + ")"
+    return repr(value)
+
+
+def _global_names(code):
+    # names a code object (and its comprehensions / lambdas / inner functions) looks up globally
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+    return names
+
+
+_CONSTANT_TYPES = (str, bytes, int, float, bool, tuple, list, dict, set, frozenset, type(None))
+
+
+PROJECT_PACKAGE = "etl_scripts"
+
+
+def _is_project_module(module_name, root_module):
+    return module_name == root_module or module_name.split(".")[0] == PROJECT_PACKAGE
+
+
+def _code_objects(obj):
+    # the code a function or class runs: the function itself, or every method of the class
+    if inspect.isfunction(obj):
+        return [obj.__code__]
+    codes = []
+    for member in vars(obj).values():
+        if isinstance(member, (staticmethod, classmethod)):
+            member = member.__func__
+        elif isinstance(member, property):
+            codes += [f.__code__ for f in (member.fget, member.fset, member.fdel) if f is not None]
+            continue
+        member = inspect.unwrap(member) if callable(member) else member
+        if inspect.isfunction(member):
+            codes.append(member.__code__)
+    return codes
+
+
+def code_digest(func):
+    """Digest of func's source plus the project code and constants it refers to.
+
+    Functions and classes are followed when they come from func's own module
+    or from another etl_scripts module (by name, or as module.attribute), so
+    editing e.g. FinancialCalendar reruns the stages that build on it. Module
+    constants are hashed by value; third-party code is not followed.
+    """
+    root = inspect.unwrap(func)
+    root_module = root.__module__
+    parts, seen = [], set()
+
+    def follow(value, name, namespace):
+        if callable(value) and hasattr(value, "__wrapped__"):
+            value = inspect.unwrap(value)  # @phase, functools.lru_cache
+        if inspect.isfunction(value) or inspect.isclass(value):
+            if _is_project_module(getattr(value, "__module__", ""), root_module):
+                visit(value)
+        elif isinstance(value, _CONSTANT_TYPES) and name in namespace:
+            parts.append(f"{name} = {_stable_repr(value)}")
+
+    def visit(obj):
+        if obj in seen:
+            return
+        seen.add(obj)
+        parts.append(inspect.getsource(obj))
+        namespace = vars(sys.modules[obj.__module__])
+        names = set().union(*map(_global_names, _code_objects(obj)))
+        for name in sorted(names):
+            value = namespace.get(name)
+            if inspect.ismodule(value):
+                if _is_project_module(value.__name__, root_module):
+                    # module.attribute: the attribute's name is among the code's names too
+                    module_namespace = vars(value)
+                    for attribute in sorted(names & module_namespace.keys()):
+                        follow(module_namespace[attribute], attribute, module_namespace)
+            else:
+                follow(value, name, namespace)
+
+    visit(root)
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+_source_digests = {}
+
+
+def source_digest(path):
+    """SHA-256 of a source file, remembered while its size and mtime are unchanged."""
+    path = Path(path)
+    stat = path.stat()
+    memo_key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _source_digests:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        _source_digests[memo_key] = digest.hexdigest()
+    return _source_digests[memo_key]
+
+
+def frame_digest(df):
+    """Digest of a frame's columns, dtypes and rows in order."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(name), str(dtype)] for name, dtype in df.dtypes.items()]).encode())
+    digest.update(np.ascontiguousarray(pd.util.hash_pandas_object(df, index=True).to_numpy()).tobytes())
+    return digest.hexdigest()
+
+
+def stage_key(stage, code, sources, upstream):
+    """Cache key of a stage from its code digest and its inputs' digests."""
+    payload = {
+        "format": CACHE_FORMAT,
+        "pandas": pd.__version__,
+        "stage": stage.name,
+        "code": code,
+        "sources": sources,
+        "upstream": upstream,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+# ============================================================================
+# ARTIFACT CACHE
+# ============================================================================
+
+def _atomic_write(target, write):
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, target)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def _restore_missing(df):
+    # Parquet hands back None for missing cells in object columns
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+class StageCache:
+    """Stage results stored under <cache_dir>/<stage>/<key>.(parquet|pkl) with a <key>.json manifest."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+
+    def _stem(self, stage_name, key):
+        return self.cache_dir / stage_name / key
+
+    def manifest(self, stage_name, key):
+        """The manifest of a cached artifact, or None when it is missing or incomplete."""
+        manifest_path = self._stem(stage_name, key).with_suffix(".json")
+        if not manifest_path.exists():
+            return None
+        try:
+            manifest = json.loads(manifest_path.read_text())
+        except ValueError:
+            return None
+        if not (manifest_path.parent / manifest["artifact"]).exists():
+            return None
+        return manifest
+
+    def load(self, stage_name, key):
+        manifest = self.manifest(stage_name, key)
+        if manifest is None:
+            raise KeyError(f"{stage_name}/{key} is not cached")
+        path = self._stem(stage_name, key).parent / manifest["artifact"]
+        if path.suffix == ".parquet":
+            return _restore_missing(pd.read_parquet(path))
+        return pd.read_pickle(path)
+
+    def store(self, stage_name, key, df):
+        """Store df as the artifact of (stage_name, key); returns its manifest."""
+        stem = self._stem(stage_name, key)
+        stem.parent.mkdir(parents=True, exist_ok=True)
+        artifact = stem.with_suffix(".parquet")
+        try:
+            _atomic_write(artifact, lambda p: df.to_parquet(p, index=True))
+            if not _restore_missing(pd.read_parquet(artifact)).equals(df):
+                raise ValueError("Parquet does not round-trip this frame")
+        except Exception:
+            # no parquet engine, or dtypes Parquet cannot hold exactly
+            if artifact.exists():
+                artifact.unlink()
+            artifact = stem.with_suffix(".pkl")
+            _atomic_write(artifact, lambda p: df.to_pickle(p))
+
+        manifest = {
+            "stage": stage_name,
+            "key": key,
+            "artifact": artifact.name,
+            "digest": frame_digest(df),
+            "rows": len(df),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        _atomic_write(stem.with_suffix(".json"), lambda p: p.write_text(json.dumps(manifest, indent=2)))
+        return manifest
+
+    def prune(self, keep):
+        """Remove every artifact of the stages in keep ({stage: key}) except the kept key."""
+        removed = 0
+        for stage_name, key in keep.items():
+            stage_dir = self.cache_dir / stage_name
+            if not stage_dir.is_dir():
+                continue
+            for path in stage_dir.iterdir():
+                if path.name.split(".")[0] != key:
+                    path.unlink()
+                    removed += 1
+        return removed
+
+
+# ============================================================================
+# RUNNER
+# ============================================================================
+
+def execution_order(stages, targets=None):
+    """The stages needed for targets (default: all), upstream first; rejects unknown deps and cycles."""
+    by_name = {stage.name: stage for stage in stages}
+    if len(by_name) != len(stages):
+        raise ValueError("Stage names must be unique")
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on unknown stage(s): {missing}")
+    unknown = [name for name in targets or () if name not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown target stage(s): {unknown}")
+
+    order, state = [], {}
+
+    def visit(name, path):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Stage cycle: {' -> '.join(path + [name])}")
+        state[name] = "visiting"
+        for dep in by_name[name].deps:
+            visit(dep, path + [name])
+        state[name] = "done"
+        order.append(by_name[name])
+
+    for name in targets or [stage.name for stage in stages]:
+        visit(name, [])
+    return order
+
+
+def export_frame(df, path):
+    """Write a stage result as NDJSON records, as the notebooks' to_json(lines=True) did."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _atomic_write(path, lambda p: df.to_json(p, orient="records", lines=True))
+    return path
+
+
+def run_stages(stages, data_dir, cache_dir, export_dir=None, targets=None, force=()):
+    """Run the stages needed for targets, reusing cached results; returns a StageRun per stage.
+
+    force names stages to rerun even when their key is cached.
+    """
+    cache = StageCache(cache_dir)
+    exports_path = Path(cache_dir) / EXPORTS_MANIFEST
+    exports = json.loads(exports_path.read_text()) if exports_path.exists() else {}
+    frames, manifests, runs = {}, {}, []
+
+    def frame(name):
+        # an upstream result: in memory when it ran in this run, otherwise read from the cache once
+        if name not in frames:
+            frames[name] = cache.load(name, manifests[name]["key"])
+        return frames[name]
+
+    for stage in execution_order(stages, targets):
+        sources = {
+            argument: source_digest(Path(data_dir) / workbook) + f"::{sheet_name}"
+            for argument, workbook, sheet_name in stage.sources
+        }
+        upstream = {dep: manifests[dep]["digest"] for dep in stage.deps}
+        key = stage_key(stage, code_digest(stage.func), sources, upstream)
+
+        manifest = None if stage.name in force else cache.manifest(stage.name, key)
+        start = time.perf_counter()
+        if manifest is None:
+            inputs = {dep: frame(dep) for dep in stage.deps}
+            for argument, workbook, sheet_name in stage.sources:
+                inputs[argument] = read_excel_cached(Path(data_dir) / workbook, sheet_name=sheet_name)
+            result = stage.func(**inputs)
+            if not isinstance(result, pd.DataFrame):
+                raise TypeError(f"Stage {stage.name} returned {type(result).__name__}, not a DataFrame")
+            manifest = cache.store(stage.name, key, result)
+            frames[stage.name] = result
+            status = "ran"
+        else:
+            status = "cached"
+        manifests[stage.name] = manifest
+        run = StageRun(stage.name, key, status, manifest["rows"], manifest["digest"],
+                       time.perf_counter() - start)
+
+        if stage.export and export_dir is not None:
+            target = Path(export_dir) / stage.export
+            if exports.get(stage.export) != manifest["digest"] or not target.exists():
+                export_frame(frame(stage.name), target)
+                exports[stage.export] = manifest["digest"]
+                run.exported = str(target)
+        runs.append(run)
+
+    if export_dir is not None:
+        exports_path.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write(exports_path, lambda p: p.write_text(json.dumps(exports, indent=2, sort_keys=True)))
+    cache.prune({run.name: run.key for run in runs})
+    return runs
+
+
+def print_runs(runs):
+    for run in runs:
+        mark = "✓" if run.status == "cached" else "▶"
+        line = f"  {mark} {run.name:<24} {run.status:<7} {run.rows:>8,} rows  {run.wall_time:7.3f}s"
+        if run.exported:
+            line += f"  -> {Path(run.exported).name}"
+        print(line)
+    ran = sum(run.status == "ran" for run in runs)
+    print(f"\n  {ran} of {len(runs)} stages ran, {len(runs) - ran} reused from the cache")
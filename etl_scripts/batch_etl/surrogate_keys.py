@@ -0,0 +1,152 @@
+"""
+=============================================================================
+SURROGATE KEY DICTIONARY
+ClearVue BI System - Dense integer keys for customer codes
+=============================================================================
+
+CUSTOMER_NUMBER arrives as a string in six workbooks. Each transform used to
+normalise it row by row and then join, group and intersect on object-dtype
+strings. KeyDictionary maps each normalised code to a dense int32 surrogate
+key instead:
+
+  - only the distinct raw values of a column are normalised (factorize
+    first), and the row keys are gathered back with one integer take;
+  - keys are handed out in first-seen order and persisted as JSON next to
+    the incremental state, so a customer keeps its key across runs and
+    across transforms. The dictionary only ever grows; new codes are added
+    under a lock file after re-reading it, so the orchestrator's parallel
+    nodes never give the same key to two codes;
+  - merges, groupbys and FK checks run on the int32 CUSTOMER_KEY column, and
+    codes are decoded back to strings only when documents are built.
+
+Usage:
+    keys = KeyDictionary.load(state_dir, CUSTOMER_KEYS)
+    df["CUSTOMER_KEY"] = keys.encode(df["CUSTOMER_NUMBER"])
+    customer_numbers = keys.decode(df["CUSTOMER_KEY"])
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+MISSING_KEY = -1
+CUSTOMER_KEYS = "customer_keys"  # dictionary shared by the customer, sales and finance transforms
+LOCK_TIMEOUT = 30.0
+
+
+def normalize_customer_number(values):
+    """Canonical customer codes: stripped, stray quotes removed, upper case; None when empty."""
+    codes = (
+        pd.Series(values, dtype=object)
+        .astype(str)
+        .str.strip()
+        .str.replace("'", "", regex=False)
+        .str.upper()
+    )
+    return codes.where(codes != "", None)
+
+
+class KeyDictionary:
+    """Persistent mapping of normalised codes to dense int32 surrogate keys.
+
+    Without a path the dictionary lives in memory only (tests, benchmarks).
+    """
+
+    def __init__(self, path=None, normalize=normalize_customer_number):
+        self.path = Path(path) if path is not None else None
+        self.normalize = normalize
+        self._codes = []  # key -> code
+        self._index = {}  # code -> key
+        self._table = None
+        if self.path is not None:
+            self._read()
+
+    @classmethod
+    def load(cls, state_dir, name):
+        return cls(Path(state_dir) / f"{name}.json")
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __contains__(self, code):
+        return code in self._index
+
+    def _read(self):
+        if not self.path.exists():
+            return
+        try:
+            codes = json.loads(self.path.read_text())["codes"]
+        except (ValueError, KeyError):
+            return  # unreadable dictionary: start a new one
+        # the file only ever grows, so it extends what this process already holds
+        for code in codes[len(self._codes):]:
+            self._index[code] = len(self._codes)
+            self._codes.append(code)
+        self._table = None
+
+    @contextmanager
+    def _locked(self):
+        if self.path is None:
+            yield
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.path.with_name(f"{self.path.name}.lock")
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Key dictionary is locked; remove {lock_path} if no ETL run is active")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+
+    def _add(self, codes):
+        with self._locked():
+            if self.path is not None:
+                self._read()
+            for code in codes:
+                if code not in self._index:
+                    self._index[code] = len(self._codes)
+                    self._codes.append(code)
+            if len(self._codes) > np.iinfo(np.int32).max:
+                raise OverflowError("Key dictionary exceeds the int32 key range")
+            self._table = None
+            if self.path is not None:
+                tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+                tmp.write_text(json.dumps({"codes": self._codes}))
+                os.replace(tmp, self.path)
+
+    def encode(self, values):
+        """int32 key of every value (MISSING_KEY where missing); unseen codes get new keys."""
+        row_codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+        codes = self.normalize(uniques).tolist() if len(uniques) else []
+        new = [code for code in dict.fromkeys(codes) if code is not None and code not in self._index]
+        if new:
+            self._add(new)
+
+        unique_keys = np.array(
+            [MISSING_KEY if code is None else self._index[code] for code in codes], dtype=np.int32
+        )
+        keys = np.full(len(row_codes), MISSING_KEY, dtype=np.int32)
+        present = row_codes >= 0
+        keys[present] = unique_keys[row_codes[present]]
+        return keys
+
+    def decode(self, keys):
+        """The code of every key as an object array, None for MISSING_KEY."""
+        if self._table is None:
+            self._table = np.array(self._codes + [None], dtype=object)
+        keys = np.asarray(keys)
+        # MISSING_KEY (-1) indexes the trailing None
+        return self._table[keys]
@@ -18,329 +18,413 @@ Conceptual Design Target:
     "region_desc": "Pretoria Central"
   },
   "rep_code": "010",
+  "representative": {
+    "rep_code": "010",
+    "rep_desc": "BA ALLISON",
+    "rep_group": "Sales Rep",
+    "comm_method": "Sales",
+    "commission": 0.5
+  },
   "credit_limit": 3000.0,
   "settle_terms": 0,
   "normal_payterms": 120,
   "discount": 0.0,
-  "status": "active"
+  "status": "active",
+  "account_parameters": ["Closed"]
 }
 """
 
 import pandas as pd
 import json
+import sys
 from pathlib import Path
 
+if __package__ in (None, ""):
+    # allow running this file directly: python etl_scripts/batch_etl/transform_customer.py
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from etl_scripts.batch_etl.collection_writer import collection_path, write_collection
+from etl_scripts.batch_etl.columnar import group_offsets
+from etl_scripts.batch_etl.foreign_keys import ForeignKey, RejectLog, check_foreign_keys, print_report
+from etl_scripts.batch_etl.incremental import STATE_DIR_NAME
+from etl_scripts.batch_etl.ingest import RawFrames
+from etl_scripts.batch_etl.instrumentation import RunMetrics, phase
+from etl_scripts.batch_etl.representatives import REP_SOURCE, build_rep_dimension, embed_representatives
+from etl_scripts.batch_etl.surrogate_keys import CUSTOMER_KEYS, KeyDictionary
+
 # ============================================================================
 # 0. SETUP & CONFIGURATION
 # ============================================================================
 
-print("\n" + "="*80)
-print("CUSTOMER COLLECTION ETL - INITIALIZATION")
-print("="*80 + "\n")
-
 # Get script directory and raw_data path
-script_dir = Path(__file__).parent
-raw_data_dir = script_dir.parent.parent / "raw_data"
+SCRIPT_DIR = Path(__file__).parent
+RAW_DATA_DIR = SCRIPT_DIR.parent.parent / "raw_data"
+OUTPUT_DIR = RAW_DATA_DIR.parent
+
+# Source workbooks: frame name -> (file, sheet)
+SOURCES = {
+    # Customer.xlsx (contains CUSTOMER_NUMBER, CUSTOMER_NAME, CCAT_CODE, REGION_CODE, CREDIT_LIMIT, etc.)
+    "customers": ("Customer.xlsx", "Customer"),
+    # Customer_Categories.xlsx (lookup table: CCAT_CODE -> CCAT_DESC)
+    "customer_categories": ("Customer Categories.xlsx", "Customer_Categories"),
+    # Customer_Regions.xlsx (lookup table: REGION_CODE -> REGION_DESC)
+    "customer_regions": ("Customer Regions.xlsx", "Customer_Regions"),
+    # Customer_Account_Parameters.xlsx (lookup table for customer account types)
+    # NOTE: This might be embedded in the main customer record or kept separate
+    "account_params": ("Customer Account Parameters.xlsx", "Customer_Account_Parameters"),
+    # Representatives.xlsx (lookup: REP_CODE -> REP_DESC, COMM_METHOD, COMMISSION)
+    "representatives": REP_SOURCE,
+}
 
-print(f"Script location: {script_dir}")
-print(f"Raw data location: {raw_data_dir}\n")
 
 # ============================================================================
 # 1. LOAD SOURCE FILES
 # ============================================================================
 
-print("PHASE 1: LOADING SOURCE FILES")
-print("-" * 80)
-
-try:
-    # File: Customer.xlsx (contains CUSTOMER_NUMBER, CUSTOMER_NAME, CCAT_CODE, REGION_CODE, CREDIT_LIMIT, etc.)
-    customers_df = pd.read_excel(raw_data_dir / "Customer.xlsx", sheet_name="Customer")
-    print(f"✓ Loaded Customer.xlsx: {len(customers_df)} records")
-    
-    # File: Customer_Categories.xlsx (lookup table: CCAT_CODE -> CCAT_DESC)
-    customer_categories_df = pd.read_excel(
-        raw_data_dir / "Customer Categories.xlsx", 
-        sheet_name="Customer_Categories"
-    )
-    print(f"✓ Loaded Customer Categories.xlsx: {len(customer_categories_df)} records")
-    
-    # File: Customer_Regions.xlsx (lookup table: REGION_CODE -> REGION_DESC)
-    customer_regions_df = pd.read_excel(
-        raw_data_dir / "Customer Regions.xlsx",
-        sheet_name="Customer_Regions"
-    )
-    print(f"✓ Loaded Customer Regions.xlsx: {len(customer_regions_df)} records")
-    
-    
-    # File: Customer_Account_Parameters.xlsx (lookup table for customer account types)
-    # NOTE: This might be embedded in the main customer record or kept separate
-    account_params_df = pd.read_excel(
-        raw_data_dir / "Customer Account Parameters.xlsx",
-        sheet_name="Customer_Account_Parameters"
-    )
-    print(f"✓ Loaded Customer Account Parameters.xlsx: {len(account_params_df)} records")
-    
-    # TODO: Optional - if you have a separate file for representative details
-    # File: Representatives.xlsx (lookup: REP_CODE -> REP_DESC, COMMISSION, etc.)
-    # representatives_df = pd.read_excel(
-    #     raw_data_dir / "Representatives.xlsx",
-    #     sheet_name="Representatives"
-    # )
-    # print(f"✓ Loaded Representatives.xlsx: {len(representatives_df)} records")
-    
-    print("\n\n")
-    
-except FileNotFoundError as e:
-    print(f"✗ FILE NOT FOUND: {e}")
-    print("Make sure all required Excel files are in the raw_data directory")
-    raise
+def extract(raw_data_dir=RAW_DATA_DIR):
+    """Raw frames for the customer build; each workbook is read when a stage first uses it."""
+    print("PHASE 1: LOADING SOURCE FILES")
+    print("-" * 80)
+    print(f"Raw data location: {raw_data_dir} (files load on first use)\n")
+    return RawFrames(raw_data_dir, SOURCES)
 
 
 # ============================================================================
 # 2. STANDARDIZE & CLEAN DATA
 # ============================================================================
 
-print("PHASE 2: DATA STANDARDIZATION & CLEANING")
-print("-" * 80)
-
-# TODO: Standardize column names across all dataframes
-# Convert all column names to uppercase and strip whitespace
-for df_name, df in [
-    ("customers_df", customers_df),
-    ("customer_categories_df", customer_categories_df),
-    ("customer_regions_df", customer_regions_df),
-    ("account_params_df", account_params_df)
-]:
-    df.columns = df.columns.str.strip().str.upper()
-    print(f"✓ Standardized columns in {df_name}")
-
-print()
-
-for df_diagnostic, df in [
-    ("Customer Data Columns", customers_df.columns.tolist()),
-    ("Customer Categories Columns", customer_categories_df.columns.tolist()),
-    ("Customer Regions Columns", customer_regions_df.columns.tolist()),
-    ("Account Parameters Columns", account_params_df.columns.tolist())
-
-]:
-    print(f"{df_diagnostic}: {df}")
-#print(customers_df.columns.tolist())
-print()
-
-# TODO: Data type conversions and validations
-# CUSTOMER_NUMBER: Should be string (customer IDs are alphanumeric)
-customers_df["CUSTOMER_NUMBER"] = customers_df["CUSTOMER_NUMBER"].astype(str).str.strip()
-print(f"✓ Standardized CUSTOMER_NUMBER format")
-
-
-# TODO: Numeric field conversions
-# CREDIT_LIMIT, DISCOUNT, SETTLE_TERMS should be numeric
-numeric_cols = ["CREDIT_LIMIT", "DISCOUNT", "SETTLE_TERMS", "NORMAL_PAYTERMS"]
-for col in numeric_cols:
-    if col in customers_df.columns:
-        customers_df[col] = pd.to_numeric(customers_df[col], errors="coerce")
-        print(f"✓ Converted {col} to numeric")
-
-print()
-
-# TODO: Remove duplicates
-initial_count = len(customers_df)
-customers_df = customers_df.drop_duplicates(subset=["CUSTOMER_NUMBER"])
-print(f"✓ Removed duplicates: {initial_count} -> {len(customers_df)} records\n")
+@phase("standardize")
+def standardize(frames, keys):
+    print("PHASE 2: DATA STANDARDIZATION & CLEANING")
+    print("-" * 80)
+
+    customers_df = frames["customers"]
+    customer_categories_df = frames["customer_categories"]
+    customer_regions_df = frames["customer_regions"]
+    account_params_df = frames["account_params"]
+
+    # TODO: Standardize column names across all dataframes
+    # Convert all column names to uppercase and strip whitespace
+    for df_name, df in [
+        ("customers_df", customers_df),
+        ("customer_categories_df", customer_categories_df),
+        ("customer_regions_df", customer_regions_df),
+        ("account_params_df", account_params_df)
+    ]:
+        df.columns = df.columns.str.strip().str.upper()
+        print(f"✓ Standardized columns in {df_name}")
+
+    print()
+
+    for df_diagnostic, df in [
+        ("Customer Data Columns", customers_df.columns.tolist()),
+        ("Customer Categories Columns", customer_categories_df.columns.tolist()),
+        ("Customer Regions Columns", customer_regions_df.columns.tolist()),
+        ("Account Parameters Columns", account_params_df.columns.tolist())
+
+    ]:
+        print(f"{df_diagnostic}: {df}")
+    print()
+
+    # TODO: Data type conversions and validations
+    # CUSTOMER_NUMBER: alphanumeric codes, normalised once per distinct code and
+    # replaced by the int32 surrogate key shared with the sales and finance builds
+    customers_df["CUSTOMER_KEY"] = keys.encode(customers_df["CUSTOMER_NUMBER"])
+    customers_df = customers_df.drop(columns="CUSTOMER_NUMBER")
+    print(f"✓ Standardized CUSTOMER_NUMBER format ({len(keys)} keys in dictionary)")
+
+    # TODO: Numeric field conversions
+    # CREDIT_LIMIT, DISCOUNT, SETTLE_TERMS should be numeric
+    numeric_cols = ["CREDIT_LIMIT", "DISCOUNT", "SETTLE_TERMS", "NORMAL_PAYTERMS"]
+    for col in numeric_cols:
+        if col in customers_df.columns:
+            customers_df[col] = pd.to_numeric(customers_df[col], errors="coerce")
+            print(f"✓ Converted {col} to numeric")
+
+    print()
+
+    # TODO: Remove duplicates
+    initial_count = len(customers_df)
+    customers_df = customers_df.drop_duplicates(subset=["CUSTOMER_KEY"])
+    print(f"✓ Removed duplicates: {initial_count} -> {len(customers_df)} records\n")
+
+    return customers_df, customer_categories_df, customer_regions_df, account_params_df
 
 
 # ============================================================================
 # 3. VALIDATE FOREIGN KEYS
 # ============================================================================
 
-print("PHASE 3: FOREIGN KEY VALIDATION")
-print("-" * 80)
-
-# TODO: Check if all CCAT_CODE values exist in lookup table
-valid_ccat_codes = set(customer_categories_df["CCAT_CODE"].unique())
-customers_with_invalid_ccat = customers_df[~customers_df["CCAT_CODE"].isin(valid_ccat_codes)]
-if len(customers_with_invalid_ccat) > 0:
-    print(f"⚠ WARNING: {len(customers_with_invalid_ccat)} customers have invalid CCAT_CODE")
-    # TODO: Handle invalid codes (drop, default, or log)
-    print("  Action: Removing records with invalid CCAT_CODE")
-    customers_df = customers_df[customers_df["CCAT_CODE"].isin(valid_ccat_codes)]
-else:
-    print(f"✓ All CCAT_CODE values are valid")
-
-# TODO: Check if all REGION_CODE values exist in lookup table
-valid_region_codes = set(customer_regions_df["REGION_CODE"].unique())
-customers_with_invalid_region = customers_df[~customers_df["REGION_CODE"].isin(valid_region_codes)]
-if len(customers_with_invalid_region) > 0:
-    print(f"⚠ WARNING: {len(customers_with_invalid_region)} customers have invalid REGION_CODE")
-    # TODO: Handle invalid codes
-    print("  Action: Removing records with invalid REGION_CODE")
-    customers_df = customers_df[customers_df["REGION_CODE"].isin(valid_region_codes)]
-else:
-    print(f"✓ All REGION_CODE values are valid")
-
-print()
+@phase("validate_foreign_keys")
+def validate_foreign_keys(customers_df, customer_categories_df, customer_regions_df):
+    print("PHASE 3: FOREIGN KEY VALIDATION")
+    print("-" * 80)
+
+    # CCAT_CODE and REGION_CODE must exist in their lookup tables
+    result = check_foreign_keys(
+        "customers", customers_df,
+        [
+            ForeignKey("unknown_ccat_code", "CCAT_CODE", "customer_categories"),
+            ForeignKey("unknown_region_code", "REGION_CODE", "customer_regions"),
+        ],
+        {"customer_categories": customer_categories_df, "customer_regions": customer_regions_df},
+    )
+    print_report(result)
+
+    print()
+    return result.valid
 
 
 # ============================================================================
 # 4. BUILD LOOKUP DICTIONARIES
 # ============================================================================
 
-print("PHASE 4: BUILDING LOOKUP DICTIONARIES")
-print("-" * 80)
-
-# TODO: Create dictionary mapping CCAT_CODE -> {CCAT_CODE, CCAT_DESC}
-# This allows O(1) lookup when building customer documents
-ccat_lookup = {}
-for _, row in customer_categories_df.iterrows():
-    ccat_code = row["CCAT_CODE"]
-    ccat_lookup[ccat_code] = {
-        "ccat_code": ccat_code,
-        "ccat_desc": row.get("CCAT_DESC", "Unknown")
+def _lookup_frame(lookup_df, code_column, desc_column, fields):
+    # code -> (code, desc) rows; a repeated code keeps its last row, like a dict built row by row
+    desc = lookup_df[desc_column] if desc_column in lookup_df.columns else "Unknown"
+    lookup = pd.DataFrame({fields[0]: lookup_df[code_column], fields[1]: desc})
+    return lookup.drop_duplicates(subset=fields[0], keep="last").set_index(fields[0], drop=False)
+
+
+@phase("build_lookups")
+def build_lookups(customer_categories_df, customer_regions_df):
+    print("PHASE 4: BUILDING LOOKUP DICTIONARIES")
+    print("-" * 80)
+
+    # CCAT_CODE -> (ccat_code, ccat_desc), joined onto the customers in build_documents
+    ccat_lookup = _lookup_frame(customer_categories_df, "CCAT_CODE", "CCAT_DESC", ("ccat_code", "ccat_desc"))
+    print(f"✓ Built CCAT_CODE lookup: {len(ccat_lookup)} entries")
+
+    # REGION_CODE -> (region_code, region_desc)
+    region_lookup = _lookup_frame(customer_regions_df, "REGION_CODE", "REGION_DESC", ("region_code", "region_desc"))
+    print(f"✓ Built REGION_CODE lookup: {len(region_lookup)} entries")
+
+    print()
+    return ccat_lookup, region_lookup
+
+
+@phase("build_account_parameters")
+def build_account_parameters(account_params_df, keys):
+    """{CUSTOMER_KEY: [parameter, ...]} from the account parameters sheet, grouped in one pass."""
+    params = account_params_df.dropna(subset=["CUSTOMER_NUMBER", "PARAMETER"])
+    params = pd.DataFrame({
+        "CUSTOMER_KEY": keys.encode(params["CUSTOMER_NUMBER"]),
+        # same text standardisation as the finance collection's account_parameters
+        "PARAMETER": params["PARAMETER"].astype(str).str.strip().str.capitalize(),
+    }).drop_duplicates()
+
+    uniques, order, offsets = group_offsets(params["CUSTOMER_KEY"].to_numpy())
+    values = params["PARAMETER"].to_numpy()[order].tolist()
+    account_parameters = {
+        key: values[start:end]
+        for key, start, end in zip(uniques.tolist(), offsets[:-1].tolist(), offsets[1:].tolist())
     }
-print(f"✓ Built CCAT_CODE lookup: {len(ccat_lookup)} entries")
-
-# TODO: Create dictionary mapping REGION_CODE -> {REGION_CODE, REGION_DESC}
-region_lookup = {}
-for _, row in customer_regions_df.iterrows():
-    region_code = row["REGION_CODE"]
-    region_lookup[region_code] = {
-        "region_code": region_code,
-        "region_desc": row.get("REGION_DESC", "Unknown")
-    }
-print(f"✓ Built REGION_CODE lookup: {len(region_lookup)} entries")
-
-# TODO: (OPTIONAL) Create dictionary for representatives if REP_CODE exists
-# rep_lookup = {}
-# if "REP_CODE" in customers_df.columns and representatives_df is not None:
-#     for _, row in representatives_df.iterrows():
-#         rep_code = row["REP_CODE"]
-#         rep_lookup[rep_code] = {
-#             "rep_code": rep_code,
-#             "rep_desc": row.get("REP_DESC", "Unknown"),
-#             "commission": row.get("COMMISSION", 0.0)
-#         }
-#     print(f"✓ Built REP_CODE lookup: {len(rep_lookup)} entries")
-
-print()
+    print(f"✓ Grouped account parameters of {len(account_parameters)} customers\n")
+    return account_parameters
 
 
 # ============================================================================
 # 5. BUILD CUSTOMER COLLECTION DOCUMENTS
 # ============================================================================
 
-print("PHASE 5: BUILDING CUSTOMER DOCUMENTS")
-print("-" * 80)
-
-customer_collection = []
-
-for _, row in customers_df.iterrows():
-    customer_number = row["CUSTOMER_NUMBER"]
-    ccat_code = row.get("CCAT_CODE")
-    region_code = row.get("REGION_CODE")
-    
-    # TODO: Build embedded customer_categories object
-    customer_categories = ccat_lookup.get(ccat_code, {})
-    
-    # TODO: Build embedded region object
-    region = region_lookup.get(region_code, {})
-    
+def _embedded(codes, lookup):
+    # {field: code, field: desc} per row for codes found in the lookup, {} otherwise
+    codes = codes.astype(object)
+    found = codes.isin(lookup.index).tolist()
+    columns = [codes.map(lookup[field]).tolist() for field in lookup.columns]
+    return [
+        dict(zip(lookup.columns, values)) if hit else {}
+        for hit, *values in zip(found, *columns)
+    ]
+
+
+def _numeric(customers_df, column, dtype):
+    # coerced column-wise; missing columns and values default to 0
+    if column not in customers_df.columns:
+        return [dtype(0)] * len(customers_df)
+    values = pd.to_numeric(customers_df[column], errors="coerce").astype("float64").fillna(0)
+    return values.astype(dtype).tolist()
+
+
+@phase("build_documents", rows_out=len)
+def build_documents(customers_df, ccat_lookup, region_lookup, keys, account_parameters=None, rep_dimension=None):
+    print("PHASE 5: BUILDING CUSTOMER DOCUMENTS")
+    print("-" * 80)
+
+    # every field is built as a whole column, then the documents are zipped from the arrays
+    customer_keys = customers_df["CUSTOMER_KEY"].tolist()
+    customer_numbers = keys.decode(customers_df["CUSTOMER_KEY"]).tolist()
+    customer_categories = _embedded(customers_df["CCAT_CODE"], ccat_lookup)
+    regions = _embedded(customers_df["REGION_CODE"], region_lookup)
+
+    # TODO: Handle null rep codes
+    rep_codes = (
+        customers_df["REP_CODE"].astype(object).where(customers_df["REP_CODE"].notna(), None).tolist()
+        if "REP_CODE" in customers_df.columns else [None] * len(customers_df)
+    )
+    # REP_CODE -> representative attributes, one hashed join for the whole column
+    representatives = (
+        embed_representatives(rep_codes, rep_dimension)
+        if rep_dimension is not None else [{} for _ in rep_codes]
+    )
+
     # TODO: Determine customer status (active/inactive)
     # This might come from a status column or be inferred from other fields
-    status = row.get("STATUS", "active").lower()
     # TODO: Add logic if status column doesn't exist:
     # status = "active" if pd.notna(row.get("CUSTOMER_NAME")) else "inactive"
-    
-    # TODO: Build the complete CUSTOMER document
-    doc = {
-        "_id": customer_number,
-        "customer_categories": customer_categories,
-        "region": region,
-        "rep_code": row.get("REP_CODE"),  # TODO: Handle null rep codes
-        "credit_limit": float(row.get("CREDIT_LIMIT", 0.0)) if pd.notna(row.get("CREDIT_LIMIT")) else 0.0,
-        "settle_terms": int(row.get("SETTLE_TERMS", 0)) if pd.notna(row.get("SETTLE_TERMS")) else 0,
-        "normal_payterms": int(row.get("NORMAL_PAYTERMS", 0)) if pd.notna(row.get("NORMAL_PAYTERMS")) else 0,
-        "discount": float(row.get("DISCOUNT", 0.0)) if pd.notna(row.get("DISCOUNT")) else 0.0,
-        "status": status
-    }
-    
-    # TODO: (OPTIONAL) Add account parameters if they exist for this customer
-    # customer_acct_params = account_params_df[account_params_df["CUSTOMER_NUMBER"] == customer_number]
-    # if len(customer_acct_params) > 0:
-    #     doc["account_parameters"] = customer_acct_params["PARAMETER"].tolist()
-    # else:
-    #     doc["account_parameters"] = []
-    
-    customer_collection.append(doc)
+    statuses = (
+        customers_df["STATUS"].astype(str).str.lower().tolist()
+        if "STATUS" in customers_df.columns else ["active"] * len(customers_df)
+    )
 
-print(f"✓ Built {len(customer_collection)} CUSTOMER documents\n")
+    account_parameters = account_parameters if account_parameters is not None else {}
+    customer_collection = [
+        {
+            "_id": customer_number,
+            "customer_categories": customer_category,
+            "region": region,
+            "rep_code": rep_code,
+            "representative": representative,
+            "credit_limit": credit_limit,
+            "settle_terms": settle_terms,
+            "normal_payterms": normal_payterms,
+            "discount": discount,
+            "status": status,
+            "account_parameters": account_parameters.get(customer_key, []),
+        }
+        for customer_key, customer_number, customer_category, region, rep_code, representative,
+            credit_limit, settle_terms, normal_payterms, discount, status in zip(
+            customer_keys,
+            customer_numbers,
+            customer_categories,
+            regions,
+            rep_codes,
+            representatives,
+            _numeric(customers_df, "CREDIT_LIMIT", float),
+            _numeric(customers_df, "SETTLE_TERMS", int),
+            _numeric(customers_df, "NORMAL_PAYTERMS", int),
+            _numeric(customers_df, "DISCOUNT", float),
+            statuses,
+        )
+    ]
+
+    print(f"✓ Built {len(customer_collection)} CUSTOMER documents\n")
+    return customer_collection
 
 
 # ============================================================================
 # 6. DATA QUALITY CHECKS
 # ============================================================================
 
-print("PHASE 6: DATA QUALITY VALIDATION")
-print("-" * 80)
+@phase("quality_checks", rows_in=lambda args: len(args[0]))
+def quality_checks(customer_collection):
+    print("PHASE 6: DATA QUALITY VALIDATION")
+    print("-" * 80)
 
-# TODO: Check for missing required fields in documents
-missing_name = sum(1 for doc in customer_collection if not doc.get("customer_name"))
-print(f"Documents with missing customer_name: {missing_name}")
+    # TODO: Check for missing required fields in documents
+    missing_name = sum(1 for doc in customer_collection if not doc.get("customer_name"))
+    print(f"Documents with missing customer_name: {missing_name}")
 
-missing_categories = sum(1 for doc in customer_collection if not doc.get("customer_categories"))
-print(f"Documents with missing customer_categories: {missing_categories}")
+    missing_categories = sum(1 for doc in customer_collection if not doc.get("customer_categories"))
+    print(f"Documents with missing customer_categories: {missing_categories}")
 
-missing_region = sum(1 for doc in customer_collection if not doc.get("region"))
-print(f"Documents with missing region: {missing_region}")
+    missing_region = sum(1 for doc in customer_collection if not doc.get("region"))
+    print(f"Documents with missing region: {missing_region}")
 
-# TODO: Check credit limit distribution
-credit_limits = [doc.get("credit_limit", 0) for doc in customer_collection]
-print(f"Credit limit range: {min(credit_limits):.2f} - {max(credit_limits):.2f}")
-print(f"Average credit limit: {sum(credit_limits) / len(credit_limits):.2f}")
+    missing_rep = sum(1 for doc in customer_collection if not doc.get("representative"))
+    print(f"Documents with unknown representative: {missing_rep}")
 
-print()
+    # TODO: Check credit limit distribution
+    credit_limits = [doc.get("credit_limit", 0) for doc in customer_collection]
+    if credit_limits:
+        print(f"Credit limit range: {min(credit_limits):.2f} - {max(credit_limits):.2f}")
+        print(f"Average credit limit: {sum(credit_limits) / len(credit_limits):.2f}")
+
+    print()
+
+
+def transform(frames, keys=None):
+    """Phases 2-6: raw frames -> list of CUSTOMER documents.
+
+    keys is the shared customer KeyDictionary (an in-memory one when not given).
+    """
+    keys = keys if keys is not None else KeyDictionary()
+    customers_df, customer_categories_df, customer_regions_df, account_params_df = standardize(frames, keys)
+    customers_df = validate_foreign_keys(customers_df, customer_categories_df, customer_regions_df)
+    ccat_lookup, region_lookup = build_lookups(customer_categories_df, customer_regions_df)
+    account_parameters = build_account_parameters(account_params_df, keys)
+    rep_dimension = build_rep_dimension(frames["representatives"])
+    customer_collection = build_documents(
+        customers_df, ccat_lookup, region_lookup, keys, account_parameters, rep_dimension
+    )
+    quality_checks(customer_collection)
+    return customer_collection
 
 
 # ============================================================================
-# 7. EXPORT TO JSON
+# 7. EXPORT TO NDJSON
 # ============================================================================
 
-print("PHASE 7: EXPORTING TO JSON")
-print("-" * 80)
+@phase("load", rows_in=lambda args: len(args[0]))
+def load(customer_collection, output_dir=OUTPUT_DIR):
+    print("PHASE 7: EXPORTING TO NDJSON")
+    print("-" * 80)
 
-output_file = raw_data_dir.parent / "customer_collection.json"
+    output_file = collection_path(output_dir, "customer_collection")
 
-try:
-    with open(output_file, "w") as f:
-        json.dump(customer_collection, f, indent=2)
-    
-    file_size_kb = output_file.stat().st_size / 1024
-    print(f"✓ Successfully exported to: {output_file}")
-    print(f"  Total documents: {len(customer_collection)}")
-    print(f"  File size: {file_size_kb:.2f} KB\n")
-    
-except Exception as e:
-    print(f"✗ Export failed: {e}\n")
-    raise
+    try:
+        writer = write_collection(output_file, customer_collection)
+
+        print(f"✓ Successfully exported to: {output_file}")
+        print(f"  Total documents: {writer.documents}")
+        print(f"  Bytes written: {writer.bytes_written / 1024:.2f} KB")
+        print(f"  File size: {writer.bytes_on_disk / 1024:.2f} KB\n")
+
+    except Exception as e:
+        print(f"✗ Export failed: {e}\n")
+        raise
+
+    return writer
 
 
 # ============================================================================
 # 8. SAMPLE OUTPUT & VERIFICATION
 # ============================================================================
 
-print("PHASE 8: SAMPLE OUTPUT")
-print("-" * 80)
-
-if customer_collection:
-    print("\nSample CUSTOMER document:")
-    print(json.dumps(customer_collection[0], indent=2))
-    
-    print("\n\nAdditional samples (if available):")
-    # TODO: Show a few more examples with different attributes
-    for i in [1, 2, 3]:
-        if i < len(customer_collection):
-            print(f"\nSample {i + 1}:")
-            print(json.dumps(customer_collection[i], indent=2))
-
-print("\n" + "="*80)
-print("✓ CUSTOMER COLLECTION ETL COMPLETE")
-print("="*80 + "\n")
\ No newline at end of file
+def print_samples(customer_collection):
+    print("PHASE 8: SAMPLE OUTPUT")
+    print("-" * 80)
+
+    if customer_collection:
+        print("\nSample CUSTOMER document:")
+        print(json.dumps(customer_collection[0], indent=2))
+
+        print("\n\nAdditional samples (if available):")
+        # TODO: Show a few more examples with different attributes
+        for i in [1, 2, 3]:
+            if i < len(customer_collection):
+                print(f"\nSample {i + 1}:")
+                print(json.dumps(customer_collection[i], indent=2))
+
+
+def main(raw_data_dir=RAW_DATA_DIR, output_dir=OUTPUT_DIR):
+    print("\n" + "="*80)
+    print("CUSTOMER COLLECTION ETL - INITIALIZATION")
+    print("="*80 + "\n")
+
+    keys = KeyDictionary.load(Path(output_dir) / STATE_DIR_NAME, CUSTOMER_KEYS)
+    with RunMetrics("customer_collection", output_dir) as run, RejectLog("customer_collection", output_dir, keys):
+        frames = extract(raw_data_dir)
+        customer_collection = transform(frames, keys)
+        writer = load(customer_collection, output_dir)
+    print_samples(customer_collection)
+    print("\n" + run.report())
+
+    print("\n" + "="*80)
+    print("✓ CUSTOMER COLLECTION ETL COMPLETE")
+    print("="*80 + "\n")
+    return writer
+
+
+if __name__ == "__main__":
+    main()
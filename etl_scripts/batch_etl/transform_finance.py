@@ -1,287 +1,425 @@
+import argparse
 import pandas as pd 
+import numpy as np
 import json
+import sys
 from pathlib import Path
 
-#helper function to load excel files
-def load_and_sanitize(file_name, sheet_name="None"):
-    df = pd.read_excel(raw_data_dir/file_name, sheet_name=sheet_name)
-    #**strip all whitespace and standardise to uppercase
-    df.columns = df.columns.str.strip().str.upper()
-    return df
+if __package__ in (None, ""):
+    # allow running this file directly: python etl_scripts/batch_etl/transform_finance.py
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 
+from etl_scripts.batch_etl.collection_writer import CollectionWriter, collection_path
+from etl_scripts.batch_etl.columnar import isoformat_column, nest_records
+from etl_scripts.batch_etl.fin_calendar import fin_periods
+from etl_scripts.batch_etl.incremental import STATE_DIR_NAME, PeriodState, combine_fingerprints, frame_fingerprint, period_fingerprints, period_keys
+from etl_scripts.batch_etl.ingest import RawFrames, cleaned_frame
+from etl_scripts.batch_etl.instrumentation import RunMetrics, phase
+from etl_scripts.batch_etl.rollups import FINANCE_ROLLUP, build_finance_rollup, customer_regions, load_rollup
+from etl_scripts.batch_etl.surrogate_keys import CUSTOMER_KEYS, KeyDictionary
 
+# Get the directory containing the script, then navigate two levels up into raw_data
+SCRIPT_DIR = Path(__file__).parent
+RAW_DATA_DIR = SCRIPT_DIR.parent.parent / "raw_data"
+OUTPUT_DIR = RAW_DATA_DIR.parent
 
-print ("\n---1.1 FINANCE DATA CLEANSING & MERGING ---")
+# source workbooks: frame name -> (file, sheet); parsed once, then served from the snapshot cache
+SOURCES = {
+    "payment_header": ("Payment Header.xlsx", "Payment_Header"),
+    "payment_lines": ("Payment Lines.xlsx", "Payment_Lines"),
+    "age_analysis": ("Age Analysis.xlsx", "Age_Analysis"),
+    "account_params": ("Customer Account Parameters.xlsx", "Customer_Account_Parameters"),
+    # REGION_CODE of each customer, for the finance rollup
+    "customers": ("Customer.xlsx", "Customer"),
+}
 
-# --- Load and clean individual files ---
-
-# Get the directory containing the script
-print("getting the directory with script..")
-script_dir = Path(__file__).parent
-
-# Navigate two levels up, then into raw_data
-raw_data_dir = script_dir / ".." / ".." / "raw_data"
-
-# Or use parent property (cleaner)
-raw_data_dir = script_dir.parent.parent / "raw_data"
-
-print("Cleaning the payment header and lines..")
-#1. payment header - deduplication && sanitising data
-payment_header = pd.read_excel(raw_data_dir/"Payment Header.xlsx",sheet_name="Payment_Header")
-payment_header = load_and_sanitize("Payment Header.xlsx", "Payment_Header")
-payment_header = payment_header.drop_duplicates()
-
-
-
-#2. Payment lines (data type fixes, deduplication and removing missing values)
-payment_lines = pd.read_excel(raw_data_dir/"Payment Lines.xlsx",sheet_name="Payment_Lines")
-payment_lines = load_and_sanitize("Payment Lines.xlsx", "Payment_Lines")
-print("Payment lines columns:", payment_lines.columns.tolist())
-
-# AGGRESSIVE FIX: Explicitly rename the customer column after cleaning.
-# If the column exists, it should now be named 'CUSTOMER_NUMBER'.
-# Note: If the actual column name is something totally different (like 'CUSTID'), 
-# you would replace 'CUSTOMER_NUMBER' in the .columns property below with the true name.
-if 'CUSTOMER_NUMBER' not in payment_lines.columns:
-    print("!! WARNING: CUSTOMER_NUMBER not found in Payment Lines. Check original file.")
-
-payment_lines["DEPOSIT_DATE"] = pd.to_datetime(payment_lines["DEPOSIT_DATE"], errors="coerce")
-
-missing_summary = payment_lines.isnull().sum()
-
-
-amount_cols_pl = ["BANK_AMT", "DISCOUNT", "TOT_PAYMENT"]
-for col in amount_cols_pl:
-    #convert bad values with nan
-    payment_lines[col] = pd.to_numeric(payment_lines[col], errors="coerce")
-payment_lines = payment_lines.drop_duplicates()
-
-# remove rows with missing deposit reference or customer number
-payment_lines = payment_lines.dropna(subset=["CUSTOMER_NUMBER", "DEPOSIT_REF"])
-
-if "FIN_PERIOD" not in payment_lines.columns and "DEPOSIT_DATE" in payment_lines.columns:
-    payment_lines["FIN_PERIOD"] = pd.to_datetime(payment_lines["DEPOSIT_DATE"], errors="coerce").dt.strftime("%Y%m").astype(int)
-
-
-
-#3. Age analysis
-
-print("Cleaning age analysis..")
-#Cleaning Age_Analysis
-age_df = pd.read_excel(raw_data_dir/"Age Analysis.xlsx", sheet_name="Age_Analysis")
-age_df = load_and_sanitize("Age Analysis.xlsx", "Age_Analysis")
-#--sanitize column names to remove whitespace
-age_df.columns = age_df.columns.str.strip().str.upper()
-print("Age analysis columns:", age_df.columns.tolist())
-
-# AGGRESSIVE FIX: Ensure the age analysis customer column is named 'CUSTOMER_NUMBER'.
-if 'CUSTOMER_NUMBER' not in age_df.columns:
-    print("!! WARNING: CUSTOMER_NUMBER not found in Age Analysis. Check original file.")
-
-
-# Remove duplicates
-age_df = age_df.drop_duplicates()
-
-# Ensure numeric columns are actually numeric
-amount_cols = [col for col in age_df.columns if col.startswith("AMT_") or col == "TOTAL_DUE"]
-age_df[amount_cols] = age_df[amount_cols].apply(pd.to_numeric, errors="coerce")
-
-# Fill missing values with 0 for amounts
-age_df[amount_cols] = age_df[amount_cols].fillna(0)
 
-# Check consistency of totals
-age_df["BUCKET_SUM"] = age_df[amount_cols].drop("TOTAL_DUE", axis=1).sum(axis=1)
-age_df["CONSISTENT_PAYMENTS"] = age_df["TOTAL_DUE"].round(2) == age_df["BUCKET_SUM"].round(2)
+def extract(raw_data_dir=RAW_DATA_DIR):
+    """Raw frames for the finance build; nothing is read until a cleaning step asks for it."""
+    return RawFrames(raw_data_dir, SOURCES, cleaners=CHUNK_CLEANERS)
 
 
+# --- Load and clean individual files ---
 
-#Cleaning Customer Account Parameters
-print("Cleaning account parameters..")
-custAcc_df = pd.read_excel(raw_data_dir/"Customer Account Parameters.xlsx", sheet_name="Customer_Account_Parameters")
+def clean_payment_lines_chunk(payment_lines):
+    """Row-wise Payment Lines type fixes; applied to each chunk while the workbook streams."""
+    payment_lines = payment_lines.set_axis(payment_lines.columns.str.strip().str.upper(), axis=1)
+    payment_lines["DEPOSIT_DATE"] = pd.to_datetime(payment_lines["DEPOSIT_DATE"], errors="coerce")
 
-# Remove duplicates
-custAcc_df = custAcc_df.drop_duplicates()
-# Drop rows with missing values in key columns
-custAcc_df = custAcc_df.dropna(subset=["CUSTOMER_NUMBER", "PARAMETER"])
+    amount_cols_pl = ["BANK_AMT", "DISCOUNT", "TOT_PAYMENT"]
+    for col in amount_cols_pl:
+        #convert bad values with nan
+        payment_lines[col] = pd.to_numeric(payment_lines[col], errors="coerce")
 
-# Standardize text 
-custAcc_df["CUSTOMER_NUMBER"] = custAcc_df["CUSTOMER_NUMBER"].astype(str).str.strip()
-custAcc_df["PARAMETER"] = custAcc_df["PARAMETER"].str.strip().str.capitalize()
+    if "FIN_PERIOD" not in payment_lines.columns and "DEPOSIT_DATE" in payment_lines.columns:
+        payment_lines["FIN_PERIOD"] = fin_periods(payment_lines["DEPOSIT_DATE"])
+    return payment_lines
 
-print("Payment header shape(whatevr that means): ",payment_header.shape)
-print("Payment line shape(whatevr that means): ",payment_lines.shape)
-print("Age dataframe shape(whatevr that means): ",age_df.shape)
-print("Customer Account params shape(whatevr that means): ",custAcc_df.shape)
 
-# --- STANDARDIZE CUSTOMER_NUMBER ACROSS ALL DATAFRAMES ---
-for df_name, df in [("payment_lines", payment_lines), ("age_df", age_df), ("custAcc_df", custAcc_df)]:
-    if "CUSTOMER_NUMBER" in df.columns:
-        df["CUSTOMER_NUMBER"] = (
-            df["CUSTOMER_NUMBER"]
-            .astype(str)
-            .str.strip()              # remove whitespace
-            .str.replace("'", "", regex=False)  # remove stray quotes
-            .str.upper()              # uppercase consistency
-        )
-        print(f"Standardized CUSTOMER_NUMBER in {df_name}, sample:", df["CUSTOMER_NUMBER"].head(3).tolist())
+@phase("clean_payments")
+def clean_payments(frames):
+    print("Cleaning the payment header and lines..")
+    #1. payment header - deduplication && sanitising data
+    payment_header = frames["payment_header"].drop_duplicates()
 
-#DEBUGGING BEFORE MERGE
+    #2. Payment lines (data type fixes, deduplication and removing missing values)
+    # the type fixes ran chunk by chunk as the workbook streamed (clean_payment_lines_chunk)
+    payment_lines = cleaned_frame(frames, "payment_lines", clean_payment_lines_chunk)
+    print("Payment lines columns:", payment_lines.columns.tolist())
+
+    # AGGRESSIVE FIX: Explicitly rename the customer column after cleaning.
+    # If the column exists, it should now be named 'CUSTOMER_NUMBER'.
+    # Note: If the actual column name is something totally different (like 'CUSTID'), 
+    # you would replace 'CUSTOMER_NUMBER' in the .columns property below with the true name.
+    if 'CUSTOMER_NUMBER' not in payment_lines.columns:
+        print("!! WARNING: CUSTOMER_NUMBER not found in Payment Lines. Check original file.")
+
+    payment_lines = payment_lines.drop_duplicates()
+
+    # remove rows with missing deposit reference or customer number
+    payment_lines = payment_lines.dropna(subset=["CUSTOMER_NUMBER", "DEPOSIT_REF"])
+    return payment_header, payment_lines
+
+
+def bucket_labels(columns):
+    """days_due key of each AMT_ column: AMT_CURRENT -> '0', AMT_30_DAYS -> '30'."""
+    return [c.replace("AMT_", "").replace("_DAYS", "").replace("CURRENT", "0") for c in columns]
 
-# Check uniqueness of merge keys
-print("Unique deposit refs in payment_lines:", payment_lines['DEPOSIT_REF'].nunique())
-print("Unique deposit refs in payment_header:", payment_header['DEPOSIT_REF'].nunique())
 
-print("Unique customer numbers in payment_lines:", payment_lines['CUSTOMER_NUMBER'].nunique())
-print("Unique customer numbers in age_df:", age_df['CUSTOMER_NUMBER'].nunique())
+def ageing_buckets(age_df):
+    """(labels, matrix): the AMT_ bucket columns as one float matrix, one row per age analysis row."""
+    amt_cols = [c for c in age_df.columns if c.startswith("AMT_")]
+    # float64 for the whole matrix, the workbook mixes float and int bucket columns
+    return bucket_labels(amt_cols), age_df[amt_cols].to_numpy(dtype=np.float64)
+
+
+def encode_days_due(labels, buckets):
+    """{label: int(amount)} of every row's non-zero buckets, in column order."""
+    rows, cols = np.nonzero(buckets)  # row-major, so each row's buckets are contiguous
+    keys = np.asarray(labels, dtype=object)[cols].tolist()
+    values = buckets[rows, cols].astype(np.int64).tolist()  # truncates like int()
+    offsets = np.zeros(len(buckets) + 1, dtype=np.intp)
+    np.cumsum(np.bincount(rows, minlength=len(buckets)), out=offsets[1:])
+    return [
+        dict(zip(keys[start:end], values[start:end]))
+        for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())
+    ]
 
-# --- Debug: find common and missing customers ---
-pl_customers = set(payment_lines["CUSTOMER_NUMBER"].unique())
-aa_customers = set(age_df["CUSTOMER_NUMBER"].unique())
 
-common_customers = pl_customers.intersection(aa_customers)
-only_in_pl = pl_customers - aa_customers
-only_in_aa = aa_customers - pl_customers
+def clean_age_analysis_chunk(age_df):
+    """Row-wise Age Analysis type fixes and bucket totals; applied to each chunk while the workbook streams."""
+    age_df = age_df.set_axis(age_df.columns.str.strip().str.upper(), axis=1)
 
-print(f"Total customers in payments: {len(pl_customers)}")
-print(f"Total customers in age analysis: {len(aa_customers)}")
-print(f"Common customers: {len(common_customers)}")
+    # Ensure numeric columns are actually numeric
+    amount_cols = [col for col in age_df.columns if col.startswith("AMT_") or col == "TOTAL_DUE"]
+    age_df[amount_cols] = age_df[amount_cols].apply(pd.to_numeric, errors="coerce")
 
-# Print a few examples of what doesn't overlap
-print("\nSample in payments only:", list(only_in_pl)[:10])
-print("Sample in age analysis only:", list(only_in_aa)[:10])
+    # Fill missing values with 0 for amounts
+    age_df[amount_cols] = age_df[amount_cols].fillna(0)
+
+    # Check consistency of totals
+    _, buckets = ageing_buckets(age_df)
+    age_df["BUCKET_SUM"] = buckets.sum(axis=1)
+    age_df["CONSISTENT_PAYMENTS"] = age_df["TOTAL_DUE"].round(2) == age_df["BUCKET_SUM"].round(2)
+    return age_df
+
+
+@phase("clean_age_analysis")
+def clean_age_analysis(frames):
+    #3. Age analysis
+    print("Cleaning age analysis..")
+    # amounts and bucket totals were cleaned chunk by chunk as the workbook streamed
+    age_df = cleaned_frame(frames, "age_analysis", clean_age_analysis_chunk)
+    print("Age analysis columns:", age_df.columns.tolist())
+
+    # AGGRESSIVE FIX: Ensure the age analysis customer column is named 'CUSTOMER_NUMBER'.
+    if 'CUSTOMER_NUMBER' not in age_df.columns:
+        print("!! WARNING: CUSTOMER_NUMBER not found in Age Analysis. Check original file.")
+
+    # Remove duplicates
+    return age_df.drop_duplicates()
+
+
+# row-wise cleaning that runs per chunk as the workbooks stream in (see RawFrames)
+CHUNK_CLEANERS = {
+    "payment_lines": clean_payment_lines_chunk,
+    "age_analysis": clean_age_analysis_chunk,
+}
+
+
+@phase("clean_account_params")
+def clean_account_params(frames):
+    #Cleaning Customer Account Parameters
+    print("Cleaning account parameters..")
+    # Remove duplicates
+    custAcc_df = frames["account_params"].drop_duplicates()
+    # Drop rows with missing values in key columns
+    custAcc_df = custAcc_df.dropna(subset=["CUSTOMER_NUMBER", "PARAMETER"])
+
+    # Standardize text (CUSTOMER_NUMBER is normalised together with the other frames in standardize_customer_numbers)
+    custAcc_df["PARAMETER"] = custAcc_df["PARAMETER"].str.strip().str.capitalize()
+    return custAcc_df
+
+
+@phase("standardize_customer_numbers")
+def standardize_customer_numbers(payment_lines, age_df, custAcc_df, keys):
+    # --- STANDARDIZE CUSTOMER_NUMBER ACROSS ALL DATAFRAMES ---
+    # each distinct code is normalised once (strip, stray quotes, upper case) and
+    # replaced by its int32 surrogate key; joins below run on CUSTOMER_KEY
+    standardized = []
+    for df_name, df in [("payment_lines", payment_lines), ("age_df", age_df), ("custAcc_df", custAcc_df)]:
+        if "CUSTOMER_NUMBER" in df.columns:
+            df = df.assign(CUSTOMER_KEY=keys.encode(df["CUSTOMER_NUMBER"])).drop(columns="CUSTOMER_NUMBER")
+            print(f"Standardized CUSTOMER_NUMBER in {df_name}, sample:", keys.decode(df["CUSTOMER_KEY"].head(3)).tolist())
+        standardized.append(df)
+    return standardized
 
-print("\n🔍 Payment sample CUSTOMER_NUMBERs:", payment_lines["CUSTOMER_NUMBER"].unique()[:10])
-print("🔍 Age sample CUSTOMER_NUMBERs:", age_df["CUSTOMER_NUMBER"].unique()[:10])
 
-# check intersection
-common_customers = set(payment_lines["CUSTOMER_NUMBER"]) & set(age_df["CUSTOMER_NUMBER"])
-print("🔍 Common customers count:", len(common_customers))
-print("🔍 Sample common customers:", list(common_customers)[:10])
+@phase("report_customer_overlap")
+def report_customer_overlap(payment_header, payment_lines, age_df, keys):
+    #DEBUGGING BEFORE MERGE
 
+    # Check uniqueness of merge keys
+    print("Unique deposit refs in payment_lines:", payment_lines['DEPOSIT_REF'].nunique())
+    print("Unique deposit refs in payment_header:", payment_header['DEPOSIT_REF'].nunique())
+
+    print("Unique customer numbers in payment_lines:", payment_lines['CUSTOMER_KEY'].nunique())
+    print("Unique customer numbers in age_df:", age_df['CUSTOMER_KEY'].nunique())
+
+    # --- Debug: find common and missing customers (sorted int32 key arrays) ---
+    pl_customers = np.unique(payment_lines["CUSTOMER_KEY"].to_numpy())
+    aa_customers = np.unique(age_df["CUSTOMER_KEY"].to_numpy())
+
+    common_customers = keys.decode(np.intersect1d(pl_customers, aa_customers, assume_unique=True))
+    only_in_pl = keys.decode(np.setdiff1d(pl_customers, aa_customers, assume_unique=True))
+    only_in_aa = keys.decode(np.setdiff1d(aa_customers, pl_customers, assume_unique=True))
+
+    print(f"Total customers in payments: {len(pl_customers)}")
+    print(f"Total customers in age analysis: {len(aa_customers)}")
+    print(f"Common customers: {len(common_customers)}")
+
+    # Print a few examples of what doesn't overlap
+    print("\nSample in payments only:", list(only_in_pl)[:10])
+    print("Sample in age analysis only:", list(only_in_aa)[:10])
+
+    print("\n🔍 Payment sample CUSTOMER_NUMBERs:", keys.decode(payment_lines["CUSTOMER_KEY"].unique()[:10]))
+    print("🔍 Age sample CUSTOMER_NUMBERs:", keys.decode(age_df["CUSTOMER_KEY"].unique()[:10]))
 
-# --- MERGING PROCESS ---
-# Clean up duplicate columns
-
-# --- 1️⃣ Aggregate Payment Lines into Nested Lists ---
-print("step 1: aggregating payment lines into nested list..")
-payment_lines_nested = (
-    payment_lines.groupby(["CUSTOMER_NUMBER", "FIN_PERIOD"], as_index=False)
-    .apply(
-        lambda g: pd.Series({
-            "payment_lines": g[["DEPOSIT_DATE", "DEPOSIT_REF", "BANK_AMT", "DISCOUNT"]]
-        }),
-        include_groups=False
+    # check intersection
+    print("🔍 Common customers count:", len(common_customers))
+    print("🔍 Sample common customers:", list(common_customers)[:10])
+
+
+@phase("select_changed_periods")
+def select_changed_periods(payment_lines, age_df, custAcc_df, regions, state):
+    # --- INCREMENTAL: only FIN_PERIODs that are new or restated since the last export ---
+    print("Selecting changed financial periods..")
+    fingerprints = combine_fingerprints(
+        period_fingerprints(age_df, "FIN_PERIOD"),
+        period_fingerprints(payment_lines, "FIN_PERIOD"),
     )
+    # account parameters are attached to every period and regions group every period's
+    # rollup, so any change there rebuilds everything
+    sources = {
+        "account_params": frame_fingerprint(custAcc_df),
+        "customer_regions": frame_fingerprint(regions.reset_index()),
+    }
+    changed = state.changed_periods(fingerprints, sources)
+    state.stage(fingerprints, sources)
 
-)
-print(f"  ✓ {len(payment_lines_nested)} payment line groups created\n")
-
-
-# --- 2️⃣ Aggregate Age Analysis (Totals and Buckets) ---
-print("step 2: Aggregating age analysis by customer (nesting FIN_PERIODS)...")
-age_cols = [c for c in age_df.columns if c.startswith("AMT")]
-
-# Create a dictionary of days due amounts
-age_df["days_due"] = age_df[age_cols].apply(
-    lambda r: {
-        c.replace("AMT_", "").replace("_DAYS", "").replace("CURRENT", "0"): int(v)
-               for c, v in r.items() 
-               if v !=0
-    }, 
-    axis=1
-)
-
-#select only relevant columns for merging
-age_slim = age_df[["CUSTOMER_NUMBER", "FIN_PERIOD", "TOTAL_DUE", "AMT_CURRENT", "days_due"]].copy()
-print(f"  ✓ {len(age_slim)} age analysis records ready for merging\n")
-
-#merge age analysis with payment lines
-print("Step 3: Merging age analysis with payment lines..")
-finance_data = (
-    age_slim
-    .merge(payment_lines_nested,
-           on=["CUSTOMER_NUMBER", "FIN_PERIOD"],
-           how="left")
-)
-
-# Fill missing payment_lines with empty list
-finance_data["payment_lines"] = finance_data["payment_lines"].apply(
-    lambda x: x if isinstance(x, list) else []
-)
+    print(f"  ✓ {state.summary(changed)}")
+    if state.sources_changed(sources) and not state.is_first_run:
+        print(f"  {', '.join(state.sources_changed(sources))} changed: rebuilding all periods")
+    vanished = state.vanished_periods(fingerprints)
+    if vanished:
+        print(f"  !! WARNING: {len(vanished)} previously exported period(s) have no source rows: {vanished[:10]}")
 
-print(f"  ✓ Merged: {len(finance_data)} finance records\n")
+    age_df = age_df[period_keys(age_df["FIN_PERIOD"]).isin(changed).to_numpy()].copy()
+    payment_lines = payment_lines[period_keys(payment_lines["FIN_PERIOD"]).isin(changed).to_numpy()]
+    print(f"  ✓ Selected {len(age_df)} age analysis rows and {len(payment_lines)} payment lines\n")
+    return payment_lines, age_df
 
-print("Sample merged finance data:", finance_data.head(3))
 
+# --- MERGING PROCESS ---
 
-# --- 3️⃣  Attach Customer Parameters---
-print("step 4: attaching customer parameters..")
-cust_params_grouped = (
-    custAcc_df.groupby("CUSTOMER_NUMBER", as_index=False)["PARAMETER"]
-    .apply(list, include_groups = False)
-    .reset_index()
-    .rename(columns={"PARAMETER": "ACCOUNT_PARAMETERS"})
-)
+def _json_column(column):
+    # plain Python values with None where missing, so every document is valid JSON
+    return column.astype(object).where(column.notna(), None)
+
+
+@phase("merge_finance_data")
+def merge_finance_data(payment_lines, age_df, custAcc_df, keys):
+    # --- 1️⃣ Aggregate Payment Lines into Nested Lists ---
+    print("step 1: aggregating payment lines into nested list..")
+    # one stable sort over (CUSTOMER_KEY, FIN_PERIOD), then plain dicts per group (see columnar.py)
+    payment_lines_nested = nest_records(
+        [payment_lines["CUSTOMER_KEY"], payment_lines["FIN_PERIOD"]],
+        {
+            "deposit_date": isoformat_column(payment_lines["DEPOSIT_DATE"]),
+            "deposit_ref": _json_column(payment_lines["DEPOSIT_REF"]),
+            "bank_amt": _json_column(payment_lines["BANK_AMT"]),
+            "discount": _json_column(payment_lines["DISCOUNT"]),
+        },
+    )
+    print(f"  ✓ {len(payment_lines_nested)} payment line groups created\n")
+
+    # --- 2️⃣ Aggregate Age Analysis (Totals and Buckets) ---
+    print("step 2: Aggregating age analysis by customer (nesting FIN_PERIODS)...")
+    # Create a dictionary of days due amounts from the same bucket matrix as BUCKET_SUM
+    age_df["days_due"] = encode_days_due(*ageing_buckets(age_df))
+
+    #select only relevant columns for merging
+    age_slim = age_df[["CUSTOMER_KEY", "FIN_PERIOD", "TOTAL_DUE", "AMT_CURRENT", "days_due"]].copy()
+    print(f"  ✓ {len(age_slim)} age analysis records ready for merging\n")
+
+    #merge age analysis with payment lines
+    print("Step 3: Merging age analysis with payment lines..")
+    finance_data = age_slim
+    # dictionary lookup per (customer, period); periods without payments get an empty list
+    finance_data["payment_lines"] = [
+        payment_lines_nested.get(key, [])
+        for key in zip(finance_data["CUSTOMER_KEY"].tolist(), finance_data["FIN_PERIOD"].tolist())
+    ]
+
+    print(f"  ✓ Merged: {len(finance_data)} finance records\n")
+
+    print("Sample merged finance data:", finance_data.head(3))
+
+    # --- 3️⃣  Attach Customer Parameters---
+    print("step 4: attaching customer parameters..")
+    cust_params_grouped = (
+        custAcc_df.groupby("CUSTOMER_KEY", as_index=False)["PARAMETER"]
+        .apply(list, include_groups = False)
+        .reset_index()
+        .rename(columns={"PARAMETER": "ACCOUNT_PARAMETERS"})
+    )
 
-finance_data = finance_data.merge(cust_params_grouped, on="CUSTOMER_NUMBER", how="left")
-finance_data["ACCOUNT_PARAMETERS"] = finance_data["ACCOUNT_PARAMETERS"].apply(
-    lambda x: x if  isinstance(x, list) else [] #replace NaN with empty list
-)
-print(f"  ✓ Attached account parameters, total records now: {len(finance_data)}\n")
+    finance_data = finance_data.merge(cust_params_grouped, on="CUSTOMER_KEY", how="left")
+    finance_data["ACCOUNT_PARAMETERS"] = finance_data["ACCOUNT_PARAMETERS"].apply(
+        lambda x: x if  isinstance(x, list) else [] #replace NaN with empty list
+    )
+    print(f"  ✓ Attached account parameters, total records now: {len(finance_data)}\n")
 
+    # back from surrogate keys to customer codes for the documents
+    finance_data["CUSTOMER_NUMBER"] = keys.decode(finance_data["CUSTOMER_KEY"])
 
-# --- 5️⃣ Verify Payment Lines ---
-records_with_payments = finance_data[finance_data["payment_lines"].apply(len) > 0]
-print(f"Records with payment data: {len(records_with_payments)} / {len(finance_data)}")
-if len(records_with_payments) > 0:
-    sample_row = records_with_payments.iloc[0]
-    print(f"  Example: {sample_row['CUSTOMER_NUMBER']} period {sample_row['FIN_PERIOD']} has {len(sample_row['payment_lines'])} payment(s)\n")
+    # --- 5️⃣ Verify Payment Lines ---
+    records_with_payments = finance_data[finance_data["payment_lines"].apply(len) > 0]
+    print(f"Records with payment data: {len(records_with_payments)} / {len(finance_data)}")
+    if len(records_with_payments) > 0:
+        sample_row = records_with_payments.iloc[0]
+        print(f"  Example: {sample_row['CUSTOMER_NUMBER']} period {sample_row['FIN_PERIOD']} has {len(sample_row['payment_lines'])} payment(s)\n")
 
+    return finance_data
 
 
 # --- 6️⃣ Build Final Finance Collection Documents ---
-print("STep 5: Building final FINANCE collection documents..")
-
-finance_collection = []
-for _, row in finance_data.iterrows():
-    doc = {
-        "_id": f"{row['CUSTOMER_NUMBER']}_{row['FIN_PERIOD']}",
-        "customer_number": row["CUSTOMER_NUMBER"],
-        "fin_period": str(int(row["FIN_PERIOD"])) if pd.notna(row["FIN_PERIOD"]) else None,
-        "total_due": float(row["TOTAL_DUE"]) if pd.notna(row["TOTAL_DUE"]) else 0.0,
-        "amt_current": float(row["AMT_CURRENT"]) if pd.notna(row["AMT_CURRENT"]) else 0.0,
-        "days_due": row["days_due"] if isinstance(row["days_due"], dict) else {},
-        "payment_lines": row["payment_lines"] if isinstance(row["payment_lines"], list) else [],
-        "account_parameters": row["ACCOUNT_PARAMETERS"] if isinstance(row["ACCOUNT_PARAMETERS"], list) else []
-    }
-    finance_collection.append(doc)
-
-print(f" ✓ Build {len(finance_collection)} finance documents for MongoDB\n")
-
-# --- EXPORT TO JSON FOR INSPECTION ---
-print ("Step 6: Exporting to JSON for inspection..")
-output_file = raw_data_dir.parent / "finance_collection.json"
-
-try:
-    with open(output_file, "w") as f:
-        json.dump(finance_collection, f, indent=2)
-    print(f"  ✓ Exported finance collection to {output_file}\n")
-
-    #statistics
-    print("===EXPORT SUMMARY===")
-    print(f"Total documents: {len(finance_collection)}")
-    print(f"File size: {output_file.stat().st_size / 1024:.2f} KB\n")
-
-    if finance_collection:
-        print ("Sample FINANCE document:")
-        print(json.dumps(finance_collection[0], indent=2))
-
-except Exception as e:
-    print(f"\n[FAILURE] Could not export finance collection: {e}")
-    raise
-
-print("Finance collection build complete.\n")
-
-
 
-#end of script
\ No newline at end of file
+def build_finance_documents(finance_data):
+    for _, row in finance_data.iterrows():
+        yield {
+            "_id": f"{row['CUSTOMER_NUMBER']}_{row['FIN_PERIOD']}",
+            "customer_number": row["CUSTOMER_NUMBER"],
+            "fin_period": str(int(row["FIN_PERIOD"])) if pd.notna(row["FIN_PERIOD"]) else None,
+            "total_due": float(row["TOTAL_DUE"]) if pd.notna(row["TOTAL_DUE"]) else 0.0,
+            "amt_current": float(row["AMT_CURRENT"]) if pd.notna(row["AMT_CURRENT"]) else 0.0,
+            "days_due": row["days_due"] if isinstance(row["days_due"], dict) else {},
+            "payment_lines": row["payment_lines"] if isinstance(row["payment_lines"], list) else [],
+            "account_parameters": row["ACCOUNT_PARAMETERS"] if isinstance(row["ACCOUNT_PARAMETERS"], list) else []
+        }
+
+
+def transform(frames, state=None, keys=None):
+    """Clean, merge and nest the finance sources; returns (finance_data, document generator).
+
+    With a PeriodState only the FIN_PERIODs that are new or restated are merged and emitted.
+    keys is the shared customer KeyDictionary (an in-memory one when not given).
+    """
+    keys = keys if keys is not None else KeyDictionary()
+    payment_header, payment_lines = clean_payments(frames)
+    age_df = clean_age_analysis(frames)
+    custAcc_df = clean_account_params(frames)
+
+    print("Payment header shape(whatevr that means): ",payment_header.shape)
+    print("Payment line shape(whatevr that means): ",payment_lines.shape)
+    print("Age dataframe shape(whatevr that means): ",age_df.shape)
+    print("Customer Account params shape(whatevr that means): ",custAcc_df.shape)
+
+    payment_lines, age_df, custAcc_df = standardize_customer_numbers(payment_lines, age_df, custAcc_df, keys)
+    regions = customer_regions(frames["customers"], keys)
+    report_customer_overlap(payment_header, payment_lines, age_df, keys)
+    if state is not None:
+        payment_lines, age_df = select_changed_periods(payment_lines, age_df, custAcc_df, regions, state)
+    finance_data = merge_finance_data(payment_lines, age_df, custAcc_df, keys)
+    # region of each row, for the finance rollup (not part of the documents)
+    finance_data["REGION_CODE"] = finance_data["CUSTOMER_KEY"].map(regions)
+
+    print("STep 5: Building final FINANCE collection documents..")
+    # documents are generated lazily and streamed straight into the export
+    finance_collection = build_finance_documents(finance_data)
+    print(f" ✓ Prepared {len(finance_data)} finance documents for MongoDB\n")
+    return finance_data, finance_collection
+
+
+# --- EXPORT TO NDJSON FOR INSPECTION ---
+
+@phase("load")
+def load(finance_collection, output_dir=OUTPUT_DIR, name="finance_collection"):
+    print ("Step 6: Exporting to NDJSON for inspection..")
+    output_file = collection_path(output_dir, name)
+
+    try:
+        sample_doc = None
+        with CollectionWriter(output_file) as writer:
+            for doc in finance_collection:
+                writer.write(doc)
+                if sample_doc is None:
+                    sample_doc = doc
+        print(f"  ✓ Exported finance collection to {output_file}\n")
+
+        #statistics
+        print("===EXPORT SUMMARY===")
+        print(f"Total documents: {writer.documents}")
+        print(f"Bytes written: {writer.bytes_written / 1024:.2f} KB")
+        print(f"File size: {writer.bytes_on_disk / 1024:.2f} KB\n")
+
+        if sample_doc is not None:
+            print ("Sample FINANCE document:")
+            print(json.dumps(sample_doc, indent=2))
+
+    except Exception as e:
+        print(f"\n[FAILURE] Could not export finance collection: {e}")
+        raise
+
+    return writer
+
+
+def main(raw_data_dir=RAW_DATA_DIR, output_dir=OUTPUT_DIR, incremental=False):
+    """Full export to finance_collection (and finance_rollup), or with incremental=True only the
+    changed periods' documents to finance_collection_delta / finance_rollup_delta (for the loaders to upsert)."""
+    print ("\n---1.1 FINANCE DATA CLEANSING & MERGING ---")
+    name = "finance_collection_delta" if incremental else "finance_collection"
+    with RunMetrics(name, output_dir) as run:
+        state = PeriodState.load(Path(output_dir) / STATE_DIR_NAME, "finance_collection") if incremental else None
+        keys = KeyDictionary.load(Path(output_dir) / STATE_DIR_NAME, CUSTOMER_KEYS)
+        frames = extract(raw_data_dir)
+        finance_data, finance_collection = transform(frames, state, keys)
+        writer = load(finance_collection, output_dir, name=name)
+        load_rollup(build_finance_rollup(finance_data), output_dir,
+                    f"{FINANCE_ROLLUP}_delta" if incremental else FINANCE_ROLLUP)
+        if state is not None:
+            state.commit()
+    print(run.report())
+    print("Finance collection build complete.\n")
+    return writer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the FINANCE collection export")
+    parser.add_argument("--incremental", action="store_true",
+                        help="export only new or restated FIN_PERIODs to finance_collection_delta")
+    main(incremental=parser.parse_args().incremental)
+
+
+
+#end of script
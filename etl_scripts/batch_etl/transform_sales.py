@@ -13,6 +13,13 @@ Conceptual Design Target:
   "trans_type_desc": "CREDIT NOTE",
   "customer_number": "ESP100",
   "rep_code": "02JUL",
+  "representative": {
+    "rep_code": "02JUL",
+    "rep_desc": "R'S CUSTOMER - JU'S SALE",
+    "rep_group": "Sales Rep",
+    "comm_method": "Sales",
+    "commission": 0.5
+  },
   "trans_date": "2019-03-25",
   "fin_period": "201901",
   "total_revenue": 1000.0,
@@ -24,358 +31,538 @@ Conceptual Design Target:
       "unit_sell_price": 500.0,
       "unit_cost": 250.0,
       "total_line_price": 1000.0,
-      "profit": 500.0
+      "profit": 500.0,
+      "prodcat_code": 32,
+      "product_category": "2018",
+      "brand": "E",
+      "product_range": "Product",
+      "gender": "female",
+      "material": "plastic",
+      "style": "classic",
+      "colour": null,
+      "branding": null
     }
   ]
 }
 """
 
+import argparse
 import pandas as pd
 import json
+import sys
 from pathlib import Path
 
+if __package__ in (None, ""):
+    # allow running this file directly: python etl_scripts/batch_etl/transform_sales.py
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from etl_scripts.batch_etl.collection_writer import CollectionWriter, collection_path
+from etl_scripts.batch_etl.columnar import isoformat_column, nest_records
+from etl_scripts.batch_etl.dtype_planner import widen
+from etl_scripts.batch_etl.fin_calendar import fin_periods
+from etl_scripts.batch_etl.foreign_keys import ForeignKey, RejectLog, check_foreign_keys, print_report
+from etl_scripts.batch_etl.incremental import STATE_DIR_NAME, PeriodState, combine_fingerprints, frame_fingerprint, period_fingerprints, period_keys
+from etl_scripts.batch_etl.ingest import RawFrames, cleaned_frame
+from etl_scripts.batch_etl.instrumentation import RunMetrics, phase
+from etl_scripts.batch_etl.products import PRODUCT_SOURCES, build_product_dimension, product_attributes
+from etl_scripts.batch_etl.representatives import REP_SOURCE, build_rep_dimension, embed_representatives
+from etl_scripts.batch_etl.rollups import SALES_ROLLUP, build_sales_rollup, load_rollup
+from etl_scripts.batch_etl.surrogate_keys import CUSTOMER_KEYS, MISSING_KEY, KeyDictionary
+
 # ============================================================================
 # 0. SETUP & CONFIGURATION
 # ============================================================================
 
-print("\n" + "="*80)
-print("SALES COLLECTION ETL - INITIALIZATION")
-print("="*80 + "\n")
-
 # Get script directory and raw_data path
-script_dir = Path(__file__).parent
-raw_data_dir = script_dir.parent.parent / "raw_data"
+SCRIPT_DIR = Path(__file__).parent
+RAW_DATA_DIR = SCRIPT_DIR.parent.parent / "raw_data"
+OUTPUT_DIR = RAW_DATA_DIR.parent
+
+# Source workbooks: frame name -> (file, sheet)
+SOURCES = {
+    # Sales_Header.xlsx (contains DOC_NUMBER, CUSTOMER_NUMBER, REP_CODE, TRANS_DATE, TRANS_TYPE_CODE, etc.)
+    "sales_header": ("Sales Header.xlsx", "Sales_Header"),
+    # Sales_Lines.xlsx (contains DOC_NUMBER, INVENTORY_CODE, QUANTITY, UNIT_SELL_PRICE, UNIT_COST, TOTAL_LINE_PRICE)
+    "sales_lines": ("Sales Line.xlsx", "Sales_Line"),
+    # Trans_Types.xlsx (lookup table: TRANS_TYPE_CODE -> TRANS_TYPE_DESC)
+    "trans_types": ("Trans Types.xlsx", "Trans_Types"),
+    # Representatives.xlsx (lookup: REP_CODE -> REP_DESC, COMM_METHOD, COMMISSION)
+    "representatives": REP_SOURCE,
+    # Products, Products Styles, Product Categories / Brands / Ranges (attributes of each line's INVENTORY_CODE)
+    **PRODUCT_SOURCES,
+}
 
-print(f"Script location: {script_dir}")
-print(f"Raw data location: {raw_data_dir}\n")
 
 # ============================================================================
 # 1. LOAD SOURCE FILES
 # ============================================================================
 
-print("PHASE 1: LOADING SOURCE FILES")
-print("-" * 80)
-
-try:
-    # TODO: Replace with actual file names when ready
-    # File: Sales_Header.xlsx (contains DOC_NUMBER, CUSTOMER_NUMBER, REP_CODE, TRANS_DATE, TRANS_TYPE_CODE, etc.)
-    sales_header_df = pd.read_excel(raw_data_dir / "Sales Header.xlsx", sheet_name="Sales_Header")
-    print(f"✓ Loaded Sales Header.xlsx: {len(sales_header_df)} records")
-    
-    # TODO: Replace with actual file name
-    # File: Sales_Lines.xlsx (contains DOC_NUMBER, INVENTORY_CODE, QUANTITY, UNIT_SELL_PRICE, UNIT_COST, TOTAL_LINE_PRICE)
-    sales_lines_df = pd.read_excel(raw_data_dir / "Sales Line.xlsx", sheet_name="Sales_Line")
-    print(f"✓ Loaded Sales Lines.xlsx: {len(sales_lines_df)} records")
-    
-    # TODO: Replace with actual file name
-    # File: Trans_Types.xlsx (lookup table: TRANS_TYPE_CODE -> TRANS_TYPE_DESC)
-    trans_types_df = pd.read_excel(raw_data_dir / "Trans Types.xlsx", sheet_name="Trans_Types")
-    print(f"✓ Loaded Trans Types.xlsx: {len(trans_types_df)} records")
-    
-    # TODO: Optional - Product dimensional data for enrichment
-    # File: Products.xlsx (contains INVENTORY_CODE, PRODUCT_NAME, PRODCAT_CODE, etc.)
-    # products_df = pd.read_excel(raw_data_dir / "Products.xlsx", sheet_name="Products")
-    # print(f"✓ Loaded Products.xlsx: {len(products_df)} records")
-    
-    # TODO: Optional - Product Styles for enrichment
-    # File: Product_Styles.xlsx (contains INVENTORY_CODE, GENDER, MATERIAL, STYLE, etc.)
-    # product_styles_df = pd.read_excel(raw_data_dir / "Product Styles.xlsx", sheet_name="Product_Styles")
-    # print(f"✓ Loaded Product Styles.xlsx: {len(product_styles_df)} records")
-    
-    print("\n")
-    
-except FileNotFoundError as e:
-    print(f"✗ FILE NOT FOUND: {e}")
-    print("Make sure all required Excel files are in the raw_data directory")
-    raise
+def extract(raw_data_dir=RAW_DATA_DIR):
+    """Raw frames for the sales build; each workbook is read when a stage first uses it."""
+    print("PHASE 1: LOADING SOURCE FILES")
+    print("-" * 80)
+    print(f"Raw data location: {raw_data_dir} (files load on first use)\n")
+    return RawFrames(raw_data_dir, SOURCES, cleaners=CHUNK_CLEANERS)
 
 
 # ============================================================================
 # 2. STANDARDIZE & CLEAN DATA
 # ============================================================================
 
-print("PHASE 2: DATA STANDARDIZATION & CLEANING")
-print("-" * 80)
-
-# TODO: Standardize column names across all dataframes
-for df_name, df in [
-    ("sales_header_df", sales_header_df),
-    ("sales_lines_df", sales_lines_df),
-    ("trans_types_df", trans_types_df)
-]:
-    df.columns = df.columns.str.strip().str.upper()
-    print(f"✓ Standardized columns in {df_name}")
-
-print()
-
-# TODO: Sales Header data cleaning
-# DOC_NUMBER: Primary key - should be string
-sales_header_df["DOC_NUMBER"] = sales_header_df["DOC_NUMBER"].astype(str).str.strip()
-print(f"✓ Standardized DOC_NUMBER format")
-
-# CUSTOMER_NUMBER: Should be string
-sales_header_df["CUSTOMER_NUMBER"] = sales_header_df["CUSTOMER_NUMBER"].astype(str).str.strip()
-print(f"✓ Standardized CUSTOMER_NUMBER format")
-
-# TRANS_DATE: Convert to datetime
-sales_header_df["TRANS_DATE"] = pd.to_datetime(sales_header_df["TRANS_DATE"], errors="coerce")
-print(f"✓ Converted TRANS_DATE to datetime")
-
-# TODO: Generate FIN_PERIOD from TRANS_DATE if not already present
-if "FIN_PERIOD" not in sales_header_df.columns and "TRANS_DATE" in sales_header_df.columns:
-    sales_header_df["FIN_PERIOD"] = sales_header_df["TRANS_DATE"].dt.strftime("%Y%m").astype(int)
-    print(f"✓ Generated FIN_PERIOD from TRANS_DATE")
-
-# TODO: Handle missing REP_CODE (fill with default or keep null)
-if "REP_CODE" in sales_header_df.columns:
-    sales_header_df["REP_CODE"] = sales_header_df["REP_CODE"].astype(str).str.strip()
-    print(f"✓ Standardized REP_CODE format")
+def clean_header_chunk(sales_header_df):
+    """Row-wise Sales Header cleaning; applied to each chunk while the workbook streams."""
+    sales_header_df = sales_header_df.set_axis(sales_header_df.columns.str.strip().str.upper(), axis=1)
+
+    # DOC_NUMBER: Primary key - should be string
+    sales_header_df["DOC_NUMBER"] = sales_header_df["DOC_NUMBER"].astype(str).str.strip()
+
+    # TRANS_DATE: Convert to datetime
+    sales_header_df["TRANS_DATE"] = pd.to_datetime(sales_header_df["TRANS_DATE"], errors="coerce")
+
+    # Generate FIN_PERIOD from TRANS_DATE if not already present (financial months end on the last Friday)
+    if "FIN_PERIOD" not in sales_header_df.columns and "TRANS_DATE" in sales_header_df.columns:
+        sales_header_df["FIN_PERIOD"] = fin_periods(sales_header_df["TRANS_DATE"])
+
+    # TODO: Handle missing REP_CODE (fill with default or keep null)
+    if "REP_CODE" in sales_header_df.columns:
+        sales_header_df["REP_CODE"] = sales_header_df["REP_CODE"].astype(str).str.strip()
+    return sales_header_df
+
+
+def clean_lines_chunk(sales_lines_df):
+    """Row-wise Sales Lines cleaning; applied to each chunk while the workbook streams."""
+    sales_lines_df = sales_lines_df.set_axis(sales_lines_df.columns.str.strip().str.upper(), axis=1)
+
+    # DOC_NUMBER: Link to header
+    sales_lines_df["DOC_NUMBER"] = sales_lines_df["DOC_NUMBER"].astype(str).str.strip()
+
+    # INVENTORY_CODE: Product identifier
+    sales_lines_df["INVENTORY_CODE"] = sales_lines_df["INVENTORY_CODE"].astype(str).str.strip()
+
+    # Numeric conversions: QUANTITY, UNIT_SELL_PRICE, UNIT_COST, TOTAL_LINE_PRICE
+    for col in ["QUANTITY", "UNIT_SELL_PRICE", "UNIT_COST", "TOTAL_LINE_PRICE"]:
+        if col in sales_lines_df.columns:
+            sales_lines_df[col] = pd.to_numeric(sales_lines_df[col], errors="coerce")
+    return sales_lines_df
+
+
+# row-wise cleaning that runs per chunk as the workbooks stream in (see RawFrames)
+CHUNK_CLEANERS = {
+    "sales_header": clean_header_chunk,
+    "sales_lines": clean_lines_chunk,
+}
 
-# Remove duplicates from header
-initial_count = len(sales_header_df)
-sales_header_df = sales_header_df.drop_duplicates(subset=["DOC_NUMBER"])
-print(f"✓ Removed duplicate headers: {initial_count} -> {len(sales_header_df)} records\n")
 
-# TODO: Sales Lines data cleaning
-# DOC_NUMBER: Link to header
-sales_lines_df["DOC_NUMBER"] = sales_lines_df["DOC_NUMBER"].astype(str).str.strip()
-print(f"✓ Standardized Sales Lines DOC_NUMBER")
+@phase("standardize")
+def standardize(frames, keys):
+    print("PHASE 2: DATA STANDARDIZATION & CLEANING")
+    print("-" * 80)
+
+    # column names, DOC_NUMBER / REP_CODE / INVENTORY_CODE text, TRANS_DATE and the
+    # line amounts are cleaned chunk by chunk; duplicates and keys need whole frames
+    sales_header_df = cleaned_frame(frames, "sales_header", clean_header_chunk)
+    sales_lines_df = cleaned_frame(frames, "sales_lines", clean_lines_chunk)
+    trans_types_df = frames["trans_types"]
+    trans_types_df.columns = trans_types_df.columns.str.strip().str.upper()
+    for df_name in ["sales_header_df", "sales_lines_df", "trans_types_df"]:
+        print(f"✓ Standardized columns in {df_name}")
+
+    print()
+    print(f"✓ Standardized DOC_NUMBER format")
+
+    # CUSTOMER_NUMBER: normalised once per distinct code into the shared int32 surrogate key
+    sales_header_df["CUSTOMER_KEY"] = keys.encode(sales_header_df["CUSTOMER_NUMBER"])
+    sales_header_df = sales_header_df.drop(columns="CUSTOMER_NUMBER")
+    print(f"✓ Standardized CUSTOMER_NUMBER format")
+    print(f"✓ Converted TRANS_DATE to datetime")
+    print(f"✓ Standardized REP_CODE format")
+
+    # Remove duplicates from header
+    initial_count = len(sales_header_df)
+    sales_header_df = sales_header_df.drop_duplicates(subset=["DOC_NUMBER"])
+    print(f"✓ Removed duplicate headers: {initial_count} -> {len(sales_header_df)} records\n")
 
-# INVENTORY_CODE: Product identifier
-sales_lines_df["INVENTORY_CODE"] = sales_lines_df["INVENTORY_CODE"].astype(str).str.strip()
-print(f"✓ Standardized INVENTORY_CODE format")
+    print(f"✓ Standardized Sales Lines DOC_NUMBER")
+    print(f"✓ Standardized INVENTORY_CODE format")
+    print(f"✓ Converted line amounts to numeric")
 
-# Numeric conversions: QUANTITY, UNIT_SELL_PRICE, UNIT_COST, TOTAL_LINE_PRICE
-numeric_cols_lines = ["QUANTITY", "UNIT_SELL_PRICE", "UNIT_COST", "TOTAL_LINE_PRICE"]
-for col in numeric_cols_lines:
-    if col in sales_lines_df.columns:
-        sales_lines_df[col] = pd.to_numeric(sales_lines_df[col], errors="coerce")
-        print(f"✓ Converted {col} to numeric")
+    # Remove duplicates from lines
+    initial_count = len(sales_lines_df)
+    sales_lines_df = sales_lines_df.drop_duplicates()
+    print(f"✓ Removed duplicate lines: {initial_count} -> {len(sales_lines_df)} records\n")
 
-# Remove duplicates from lines
-initial_count = len(sales_lines_df)
-sales_lines_df = sales_lines_df.drop_duplicates()
-print(f"✓ Removed duplicate lines: {initial_count} -> {len(sales_lines_df)} records\n")
+    return sales_header_df, sales_lines_df, trans_types_df
 
 
 # ============================================================================
 # 3. VALIDATE FOREIGN KEYS
 # ============================================================================
 
-print("PHASE 3: FOREIGN KEY VALIDATION")
-print("-" * 80)
-
-# TODO: Check if all DOC_NUMBER in sales_lines exist in sales_header
-valid_doc_numbers = set(sales_header_df["DOC_NUMBER"].unique())
-lines_with_invalid_doc = sales_lines_df[~sales_lines_df["DOC_NUMBER"].isin(valid_doc_numbers)]
-if len(lines_with_invalid_doc) > 0:
-    print(f"⚠ WARNING: {len(lines_with_invalid_doc)} sales lines have invalid DOC_NUMBER")
-    print("  Action: Removing orphaned sales lines")
-    sales_lines_df = sales_lines_df[sales_lines_df["DOC_NUMBER"].isin(valid_doc_numbers)]
-else:
-    print(f"✓ All sales lines link to valid sales headers")
-
-# TODO: Check if all TRANS_TYPE_CODE values exist in lookup table
-if "TRANS_TYPE_CODE" in sales_header_df.columns and "TRANS_TYPE_CODE" in trans_types_df.columns:
-    valid_trans_types = set(trans_types_df["TRANS_TYPE_CODE"].unique())
-    headers_with_invalid_type = sales_header_df[~sales_header_df["TRANS_TYPE_CODE"].isin(valid_trans_types)]
-    if len(headers_with_invalid_type) > 0:
-        print(f"⚠ WARNING: {len(headers_with_invalid_type)} sales headers have invalid TRANS_TYPE_CODE")
-        print("  Action: Removing records with invalid TRANS_TYPE_CODE")
-        sales_header_df = sales_header_df[sales_header_df["TRANS_TYPE_CODE"].isin(valid_trans_types)]
-    else:
-        print(f"✓ All TRANS_TYPE_CODE values are valid")
-
-print()
+@phase("validate_foreign_keys")
+def validate_foreign_keys(sales_header_df, sales_lines_df, trans_types_df):
+    print("PHASE 3: FOREIGN KEY VALIDATION")
+    print("-" * 80)
+
+    # TRANS_TYPE_CODE must exist in the lookup table (when both sides carry it)
+    header_keys = []
+    if "TRANS_TYPE_CODE" in sales_header_df.columns and "TRANS_TYPE_CODE" in trans_types_df.columns:
+        header_keys.append(ForeignKey("unknown_trans_type_code", "TRANS_TYPE_CODE", "trans_types"))
+    headers = check_foreign_keys("sales_header", sales_header_df, header_keys, {"trans_types": trans_types_df})
+    print_report(headers, "sales headers")
+
+    # every DOC_NUMBER in sales_lines must exist in the (validated) sales_header
+    lines = check_foreign_keys(
+        "sales_lines", sales_lines_df,
+        [ForeignKey("orphan_doc_number", "DOC_NUMBER", "sales_header")],
+        {"sales_header": headers.valid},
+    )
+    print_report(lines, "sales lines")
+
+    print()
+    return headers.valid, lines.valid
+
+
+@phase("select_changed_periods")
+def select_changed_periods(sales_header_df, sales_lines_df, state, rep_dimension=None, product_dimension=None):
+    """Incremental runs: keep only the FIN_PERIODs that are new or restated since the last export."""
+    print("PHASE 3b: INCREMENTAL PERIOD SELECTION")
+    print("-" * 80)
+
+    # a line belongs to its header's period, so a changed line restates that period
+    header_periods = period_keys(sales_header_df["FIN_PERIOD"])
+    line_periods = period_keys(sales_lines_df["DOC_NUMBER"].map(
+        pd.Series(sales_header_df["FIN_PERIOD"].to_numpy(), index=sales_header_df["DOC_NUMBER"].to_numpy())
+    ))
+    fingerprints = combine_fingerprints(
+        period_fingerprints(sales_header_df, periods=header_periods),
+        period_fingerprints(sales_lines_df, periods=line_periods),
+    )
+    # every period embeds the representatives and product attributes, so a change there rebuilds everything
+    dimensions = {"representatives": rep_dimension, "products": product_dimension}
+    sources = {name: frame_fingerprint(df) for name, df in dimensions.items() if df is not None} or None
+    changed = state.changed_periods(fingerprints, sources)
+    state.stage(fingerprints, sources)
+
+    print(f"✓ {state.summary(changed)}")
+    if sources and state.sources_changed(sources) and not state.is_first_run:
+        print(f"  {', '.join(state.sources_changed(sources))} changed: rebuilding all periods")
+    vanished = state.vanished_periods(fingerprints)
+    if vanished:
+        print(f"⚠ WARNING: {len(vanished)} previously exported period(s) have no source rows: {vanished[:10]}")
+
+    sales_header_df = sales_header_df[header_periods.isin(changed).to_numpy()]
+    sales_lines_df = sales_lines_df[line_periods.isin(changed).to_numpy()]
+    print(f"✓ Selected {len(sales_header_df)} headers and {len(sales_lines_df)} lines\n")
+    return sales_header_df, sales_lines_df
 
 
 # ============================================================================
 # 4. BUILD LOOKUP DICTIONARIES
 # ============================================================================
 
-print("PHASE 4: BUILDING LOOKUP DICTIONARIES")
-print("-" * 80)
-
-# TODO: Create dictionary mapping TRANS_TYPE_CODE -> {TRANS_TYPE_CODE, TRANS_TYPE_DESC}
-trans_types_lookup = {}
-if "TRANS_TYPE_CODE" in trans_types_df.columns:
-    for _, row in trans_types_df.iterrows():
-        trans_code = row["TRANS_TYPE_CODE"]
-        trans_types_lookup[trans_code] = {
-            "trans_type_code": trans_code,
-            "trans_type_desc": row.get("TRANS_TYPE_DESC", "Unknown")
-        }
-    print(f"✓ Built TRANS_TYPE_CODE lookup: {len(trans_types_lookup)} entries")
+@phase("build_trans_types_lookup")
+def build_trans_types_lookup(trans_types_df):
+    print("PHASE 4: BUILDING LOOKUP DICTIONARIES")
+    print("-" * 80)
+
+    # TODO: Create dictionary mapping TRANS_TYPE_CODE -> {TRANS_TYPE_CODE, TRANS_TYPE_DESC}
+    trans_types_lookup = {}
+    if "TRANS_TYPE_CODE" in trans_types_df.columns:
+        for _, row in trans_types_df.iterrows():
+            trans_code = row["TRANS_TYPE_CODE"]
+            trans_types_lookup[trans_code] = {
+                "trans_type_code": trans_code,
+                "trans_type_desc": row.get("TRANS_TYPE_DESC", "Unknown")
+            }
+        print(f"✓ Built TRANS_TYPE_CODE lookup: {len(trans_types_lookup)} entries")
 
-print()
+    print()
+    return trans_types_lookup
 
 
 # ============================================================================
 # 5. AGGREGATE SALES LINES BY DOCUMENT
 # ============================================================================
 
-print("PHASE 5: AGGREGATING SALES LINES BY DOCUMENT")
-print("-" * 80)
-
-# TODO: Group sales lines by DOC_NUMBER and create nested array of line items
-# This creates the line_items array that will be embedded in each sales document
-sales_lines_grouped = {}
-
-for doc_number in sales_lines_df["DOC_NUMBER"].unique():
-    doc_lines = sales_lines_df[sales_lines_df["DOC_NUMBER"] == doc_number]
-    
-    line_items = []
-    for _, line in doc_lines.iterrows():
-        # TODO: Calculate profit for each line (TOTAL_LINE_PRICE - (QUANTITY * UNIT_COST))
-        quantity = line.get("QUANTITY", 0)
-        unit_cost = line.get("UNIT_COST", 0)
-        total_line_price = line.get("TOTAL_LINE_PRICE", 0)
-        
-        # Profit calculation: revenue - cost
-        profit = total_line_price - (quantity * unit_cost)
-        
-        line_item = {
-            "inventory_code": line.get("INVENTORY_CODE"),
-            "quantity": int(quantity) if pd.notna(quantity) else 0,
-            "unit_sell_price": float(line.get("UNIT_SELL_PRICE", 0.0)) if pd.notna(line.get("UNIT_SELL_PRICE")) else 0.0,
-            "unit_cost": float(unit_cost) if pd.notna(unit_cost) else 0.0,
-            "total_line_price": float(total_line_price) if pd.notna(total_line_price) else 0.0,
-            "profit": float(profit)
-        }
-        
-        # TODO: (OPTIONAL) Embed product dimensions if available
-        # This would add fields like GENDER, MATERIAL, STYLE, PRODUCT_CATEGORY, etc.
-        # if products_df is not None and product_styles_df is not None:
-        #     product_info = products_df[products_df["INVENTORY_CODE"] == line.get("INVENTORY_CODE")]
-        #     if len(product_info) > 0:
-        #         line_item["product_name"] = product_info.iloc[0].get("PRODUCT_NAME")
-        #         line_item["product_category"] = product_info.iloc[0].get("PRODCAT_CODE")
-        
-        line_items.append(line_item)
-    
-    sales_lines_grouped[doc_number] = line_items
-
-print(f"✓ Aggregated {len(sales_lines_grouped)} sales documents\n")
+def _column(df, name, default):
+    if name in df.columns:
+        return df[name]
+    return pd.Series([default] * len(df), index=df.index, dtype=object if default is None else None)
+
+
+@phase("build_line_items")
+def build_line_items(sales_lines_df, product_dimension=None):
+    """Nest the sales lines by DOC_NUMBER and aggregate their per-document totals.
+
+    With a product dimension every line also carries its product's attributes.
+    """
+    print("PHASE 5: AGGREGATING SALES LINES BY DOCUMENT")
+    print("-" * 80)
+
+    # Group sales lines by DOC_NUMBER and create nested array of line items
+    # This creates the line_items array that will be embedded in each sales document.
+    # All per-line maths and NaN defaults run column-wise, then the lines are grouped
+    # by DOC_NUMBER with a single stable sort (see columnar.nest_records).
+    # widened to int64/float64 first: the dtype planner may have narrowed the loaded columns
+    quantity = widen(_column(sales_lines_df, "QUANTITY", 0))
+    unit_sell_price = widen(_column(sales_lines_df, "UNIT_SELL_PRICE", 0.0))
+    unit_cost = widen(_column(sales_lines_df, "UNIT_COST", 0))
+    total_line_price = widen(_column(sales_lines_df, "TOTAL_LINE_PRICE", 0))
+
+    # Profit calculation: revenue - cost (TOTAL_LINE_PRICE - (QUANTITY * UNIT_COST))
+    profit = total_line_price - (quantity * unit_cost)
+
+    # Product attributes (category, brand, range, style, ...) for every line in one
+    # hashed join on INVENTORY_CODE, so they nest with the other line columns
+    inventory_code = _column(sales_lines_df, "INVENTORY_CODE", None)
+    attributes = product_attributes(inventory_code, product_dimension) if product_dimension is not None else {}
+
+    sales_lines_grouped = nest_records(sales_lines_df["DOC_NUMBER"], {
+        "inventory_code": inventory_code,
+        "quantity": quantity.fillna(0).astype("int64"),
+        "unit_sell_price": unit_sell_price.fillna(0.0).astype("float64"),
+        "unit_cost": unit_cost.fillna(0.0).astype("float64"),
+        "total_line_price": total_line_price.fillna(0.0).astype("float64"),
+        "profit": profit.astype("float64"),
+        **attributes,
+    })
+
+    # Header totals: one grouped aggregate over the coerced line columns
+    line_totals = (
+        pd.DataFrame({
+            "DOC_NUMBER": sales_lines_df["DOC_NUMBER"],
+            "TOTAL_REVENUE": total_line_price.fillna(0.0).astype("float64"),
+            "TOTAL_COST": quantity.fillna(0).astype("int64") * unit_cost.fillna(0.0).astype("float64"),
+            "TOTAL_PROFIT": profit.astype("float64"),
+            "PROFIT_IS_NAN": profit.isna(),
+            "LINE_COUNT": 1,
+        })
+        .groupby("DOC_NUMBER", sort=False, observed=True)
+        .agg({"TOTAL_REVENUE": "sum", "TOTAL_COST": "sum", "TOTAL_PROFIT": "sum",
+              "PROFIT_IS_NAN": "any", "LINE_COUNT": "sum"})
+    )
+    # a NaN line profit makes the document's total_profit NaN, as summing the line items did
+    line_totals.loc[line_totals["PROFIT_IS_NAN"], "TOTAL_PROFIT"] = float("nan")
+    line_totals = line_totals.drop(columns="PROFIT_IS_NAN")
+
+    print(f"✓ Aggregated {len(sales_lines_grouped)} sales documents\n")
+    return sales_lines_grouped, line_totals
 
 
 # ============================================================================
 # 6. BUILD SALES COLLECTION DOCUMENTS
 # ============================================================================
 
-print("PHASE 6: BUILDING SALES DOCUMENTS")
-print("-" * 80)
-
-sales_collection = []
-
-for _, header_row in sales_header_df.iterrows():
-    doc_number = header_row["DOC_NUMBER"]
-    trans_type_code = header_row.get("TRANS_TYPE_CODE")
-    
-    # TODO: Lookup transaction type description
-    trans_type_obj = trans_types_lookup.get(trans_type_code, {})
-    
-    # TODO: Get aggregated line items for this document
-    line_items = sales_lines_grouped.get(doc_number, [])
-    
-    # TODO: Calculate totals from line items
-    total_revenue = sum(item.get("total_line_price", 0) for item in line_items)
-    total_cost = sum(item.get("quantity", 0) * item.get("unit_cost", 0) for item in line_items)
-    total_profit = sum(item.get("profit", 0) for item in line_items)
-    
-    # TODO: Build the complete SALES document
-    doc = {
-        "_id": doc_number,
-        "trans_type_code": trans_type_code,
-        "trans_type_desc": trans_type_obj.get("trans_type_desc", "Unknown"),
-        "customer_number": header_row.get("CUSTOMER_NUMBER"),
-        "rep_code": header_row.get("REP_CODE"),
-        "trans_date": header_row.get("TRANS_DATE").isoformat() if pd.notna(header_row.get("TRANS_DATE")) else None,
-        "fin_period": str(int(header_row.get("FIN_PERIOD"))) if pd.notna(header_row.get("FIN_PERIOD")) else None,
-        "total_revenue": float(total_revenue),
-        "total_cost": float(total_cost),
-        "total_profit": float(total_profit),
-        "line_items": line_items
-    }
-    
-    sales_collection.append(doc)
-
-print(f"✓ Built {len(sales_collection)} SALES documents\n")
+@phase("build_documents")
+def build_documents(sales_header_df, sales_lines_grouped, line_totals, trans_types_lookup, keys, rep_dimension=None):
+    """Join the line totals onto the headers; return that frame and a document generator."""
+    print("PHASE 6: BUILDING SALES DOCUMENTS")
+    print("-" * 80)
+
+    # Header totals joined onto the header frame (headers without lines get zero totals)
+    sales_header_df = sales_header_df.merge(line_totals, left_on="DOC_NUMBER", right_index=True, how="left")
+    sales_header_df[["TOTAL_REVENUE", "TOTAL_COST"]] = sales_header_df[["TOTAL_REVENUE", "TOTAL_COST"]].fillna(0.0)
+    sales_header_df["TOTAL_PROFIT"] = sales_header_df["TOTAL_PROFIT"].where(
+        sales_header_df["LINE_COUNT"].notna(), 0.0
+    )
+    sales_header_df["LINE_COUNT"] = sales_header_df["LINE_COUNT"].fillna(0).astype("int64")
+
+    # Lookup transaction type descriptions for the whole column at once
+    trans_type_code = _column(sales_header_df, "TRANS_TYPE_CODE", None)
+    trans_type_desc = trans_type_code.map(
+        {code: entry["trans_type_desc"] for code, entry in trans_types_lookup.items()}
+    ).where(lambda desc: trans_type_code.isin(trans_types_lookup.keys()), "Unknown")
+
+    fin_period = _column(sales_header_df, "FIN_PERIOD", None)
+    fin_period = fin_period.astype("Int64").astype(str).where(fin_period.notna(), None)
+
+    # REP_CODE -> representative attributes, one hashed join for the whole column
+    rep_codes = _column(sales_header_df, "REP_CODE", None)
+    representatives = (
+        embed_representatives(rep_codes, rep_dimension)
+        if rep_dimension is not None else [{} for _ in range(len(sales_header_df))]
+    )
+
+    # Build the complete SALES documents from column arrays. This is a generator:
+    # documents are produced one at a time while load() streams them to disk.
+    sales_collection = (
+        {
+            "_id": doc_number,
+            "trans_type_code": code,
+            "trans_type_desc": desc,
+            "customer_number": customer_number,
+            "rep_code": rep_code,
+            "representative": representative,
+            "trans_date": trans_date,
+            "fin_period": period,
+            "total_revenue": total_revenue,
+            "total_cost": total_cost,
+            "total_profit": total_profit,
+            "line_items": sales_lines_grouped.get(doc_number, []),
+        }
+        for doc_number, code, desc, customer_number, rep_code, representative, trans_date, period,
+            total_revenue, total_cost, total_profit in zip(
+            sales_header_df["DOC_NUMBER"].tolist(),
+            trans_type_code.tolist(),
+            trans_type_desc.tolist(),
+            keys.decode(sales_header_df["CUSTOMER_KEY"]).tolist(),
+            rep_codes.tolist(),
+            representatives,
+            isoformat_column(_column(sales_header_df, "TRANS_DATE", None)),
+            fin_period.tolist(),
+            sales_header_df["TOTAL_REVENUE"].tolist(),
+            sales_header_df["TOTAL_COST"].tolist(),
+            sales_header_df["TOTAL_PROFIT"].tolist(),
+        )
+    )
+
+    print(f"✓ Prepared {len(sales_header_df)} SALES documents for streaming export\n")
+    return sales_header_df, sales_collection
 
 
 # ============================================================================
 # 7. DATA QUALITY CHECKS
 # ============================================================================
 
-print("PHASE 7: DATA QUALITY VALIDATION")
-print("-" * 80)
+@phase("quality_checks")
+def quality_checks(sales_header_df):
+    print("PHASE 7: DATA QUALITY VALIDATION")
+    print("-" * 80)
+
+    # All checks come from the header frame in one vectorised pass
+    quality_flags = pd.DataFrame({
+        "no_lines": sales_header_df["LINE_COUNT"] == 0,
+        "missing_customer": sales_header_df["CUSTOMER_KEY"] == MISSING_KEY,
+        "missing_trans_date": _column(sales_header_df, "TRANS_DATE", None).isna(),
+    }).sum()
+    amount_columns = ["TOTAL_REVENUE", "TOTAL_COST", "TOTAL_PROFIT"]
+    amount_stats = sales_header_df[amount_columns].agg(["min", "max", "mean"])
+    # skipna=False: a NaN document total shows up in the grand total, as before
+    amount_stats.loc["sum"] = sales_header_df[amount_columns].sum(skipna=False)
+
+    print(f"Documents with no line items: {quality_flags['no_lines']}")
+    print(f"Documents with missing customer_number: {quality_flags['missing_customer']}")
+    print(f"Documents with missing trans_date: {quality_flags['missing_trans_date']}")
+
+    print(f"\nRevenue range: {amount_stats.at['min', 'TOTAL_REVENUE']:.2f} - {amount_stats.at['max', 'TOTAL_REVENUE']:.2f}")
+    print(f"Average revenue: {amount_stats.at['mean', 'TOTAL_REVENUE']:.2f}")
+    print(f"Total revenue: {amount_stats.at['sum', 'TOTAL_REVENUE']:.2f}")
+
+    print(f"\nTotal cost: {amount_stats.at['sum', 'TOTAL_COST']:.2f}")
+    print(f"Total profit: {amount_stats.at['sum', 'TOTAL_PROFIT']:.2f}")
+
+    print()
+    return quality_flags, amount_stats
+
+
+def transform(frames, state=None, keys=None):
+    """Phases 2-7: raw frames -> (header frame with totals, SALES document generator).
+
+    With a PeriodState only the documents of new or restated periods are built.
+    keys is the shared customer KeyDictionary (an in-memory one when not given).
+    """
+    keys = keys if keys is not None else KeyDictionary()
+    sales_header_df, sales_lines_df, trans_types_df = standardize(frames, keys)
+    sales_header_df, sales_lines_df = validate_foreign_keys(sales_header_df, sales_lines_df, trans_types_df)
+    rep_dimension = build_rep_dimension(frames["representatives"])
+    product_dimension = build_product_dimension(
+        frames["products"], frames["product_styles"], frames["product_categories"],
+        frames["product_brands"], frames["product_ranges"],
+    )
+    if state is not None:
+        sales_header_df, sales_lines_df = select_changed_periods(
+            sales_header_df, sales_lines_df, state, rep_dimension, product_dimension
+        )
+    trans_types_lookup = build_trans_types_lookup(trans_types_df)
+    sales_lines_grouped, line_totals = build_line_items(sales_lines_df, product_dimension)
+    sales_header_df, sales_collection = build_documents(
+        sales_header_df, sales_lines_grouped, line_totals, trans_types_lookup, keys, rep_dimension
+    )
+    quality_checks(sales_header_df)
+    return sales_header_df, sales_collection
 
-# TODO: Check for documents with no line items
-docs_no_lines = sum(1 for doc in sales_collection if not doc.get("line_items", []))
-print(f"Documents with no line items: {docs_no_lines}")
 
-# TODO: Check for missing key fields
-missing_customer = sum(1 for doc in sales_collection if not doc.get("customer_number"))
-print(f"Documents with missing customer_number: {missing_customer}")
-
-missing_trans_date = sum(1 for doc in sales_collection if not doc.get("trans_date"))
-print(f"Documents with missing trans_date: {missing_trans_date}")
-
-# TODO: Revenue and cost distribution checks
-revenues = [doc.get("total_revenue", 0) for doc in sales_collection]
-costs = [doc.get("total_cost", 0) for doc in sales_collection]
-profits = [doc.get("total_profit", 0) for doc in sales_collection]
-
-print(f"\nRevenue range: {min(revenues):.2f} - {max(revenues):.2f}")
-print(f"Average revenue: {sum(revenues) / len(revenues):.2f}")
-print(f"Total revenue: {sum(revenues):.2f}")
-
-print(f"\nTotal cost: {sum(costs):.2f}")
-print(f"Total profit: {sum(profits):.2f}")
+# ============================================================================
+# 8. EXPORT TO NDJSON
+# ============================================================================
 
-print()
+@phase("load", rows_out=lambda result: result[0].documents)
+def load(sales_collection, output_dir=OUTPUT_DIR, n_samples=4, name="sales_collection"):
+    """Stream the documents to <name>.ndjson; returns the writer and a few samples."""
+    print("PHASE 8: EXPORTING TO NDJSON")
+    print("-" * 80)
 
+    output_file = collection_path(output_dir, name)
+    samples = []
 
-# ============================================================================
-# 8. EXPORT TO JSON
-# ============================================================================
+    try:
+        with CollectionWriter(output_file) as writer:
+            for doc in sales_collection:
+                writer.write(doc)
+                if len(samples) < n_samples:
+                    samples.append(doc)
 
-print("PHASE 8: EXPORTING TO JSON")
-print("-" * 80)
+        print(f"✓ Successfully exported to: {output_file}")
+        print(f"  Total documents: {writer.documents}")
+        print(f"  Bytes written: {writer.bytes_written / 1024:.2f} KB")
+        print(f"  File size: {writer.bytes_on_disk / 1024:.2f} KB\n")
 
-output_file = raw_data_dir.parent / "sales_collection.json"
+    except Exception as e:
+        print(f"✗ Export failed: {e}\n")
+        raise
 
-try:
-    with open(output_file, "w") as f:
-        json.dump(sales_collection, f, indent=2)
-    
-    file_size_kb = output_file.stat().st_size / 1024
-    print(f"✓ Successfully exported to: {output_file}")
-    print(f"  Total documents: {len(sales_collection)}")
-    print(f"  File size: {file_size_kb:.2f} KB\n")
-    
-except Exception as e:
-    print(f"✗ Export failed: {e}\n")
-    raise
+    return writer, samples
 
 
 # ============================================================================
 # 9. SAMPLE OUTPUT & VERIFICATION
 # ============================================================================
 
-print("PHASE 9: SAMPLE OUTPUT")
-print("-" * 80)
-
-if sales_collection:
-    print("\nSample SALES document:")
-    print(json.dumps(sales_collection[0], indent=2))
-    
-    print("\n\nAdditional samples (if available):")
-    # TODO: Show a few more examples
-    for i in [1, 2, 3]:
-        if i < len(sales_collection):
-            print(f"\nSample {i + 1}:")
-            print(json.dumps(sales_collection[i], indent=2))
-
-print("\n" + "="*80)
-print("✓ SALES COLLECTION ETL COMPLETE")
-print("="*80 + "\n")
\ No newline at end of file
+def print_samples(samples):
+    print("PHASE 9: SAMPLE OUTPUT")
+    print("-" * 80)
+
+    if samples:
+        print("\nSample SALES document:")
+        print(json.dumps(samples[0], indent=2))
+
+        print("\n\nAdditional samples (if available):")
+        # TODO: Show a few more examples
+        for i in [1, 2, 3]:
+            if i < len(samples):
+                print(f"\nSample {i + 1}:")
+                print(json.dumps(samples[i], indent=2))
+
+
+def main(raw_data_dir=RAW_DATA_DIR, output_dir=OUTPUT_DIR, incremental=False):
+    """Full export to sales_collection (and sales_rollup), or with incremental=True only the
+    changed periods' documents to sales_collection_delta / sales_rollup_delta (for the loaders to upsert)."""
+    print("\n" + "="*80)
+    print("SALES COLLECTION ETL - INITIALIZATION")
+    print("="*80 + "\n")
+
+    name = "sales_collection_delta" if incremental else "sales_collection"
+    keys = KeyDictionary.load(Path(output_dir) / STATE_DIR_NAME, CUSTOMER_KEYS)
+    with RunMetrics(name, output_dir) as run, RejectLog(name, output_dir, keys):
+        state = PeriodState.load(Path(output_dir) / STATE_DIR_NAME, "sales_collection") if incremental else None
+        frames = extract(raw_data_dir)
+        sales_header_df, sales_collection = transform(frames, state, keys)
+        writer, samples = load(sales_collection, output_dir, name=name)
+        load_rollup(build_sales_rollup(sales_header_df, keys), output_dir,
+                    f"{SALES_ROLLUP}_delta" if incremental else SALES_ROLLUP)
+        if state is not None:
+            state.commit()
+    print_samples(samples)
+    print("\n" + run.report())
+
+    print("\n" + "="*80)
+    print("✓ SALES COLLECTION ETL COMPLETE")
+    print("="*80 + "\n")
+    return writer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the SALES collection export")
+    parser.add_argument("--incremental", action="store_true",
+                        help="export only new or restated FIN_PERIODs to sales_collection_delta")
+    main(incremental=parser.parse_args().incremental)
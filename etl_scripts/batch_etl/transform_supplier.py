@@ -4,9 +4,20 @@ import logging
 import pandas as pd
 from datetime import datetime, timedelta
 import os # Import the os module
+import sys
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+if __package__ in (None, ""):
+    # allow running this file directly: python etl_scripts/batch_etl/transform_supplier.py
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from pathlib import Path
+from etl_scripts.batch_etl.collection_writer import collection_path, write_collection
+from etl_scripts.batch_etl.columnar import nest_records
+from etl_scripts.batch_etl.dtype_planner import widen
+from etl_scripts.batch_etl.fin_calendar import fin_periods
+from etl_scripts.batch_etl.foreign_keys import ForeignKey, RejectLog, check_foreign_keys
+from etl_scripts.batch_etl.ingest import RawFrames, read_excel_cached
+from etl_scripts.batch_etl.instrumentation import RunMetrics, phase
 
 # Get the directory of the current script file
 # This is the directory: C:\clearvue-bi-system\etl_scripts\batch_etl\
@@ -16,6 +27,16 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # We want to go from ...\batch_etl\ to ...\raw_data\
 RAW_DATA_PATH = os.path.join(SCRIPT_DIR, '..', '..', 'raw_data')
 
+# Define the output directory (e.g., in a new 'clean_data' folder)
+OUTPUT_DIR = Path(SCRIPT_DIR) / '..' / '..' / 'clean_data'
+
+# Source workbooks (first sheet of each), read as-is when a step first needs them
+SOURCES = {
+    'suppliers': ('Suppliers.xlsx', 0),
+    'headers': ('Purchases Headers.xlsx', 0),
+    'lines': ('Purchases Lines.xlsx', 0),
+}
+
 # 💡 FIX: Helper function to clean supplier descriptions MUST be defined here
 # C:\clearvue-bi-system\etl_scripts\batch_etl\transform_supplier.py (FINAL clean_supplier_desc)
 
@@ -48,150 +69,188 @@ def clean_supplier_desc(desc):
 # --------------------------------------------------------------------------------
 
 # Step 1: Extract - Load Excel files from raw_data/
-try:
-    # Use os.path.join to build the final, correct, absolute file path
-    suppliers_path = os.path.join(RAW_DATA_PATH, 'Suppliers.xlsx')
-    headers_path = os.path.join(RAW_DATA_PATH, 'Purchases Headers.xlsx')
-    lines_path = os.path.join(RAW_DATA_PATH, 'Purchases Lines.xlsx')
-    
-    suppliers_df = pd.read_excel(suppliers_path)
-    headers_df = pd.read_excel(headers_path)
-    lines_df = pd.read_excel(lines_path)
-    logging.info("Successfully loaded Excel files")
-except FileNotFoundError as e:
-    logging.error(f"File not found: {e}")
-    raise
-except Exception as e:
-    logging.error(f"Error loading Excel files: {e}")
-    raise
+def extract(raw_data_path=RAW_DATA_PATH):
+    """Lazy raw frames: each workbook is loaded the first time a step indexes it."""
+    return RawFrames(raw_data_path, SOURCES, loader=read_excel_cached)
 
-# Step 2: Transform - Clean Suppliers
-suppliers_df = suppliers_df[suppliers_df['SUPPLIER_CODE'] != "999999"]
-suppliers_df['cleaned_supplier'] = suppliers_df['SUPPLIER_DESC'].apply(clean_supplier_desc)
-suppliers_df['EXCLSV'] = suppliers_df['EXCLSV'].map({'Y': True, 'N': False})
-
-# Create supplier lookup dictionary
-supplier_lookup = {
-    row['SUPPLIER_CODE']: {
-        'supplierID': row['SUPPLIER_CODE'],
-        'name': row['cleaned_supplier']['name'],
-        'excludesVAT': row['EXCLSV'],
-        'paymentTerms': row['NORMAL_PAYTERMS'],
-        'creditLimit': row['CREDIT_LIMIT'],
-        'shipmentDetails': row['cleaned_supplier']['shipmentDetails']
-    } for _, row in suppliers_df.iterrows()
-}
-
-# Step 3: Transform - Clean Purchases Headers
 
-# Convert the column to datetime objects, then format to string YYYY-MM-DD
-#  REQUIRED FIX: Add unit and origin for Excel date compatibility
-# are processed with 'unit' and 'origin', allowing existing datetimes to be coerced.
-headers_df['purchaseDate'] = pd.to_datetime(
-    # Convert to numeric; non-numeric (i.e., existing datetimes) will become NaT momentarily
-    pd.to_numeric(headers_df['PURCH_DATE'], errors='coerce'), 
-    unit='D', 
-    origin='1899-12-30',
-    errors='coerce'
-).dt.strftime('%Y-%m-%d')
+# Step 2: Transform - Clean Suppliers
+@phase("clean_suppliers")
+def clean_suppliers(suppliers_df):
+    """Drop the placeholder supplier and build the SUPPLIER_CODE -> supplier lookup."""
+    suppliers_df = suppliers_df[suppliers_df['SUPPLIER_CODE'] != "999999"].copy()
+    suppliers_df['cleaned_supplier'] = suppliers_df['SUPPLIER_DESC'].apply(clean_supplier_desc)
+    suppliers_df['EXCLSV'] = suppliers_df['EXCLSV'].map({'Y': True, 'N': False})
+
+    # Create supplier lookup dictionary
+    return {
+        row['SUPPLIER_CODE']: {
+            'supplierID': row['SUPPLIER_CODE'],
+            'name': row['cleaned_supplier']['name'],
+            'excludesVAT': row['EXCLSV'],
+            'paymentTerms': row['NORMAL_PAYTERMS'],
+            'creditLimit': row['CREDIT_LIMIT'],
+            'shipmentDetails': row['cleaned_supplier']['shipmentDetails']
+        } for _, row in suppliers_df.iterrows()
+    }
 
 
-# FINANCIAL_PERIOD should be derived from the formatted string
-headers_df['financialPeriod'] = headers_df['purchaseDate'].str.replace("-", "").str[:6]
+# Step 3: Transform - Clean Purchases Headers
+@phase("clean_headers")
+def clean_headers(headers_df, supplier_lookup):
+    headers_df = headers_df.copy()
+
+    # Convert the column to datetime objects, then format to string YYYY-MM-DD
+    #  REQUIRED FIX: Add unit and origin for Excel date compatibility
+    # are processed with 'unit' and 'origin', allowing existing datetimes to be coerced.
+    purchase_dates = pd.to_datetime(
+        # Convert to numeric; non-numeric (i.e., existing datetimes) will become NaT momentarily
+        pd.to_numeric(headers_df['PURCH_DATE'], errors='coerce'), 
+        unit='D', 
+        origin='1899-12-30',
+        errors='coerce'
+    )
+    headers_df['purchaseDate'] = purchase_dates.dt.strftime('%Y-%m-%d')
+
+    # FINANCIAL_PERIOD follows the financial calendar (months end on the last Friday)
+    periods = fin_periods(purchase_dates)
+    headers_df['financialPeriod'] = periods.astype(str).where(periods.notna())
+
+    # Validate SUPPLIER_CODE (kept: unknown suppliers become 'Unknown Supplier' documents)
+    result = check_foreign_keys(
+        'headers', headers_df,
+        [ForeignKey('unknown_supplier_code', 'SUPPLIER_CODE', 'suppliers', reject=False)],
+        {'suppliers': list(supplier_lookup)},
+    )
+    if len(result.rejects):
+        logging.warning(f"Invalid supplier codes found: {result.rejects['SUPPLIER_CODE'].tolist()}")
+    return headers_df
 
-# Validate SUPPLIER_CODE
-invalid_suppliers = headers_df[~headers_df['SUPPLIER_CODE'].isin(supplier_lookup.keys())]
-if not invalid_suppliers.empty:
-    logging.warning(f"Invalid supplier codes found: {invalid_suppliers['SUPPLIER_CODE'].tolist()}")
 
 # Step 4: Transform - Clean Purchases Lines
-
-# 1. Calculate the new total cost, placing it in a temporary column
-lines_df['calculatedCost'] = lines_df['QUANTITY'] * lines_df['UNIT_COST_PRICE']
-
-# 2. Check for discrepancies against the original TOTAL_LINE_COST
-discrepancies = lines_df[abs(lines_df['calculatedCost'] - lines_df['TOTAL_LINE_COST']) > 0.01]
-
-if not discrepancies.empty:
-    logging.warning(f"Cost discrepancies in {discrepancies['PURCH_DOC_NO'].tolist()}")
-    # Correct the original column value with the calculated value
-    lines_df['TOTAL_LINE_COST'] = lines_df['calculatedCost']
-
-# 3. Drop the temporary calculated cost column
-lines_df = lines_df.drop(columns=['calculatedCost'], errors='ignore')
-
-# 4. Rename fields for consistency. 
-lines_df = lines_df.rename(columns={
-    'INVENTORY_CODE': 'productID',
-    'QUANTITY': 'quantity',
-    'UNIT_COST_PRICE': 'unitCost',
-    'TOTAL_LINE_COST': 'totalCost' # Now holds the corrected value
-})
-
-# 5. Explicitly select only the desired columns to remove all old and auxiliary columns
-lines_df = lines_df[[
-    'PURCH_DOC_NO', 
-    'productID', 
-    'quantity', 
-    'unitCost', 
-    'totalCost'
-]]
+@phase("clean_lines")
+def clean_lines(lines_df):
+    lines_df = lines_df.copy()
+
+    # 1. Calculate the new total cost, placing it in a temporary column
+    # (in int64/float64: the dtype planner may have narrowed the loaded columns)
+    lines_df['calculatedCost'] = widen(lines_df['QUANTITY']) * widen(lines_df['UNIT_COST_PRICE'])
+
+    # 2. Check for discrepancies against the original TOTAL_LINE_COST
+    discrepancies = lines_df[abs(lines_df['calculatedCost'] - lines_df['TOTAL_LINE_COST']) > 0.01]
+
+    if not discrepancies.empty:
+        logging.warning(f"Cost discrepancies in {discrepancies['PURCH_DOC_NO'].tolist()}")
+        # Correct the original column value with the calculated value
+        lines_df['TOTAL_LINE_COST'] = lines_df['calculatedCost']
+
+    # 3. Drop the temporary calculated cost column
+    lines_df = lines_df.drop(columns=['calculatedCost'], errors='ignore')
+
+    # 4. Rename fields for consistency. 
+    lines_df = lines_df.rename(columns={
+        'INVENTORY_CODE': 'productID',
+        'QUANTITY': 'quantity',
+        'UNIT_COST_PRICE': 'unitCost',
+        'TOTAL_LINE_COST': 'totalCost' # Now holds the corrected value
+    })
+
+    # 5. Explicitly select only the desired columns to remove all old and auxiliary columns
+    return lines_df[[
+        'PURCH_DOC_NO', 
+        'productID', 
+        'quantity', 
+        'unitCost', 
+        'totalCost'
+    ]]
 
 
 # Step 5: Structure - Combine into MongoDB-compatible documents
-purchases_documents = []
-for _, header in headers_df.iterrows():
-    doc_no = header['PURCH_DOC_NO']
-    supplier_id = header['SUPPLIER_CODE']
-    
-    # Get line items for this PO
-    line_items = lines_df[lines_df['PURCH_DOC_NO'] == doc_no][
-        ['productID', 'quantity', 'unitCost', 'totalCost']
-    ].to_dict('records')
-    
-    # Compute total purchase cost
-    total_cost = sum(item['totalCost'] for item in line_items)
-    
-    # Build document
-    document = {
-        '_id': doc_no,
-        'purchaseDate': header['purchaseDate'],
-        'financialPeriod': header['financialPeriod'],
-        'supplier': supplier_lookup.get(supplier_id, {
-            'supplierID': supplier_id,
-            'name': 'Unknown Supplier',
-            'excludesVAT': False,
-            'paymentTerms': 0,
-            'creditLimit': 0,
-            'shipmentDetails': []
-        }),
-        'lineItems': line_items,
-        'totalPurchaseCost': round(total_cost, 2),
-        'status': 'Open'
-    }
-    purchases_documents.append(document)
+@phase("build_purchase_documents", rows_out=len)
+def build_purchase_documents(headers_df, lines_df, supplier_lookup):
+    # Group every purchase line by PURCH_DOC_NO once (single stable sort), so each PO's
+    # line items are a dictionary lookup instead of a scan of the whole lines table
+    line_items_by_doc = nest_records(lines_df['PURCH_DOC_NO'], {
+        col: lines_df[col] for col in ['productID', 'quantity', 'unitCost', 'totalCost']
+    })
+
+    purchases_documents = []
+    for _, header in headers_df.iterrows():
+        doc_no = header['PURCH_DOC_NO']
+        supplier_id = header['SUPPLIER_CODE']
+        
+        # Get line items for this PO
+        line_items = line_items_by_doc.get(doc_no, [])
+        
+        # Compute total purchase cost
+        total_cost = sum(item['totalCost'] for item in line_items)
+        
+        # Build document
+        document = {
+            '_id': doc_no,
+            'purchaseDate': header['purchaseDate'],
+            'financialPeriod': header['financialPeriod'],
+            'supplier': supplier_lookup.get(supplier_id, {
+                'supplierID': supplier_id,
+                'name': 'Unknown Supplier',
+                'excludesVAT': False,
+                'paymentTerms': 0,
+                'creditLimit': 0,
+                'shipmentDetails': []
+            }),
+            'lineItems': line_items,
+            'totalPurchaseCost': round(total_cost, 2),
+            'status': 'Open'
+        }
+        purchases_documents.append(document)
+    return purchases_documents
+
+
+def transform(frames):
+    """Steps 2-5: raw frames (or a plain dict of DataFrames) -> purchase documents."""
+    supplier_lookup = clean_suppliers(frames['suppliers'])
+    headers_df = clean_headers(frames['headers'], supplier_lookup)
+    lines_df = clean_lines(frames['lines'])
+    return build_purchase_documents(headers_df, lines_df, supplier_lookup)
+
+
+# Step 6: Load - Stream the final documents to a newline-delimited JSON file
+@phase("load", rows_in=lambda args: len(args[0]))
+def load(purchases_documents, output_dir=OUTPUT_DIR):
+    output_dir = Path(output_dir)
+    output_dir.mkdir(exist_ok=True) # Create the directory if it doesn't exist
+
+    # Define the output file name (purchases_clean.ndjson, plus .gz/.zst when compressed)
+    output_file = collection_path(output_dir, 'purchases_clean')
 
+    try:
+        writer = write_collection(output_file, purchases_documents)
 
-# Step 6: Load - Save the final documents to a JSON file
-import json
-from pathlib import Path
-# No need for pandas imports here, as we are saving the raw list of dicts.
+        logging.info(
+            f"Successfully saved {writer.documents} MongoDB documents "
+            f"({writer.bytes_written} bytes, {writer.bytes_on_disk} on disk) to: {output_file}"
+        )
+        return writer
 
-# Define the output directory (e.g., in a new 'clean_data' folder)
-OUTPUT_DIR = Path(SCRIPT_DIR) / '..' / '..' / 'clean_data'
-OUTPUT_DIR.mkdir(exist_ok=True) # Create the directory if it doesn't exist
+    except Exception as e:
+        logging.error(f"Error saving NDJSON file: {e}")
 
-# Define the output file name
-OUTPUT_FILE = OUTPUT_DIR / 'purchases_clean.json' 
 
-try:
-    with open(OUTPUT_FILE, 'w') as f:
-        # json.dump serializes the list of dictionaries
-        # indent=4 makes the JSON human-readable and easy to inspect
-        json.dump(purchases_documents, f, indent=4)
+def main(raw_data_path=RAW_DATA_PATH, output_dir=OUTPUT_DIR):
+    # Configure logging
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-    logging.info(f"Successfully saved {len(purchases_documents)} MongoDB documents to: {OUTPUT_FILE}")
+    with RunMetrics("purchases_clean", output_dir) as run, RejectLog("purchases_clean", output_dir):
+        try:
+            frames = extract(raw_data_path)
+            purchases_documents = transform(frames)
+        except FileNotFoundError as e:
+            logging.error(f"File not found: {e}")
+            raise
+        writer = load(purchases_documents, output_dir)
+    logging.info(run.report())
+    return writer
 
-except Exception as e:
-    logging.error(f"Error saving JSON file: {e}")
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+=============================================================================
+IN-PROCESS KAFKA STAND-IN
+ClearVue BI System - A broker and producer for tests and dry runs
+=============================================================================
+
+InMemoryProducer has the part of confluent_kafka.Producer that
+kafka_producer.py uses - produce(), poll(), flush() and len() - and
+behaves like it where the producer code can tell:
+
+  - produce() only queues the message and returns; a full local queue
+    raises BufferError (librdkafka's queue.buffering.max.messages);
+  - messages are batched per topic partition, and a batch goes to the
+    broker once it holds batch.num.messages messages, on a blocking poll()
+    (linger.ms has passed) or on flush(); each batch is compressed with
+    zlib, standing in for compression.type, so the compressed bytes on the
+    wire can be reported;
+  - delivery callbacks run on poll() / flush(), with a message object that
+    has topic(), partition(), offset(), key(), value() and error();
+  - a keyed message always goes to the same partition (CRC32 of the key,
+    librdkafka's "consistent" partitioner), so per-key order is kept.
+
+InMemoryBroker keeps the delivered messages per topic partition with their
+offsets, for tests to read back. No network, no threads.
+
+Usage:
+    broker = InMemoryBroker(partitions=3)
+    producer = InMemoryProducer(broker, {"batch.num.messages": 500})
+    producer.produce("topic", value=b"...", key=b"DC700467", on_delivery=callback)
+    producer.flush()
+"""
+
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+DEFAULT_PARTITIONS = 3
+DEFAULT_QUEUE_MESSAGES = 100_000
+DEFAULT_BATCH_MESSAGES = 10_000
+
+
+@dataclass
+class InMemoryMessage:
+    """A produced message; accessor methods mirror confluent_kafka.Message."""
+    _topic: str
+    _partition: int
+    _key: bytes
+    _value: bytes
+    _offset: int = -1
+    _error: object = None
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def offset(self):
+        return self._offset
+
+    def error(self):
+        return self._error
+
+
+@dataclass
+class InMemoryBroker:
+    """Topic partitions as lists of delivered messages, plus per-batch wire sizes."""
+    partitions: int = DEFAULT_PARTITIONS
+    log: dict = field(default_factory=lambda: defaultdict(list))  # (topic, partition) -> [InMemoryMessage]
+    batches: list = field(default_factory=list)  # (topic, partition, messages, raw bytes, compressed bytes)
+    fail_topics: set = field(default_factory=set)  # topics whose batches are rejected, for error paths
+
+    def partition_for(self, key):
+        return zlib.crc32(key) % self.partitions if key is not None else 0
+
+    def append(self, topic, partition, messages):
+        """Store one batch; returns the error the batch failed with, or None."""
+        raw = sum(len(m.value()) + len(m.key() or b"") for m in messages)
+        compressed = len(zlib.compress(b"".join((m.key() or b"") + m.value() for m in messages)))
+        self.batches.append((topic, partition, len(messages), raw, compressed))
+        if topic in self.fail_topics:
+            return f"broker rejected a batch for {topic}"
+        log = self.log[(topic, partition)]
+        for message in messages:
+            message._offset = len(log)
+            log.append(message)
+        return None
+
+    def messages(self, topic):
+        """Every delivered message of a topic, partition by partition."""
+        return [m for (t, _), log in sorted(self.log.items()) if t == topic for m in log]
+
+    @property
+    def wire_bytes(self):
+        return sum(batch[4] for batch in self.batches)
+
+
+class InMemoryProducer:
+    """confluent_kafka.Producer stand-in that delivers into an InMemoryBroker."""
+
+    def __init__(self, broker, config=None):
+        config = config or {}
+        self.broker = broker
+        self.queue_limit = int(config.get("queue.buffering.max.messages", DEFAULT_QUEUE_MESSAGES))
+        self.batch_messages = int(config.get("batch.num.messages", DEFAULT_BATCH_MESSAGES))
+        self._batches = defaultdict(list)  # (topic, partition) -> [(message, callback)]
+        self._callbacks = []  # delivered (callback, error, message) waiting for poll()
+        self._queued = 0
+
+    def __len__(self):
+        """Messages not yet delivered or whose callbacks have not run (like Producer.__len__)."""
+        return self._queued + len(self._callbacks)
+
+    def produce(self, topic, value=None, key=None, on_delivery=None, **kwargs):
+        if self._queued >= self.queue_limit:
+            raise BufferError("Local: Queue full")
+        partition = self.broker.partition_for(key)
+        batch = self._batches[(topic, partition)]
+        batch.append((InMemoryMessage(topic, partition, key, value), on_delivery))
+        self._queued += 1
+        if len(batch) >= self.batch_messages:
+            self._send(topic, partition)
+
+    def _send(self, topic, partition):
+        batch = self._batches.pop((topic, partition), [])
+        if not batch:
+            return
+        error = self.broker.append(topic, partition, [message for message, _ in batch])
+        for message, callback in batch:
+            message._error = error
+            self._callbacks.append((callback, error, message))
+        self._queued -= len(batch)
+
+    def _send_all(self):
+        for topic, partition in list(self._batches):
+            self._send(topic, partition)
+
+    def poll(self, timeout=None):
+        """Run waiting delivery callbacks; returns how many ran.
+
+        A blocking poll (timeout > 0 or None) waits out linger.ms, so the
+        partial batches are sent first - that is what frees a full queue.
+        """
+        if timeout is None or timeout > 0:
+            self._send_all()
+        callbacks, self._callbacks = self._callbacks, []
+        for callback, error, message in callbacks:
+            if callback is not None:
+                callback(error, message)
+        return len(callbacks)
+
+    def flush(self, timeout=None):
+        """Send every partial batch and run all callbacks; returns the messages still queued (0)."""
+        self._send_all()
+        self.poll(0)
+        return len(self)
@@ -0,0 +1,41 @@
+# C:\clearvue-bi-system\tests\test_benchmarks.py
+
+import unittest
+
+import pandas as pd
+
+from benchmarks.run_benchmarks import run_case, scaling_exponents
+from benchmarks.synthetic import GENERATORS
+
+
+class TestSyntheticBenchmarks(unittest.TestCase):
+    """Tests the seeded generators and the scaling summary of the benchmark suite."""
+
+    def test_generators_are_seeded(self):
+        for name, generate in GENERATORS.items():
+            first, second = generate(200, seed=3), generate(200, seed=3)
+            self.assertEqual(first.keys(), second.keys())
+            for key in first:
+                pd.testing.assert_frame_equal(first[key], second[key], obj=f"{name}.{key}")
+
+    def test_case_records_phases(self):
+        case = run_case("customer", 300)
+
+        self.assertEqual(case["status"], "ok")
+        self.assertTrue(0 < case["documents"] <= 300)
+        self.assertIn("build_documents", [phase["name"] for phase in case["phases"]])
+
+    def test_scaling_exponents(self):
+        cases = [
+            {"transform": "sales", "rows": rows, "status": "ok", "wall_time": seconds,
+             "phases": [{"name": "load", "wall_time": seconds / 2}]}
+            for rows, seconds in ((1000, 1.0), (10000, 100.0))
+        ]
+        exponents = scaling_exponents(cases)
+
+        self.assertAlmostEqual(exponents[("sales", "total")][0][2], 2.0)
+        self.assertAlmostEqual(exponents[("sales", "load")][0][2], 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+# C:\clearvue-bi-system\tests\test_collection_writer.py
+
+import datetime
+import gzip
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from etl_scripts.batch_etl import collection_writer
+from etl_scripts.batch_etl.collection_writer import (
+    CollectionWriter, collection_path, content_hash, find_collection, read_collection, write_collection
+)
+
+MOCK_DOCS = [
+    {'_id': 'DC700467', 'fin_period': '201901', 'total_revenue': 1000.0,
+     'line_items': [{'inventory_code': '123ABC', 'quantity': 2}]},
+    {'_id': 'DC700468', 'fin_period': None, 'total_revenue': 0.0, 'line_items': []},
+]
+
+
+def without_hash(docs):
+    return [{key: value for key, value in doc.items() if key != 'content_hash'} for doc in docs]
+
+
+class TestCollectionWriter(unittest.TestCase):
+    """Tests the streaming NDJSON export writer."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_writes_one_document_per_line(self):
+        """Each document is one compact JSON line and the stats add up."""
+        path = collection_path(self.dir, 'sales_collection', compression=None)
+        with CollectionWriter(path) as writer:
+            for doc in MOCK_DOCS:
+                writer.write(doc)
+
+        lines = path.read_bytes().splitlines()
+        self.assertEqual(path.name, 'sales_collection.ndjson')
+        self.assertEqual(without_hash(json.loads(line) for line in lines), MOCK_DOCS)
+        self.assertEqual(writer.documents, 2)
+        self.assertEqual(writer.bytes_written, path.stat().st_size)
+        self.assertEqual(writer.bytes_on_disk, path.stat().st_size)
+
+    def test_gzip_round_trip(self):
+        """Compression is inferred from the suffix and read back transparently."""
+        path = collection_path(self.dir, 'finance_collection', compression='gzip')
+        writer = write_collection(path, iter(MOCK_DOCS))
+
+        self.assertEqual(path.name, 'finance_collection.ndjson.gz')
+        self.assertEqual(len(gzip.decompress(path.read_bytes()).splitlines()), 2)
+        self.assertEqual(without_hash(read_collection(path)), MOCK_DOCS)
+        self.assertLess(writer.bytes_on_disk, writer.bytes_written + 64)
+
+    def test_documents_carry_canonical_content_hash(self):
+        """The hash ignores key order and the hash field, and changes with any value."""
+        path = write_collection(collection_path(self.dir, 'sales_collection', compression=None), MOCK_DOCS).path
+        written = list(read_collection(path))
+
+        reordered = dict(reversed(list(MOCK_DOCS[0].items())))
+        self.assertEqual(written[0]['content_hash'], content_hash(reordered))
+        self.assertEqual(content_hash(written[0]), written[0]['content_hash'])
+        self.assertNotEqual(content_hash({**MOCK_DOCS[0], 'total_revenue': 1000.5}), written[0]['content_hash'])
+
+        unhashed = CollectionWriter(self.dir / 'plain.ndjson', hash_field=None)
+        with unhashed:
+            unhashed.write(MOCK_DOCS[1])
+        self.assertEqual(list(read_collection(unhashed.path)), [MOCK_DOCS[1]])
+
+    def test_json_fallback_writes_the_same_bytes(self):
+        """Without orjson, NaN, numpy scalars and dates are written exactly as orjson writes them."""
+        doc = {'_id': 'DC700469', 'total_revenue': float('nan'), 'quantity': np.int64(3),
+               'cost': np.float32(1.1), 'customer': 'Café', 'trans_date': datetime.datetime(2020, 1, 1),
+               'due_date': datetime.date(2020, 2, 28), 'loaded_at': pd.Timestamp('2020-01-01 08:30')}
+        with mock.patch.object(collection_writer, 'orjson', None):
+            fallback = write_collection(self.dir / 'fallback.ndjson', [doc]).path.read_bytes()
+        written = json.loads(fallback)
+        self.assertEqual(without_hash([written]), [{
+            '_id': 'DC700469', 'total_revenue': None, 'quantity': 3, 'cost': 1.1, 'customer': 'Café',
+            'trans_date': '2020-01-01T00:00:00', 'due_date': '2020-02-28', 'loaded_at': '2020-01-01T08:30:00',
+        }])
+        self.assertEqual(content_hash(written), written['content_hash'])
+        if collection_writer.orjson is not None:
+            self.assertEqual(write_collection(self.dir / 'orjson.ndjson', [doc]).path.read_bytes(), fallback)
+
+    def test_unknown_compression_is_rejected(self):
+        """A bad compression name fails with the same ValueError wherever it is given."""
+        with self.assertRaisesRegex(ValueError, "Unknown compression: 'lz4'"):
+            collection_path(self.dir, 'sales_collection', compression='lz4')
+        with self.assertRaisesRegex(ValueError, "Unknown compression: 'lz4'"):
+            CollectionWriter(self.dir / 'sales_collection.ndjson', compression='lz4')
+
+    def test_find_collection_reads_legacy_json_array(self):
+        """Old indented .json exports are still found and read."""
+        legacy = self.dir / 'customer_collection.json'
+        legacy.write_text(json.dumps(MOCK_DOCS, indent=2))
+
+        path = find_collection(self.dir, 'customer_collection')
+        self.assertEqual(path, legacy)
+        self.assertEqual(list(read_collection(path)), MOCK_DOCS)
+
+    def test_find_collection_missing(self):
+        """A missing export raises FileNotFoundError."""
+        with self.assertRaises(FileNotFoundError):
+            find_collection(self.dir, 'purchases_clean')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# C:\clearvue-bi-system\tests\test_columnar.py
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from etl_scripts.batch_etl.columnar import group_offsets, isoformat_column, nest_records
+
+
+class TestGroupOffsets(unittest.TestCase):
+    """Tests the sort-based grouping kernel."""
+
+    def test_groups_in_first_appearance_order(self):
+        """Groups follow first appearance and rows keep their order within a group."""
+        keys = pd.Series(['DC2', 'DC1', 'DC2', 'DC3', 'DC1'])
+        uniques, order, offsets = group_offsets(keys)
+
+        self.assertEqual(list(uniques), ['DC2', 'DC1', 'DC3'])
+        self.assertEqual(offsets.tolist(), [0, 2, 4, 5])
+        self.assertEqual(order.tolist(), [0, 2, 1, 4, 3])
+
+    def test_missing_keys_are_dropped(self):
+        """Rows with a NaN key do not belong to any group."""
+        uniques, order, offsets = group_offsets(pd.Series(['A', np.nan, 'A', 'B']))
+
+        self.assertEqual(list(uniques), ['A', 'B'])
+        self.assertEqual(order.tolist(), [0, 2, 3])
+        self.assertEqual(offsets.tolist(), [0, 2, 3])
+
+    def test_composite_keys(self):
+        """A list of columns groups on the tuple of values."""
+        uniques, order, offsets = group_offsets([
+            pd.Series(['C1', 'C1', 'C2', 'C1']),
+            pd.Series([201901, 201902, 201901, 201901]),
+        ])
+
+        self.assertEqual(list(uniques), [('C1', 201901), ('C1', 201902), ('C2', 201901)])
+        self.assertEqual(order.tolist(), [0, 3, 1, 2])
+
+
+class TestNestRecords(unittest.TestCase):
+    """Tests nesting child rows into per-key lists of dicts."""
+
+    def test_nests_plain_python_records(self):
+        """Records keep row order and hold plain Python scalars."""
+        nested = nest_records(pd.Series(['P001', 'P002', 'P001']), {
+            'productID': pd.Series(['A1', 'B2', 'C3']),
+            'quantity': pd.Series([10, 5, 1], dtype='int64'),
+            'unitCost': pd.Series([5.0, 10.0, 2.5]),
+        })
+
+        self.assertEqual(nested, {
+            'P001': [
+                {'productID': 'A1', 'quantity': 10, 'unitCost': 5.0},
+                {'productID': 'C3', 'quantity': 1, 'unitCost': 2.5},
+            ],
+            'P002': [{'productID': 'B2', 'quantity': 5, 'unitCost': 10.0}],
+        })
+        self.assertIs(type(nested['P001'][0]['quantity']), int)
+
+    def test_empty_input(self):
+        """No rows gives no groups."""
+        self.assertEqual(nest_records(pd.Series([], dtype=object), {'x': pd.Series([], dtype=float)}), {})
+
+
+
+class TestIsoformatColumn(unittest.TestCase):
+    """Tests vectorised Timestamp.isoformat()."""
+
+    def test_matches_timestamp_isoformat(self):
+        """Whole seconds, fractional seconds and NaT format like Timestamp.isoformat()."""
+        column = pd.Series([pd.Timestamp('2019-03-25'), pd.Timestamp('2019-03-25 13:45:10.250'), pd.NaT])
+        self.assertEqual(isoformat_column(column), [
+            pd.Timestamp('2019-03-25').isoformat(),
+            pd.Timestamp('2019-03-25 13:45:10.250').isoformat(),
+            None,
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# C:\clearvue-bi-system\tests\test_customer_dimensions.py
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from etl_scripts.batch_etl.customer_dimensions import (
+    STAGES, build_dim_time, clean_customers, clean_payment_lines, clean_representatives, merge_customer,
+    payment_summary, valid_payment_lines,
+)
+from etl_scripts.batch_etl.stage_cache import execution_order
+
+
+class TestCustomerDimensionStages(unittest.TestCase):
+    """Tests the notebook cleaning steps as pipeline stages."""
+
+    def test_customers_keep_valid_rows_only(self):
+        """Customer rows need a valid number, positive category, region pattern and terms."""
+        customers = pd.DataFrame({
+            'CUSTOMER_NUMBER': ['ABCD01', 'ABCD0', 'ABCDEF', 'ABCDE1'],
+            'CCAT_CODE': [1, 1, 0, 2],
+            'REGION_CODE': ['7a', '7a', '7a', '25'],
+            'REP_CODE': ['R1', 'R1', 'R1', 'R1'],
+            'SETTLE_TERMS': [0.0, 0.0, 0.0, 0.0],
+            'NORMAL_PAYTERMS': [30, 30, 30, 30],
+            'DISCOUNT': [0, 0, 0, 0],
+            'CREDIT_LIMIT': [100, 100, 100, 100],
+        })
+        self.assertEqual(clean_customers(customers)['CUSTOMER_NUMBER'].tolist(), ['ABCD01'])
+
+    def test_representatives_are_grouped_and_filtered(self):
+        """Reps get REP_DESC_CLEAN and REP_GROUP; dropped descriptions are removed."""
+        reps = pd.DataFrame({
+            'REP_CODE': ['01', '02', '03', '04', '05'],
+            'REP_DESC': ['HEAD OFFICE', 'BJ CONSIGNMENTS', 'CONSIGNMENT BA', 'do not use', 'Someone new'],
+            'COMM_METHOD': ['Sales'] * 5,
+            'COMMISSION': [0.0] * 5,
+        })
+        cleaned = clean_representatives(reps)
+        self.assertEqual(cleaned['REP_CODE'].tolist(), ['01', '02', '03', '05'])
+        self.assertEqual(cleaned['REP_GROUP'].tolist(),
+                         ['Internal Sales', 'Sales Rep', 'Channel: Consignment', 'Unclassified_Missing_Data'])
+
+    def test_payment_lines_and_summary(self):
+        """Payment lines are lower-cased with YYYY-MM periods; the summary counts zero payments too."""
+        raw = pd.DataFrame({
+            'CUSTOMER_NUMBER': [' abcd01 ', 'ABCD02', 'BAD'],
+            'FIN_PERIOD': [201901, 201901, 201902],
+            'DEPOSIT_DATE': pd.to_datetime(['2019-01-10', '2019-01-11', '2019-02-01']),
+            'DEPOSIT_REF': ['D1', 'D2', 'D3'],
+            'BANK_AMT': [10.0, 0.0, 5.0],
+            'DISCOUNT': [0, 0, 0],
+            'TOT_PAYMENT': [10, 0, 5],
+        })
+        valid = valid_payment_lines(raw)
+        self.assertEqual(payment_summary(valid).to_dict('records'), [{'FIN_PERIOD': 201901, 'TOT_PAYMENT': 10}])
+
+        lines = clean_payment_lines(valid)
+        self.assertEqual(lines.columns.tolist()[:3], ['customer_number', 'fin_period', 'deposit_date'])
+        self.assertEqual(lines[['customer_number', 'fin_period', 'deposit_date']].values.tolist(),
+                         [['ABCD01', '2019-01', '2019-01-10']])
+
+    def test_merge_customer(self):
+        """The merged customer carries its rep, parameter, region and category."""
+        customers = pd.DataFrame({
+            'CUSTOMER_NUMBER': ['ABCD01'], 'CCAT_CODE': [5], 'REGION_CODE': ['7a'], 'REP_CODE': ['01'],
+            'SETTLE_TERMS': [0.0], 'NORMAL_PAYTERMS': [30], 'DISCOUNT': [0], 'CREDIT_LIMIT': [100],
+        })
+        reps = pd.DataFrame({'REP_CODE': ['01'], 'REP_DESC': ['HEAD OFFICE'], 'COMM_METHOD': ['Sales'],
+                             'COMMISSION': [0.5], 'REP_DESC_CLEAN': ['HEAD OFFICE'], 'REP_GROUP': ['Internal Sales']})
+        params = pd.DataFrame({'CUSTOMER_NUMBER': ['ABCD01'], 'PARAMETER': ['Closed'],
+                               'PARAMETER_GROUP': ['Account Status']})
+        regions = pd.DataFrame({'REGION_CODE': ['7a'], 'REGION_DESC': ['Durban'], 'PROVINCE': ['KwaZulu-Natal']})
+        categories = pd.DataFrame({'CCAT_CODE': [5], 'CCAT_DESC': ['Consignment'],
+                                   'CCAT_GROUP': ['Channel: Consignment']})
+
+        merged = merge_customer(customers, reps, params, regions, categories)
+        self.assertNotIn('PARAMETER_GROUP', merged.columns)
+        row = merged.iloc[0]
+        self.assertEqual((row['REP_GROUP'], row['PARAMETER'], row['PROVINCE'], row['CCAT_GROUP']),
+                         ('Internal Sales', 'Closed', 'KwaZulu-Natal', 'Channel: Consignment'))
+
+    def test_dim_time_covers_age_analysis_periods(self):
+        """dim_time spans the first to the last FIN_PERIOD of the age analysis."""
+        age = pd.DataFrame({'FIN_PERIOD': pd.to_datetime(['2018-03-01', '2018-05-01', np.nan])})
+        dim_time = build_dim_time(age)
+        self.assertEqual(dim_time['financial_month'].tolist(), ['2018-03', '2018-04', '2018-05'])
+        self.assertEqual(dim_time['start_date'].iloc[1], '2018-03-31')
+
+    def test_customer_merged_needs_only_customer_stages(self):
+        """Refreshing customer_merged never touches the finance stages."""
+        names = [stage.name for stage in execution_order(STAGES, ['customer_merged'])]
+        self.assertEqual(names[-1], 'customer_merged')
+        self.assertEqual(set(names), {'customers', 'representatives', 'customer_params',
+                                      'customer_regions', 'customer_categories', 'customer_merged'})
+
+
+if __name__ == '__main__':
+    unittest.main()
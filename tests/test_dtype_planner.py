@@ -0,0 +1,49 @@
+# C:\clearvue-bi-system\tests\test_dtype_planner.py
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from etl_scripts.batch_etl.dtype_planner import ARROW_STRING, compact_frame, plan_dtypes, widen
+from etl_scripts.batch_etl.incremental import frame_fingerprint
+
+
+class TestDtypePlanner(unittest.TestCase):
+    """Tests the lossless compact dtypes chosen for loaded frames."""
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'REP_CODE': ['010', '010', '04C', '010', np.nan, '04C'],
+            'DOC_NUMBER': ['D1', 'D2', 'D3', 'D4', 'D5', 'D6'],
+            'MIXED': ['AACJ01', 599000, 'B', 'C', 'D', 'E'],
+            'QUANTITY': [1, 2, 3, 4, 5, 300],
+            'HALVES': [0.5, 1.5, np.nan, 2.0, 2.5, 3.0],
+            'PRICES': [0.1, 0.2, 0.3, 0.4, 0.5, 0.6],
+        })
+
+    def test_plan(self):
+        """Low-cardinality codes become categories; only exact conversions are planned."""
+        plan = plan_dtypes(self.df)
+
+        self.assertEqual(plan['REP_CODE'], 'category')
+        self.assertEqual(plan.get('DOC_NUMBER'), ARROW_STRING)
+        self.assertNotIn('MIXED', plan)
+        self.assertEqual(plan['QUANTITY'], np.int16)
+        self.assertEqual(plan['HALVES'], np.float32)
+        self.assertNotIn('PRICES', plan)  # 0.1 has no exact float32
+
+    def test_compact_frame_is_lossless(self):
+        compacted, before, after = compact_frame(self.df)
+
+        self.assertLess(after, before)
+        pd.testing.assert_frame_equal(compacted.astype(object), self.df.astype(object), check_dtype=False)
+        # kernels widen before arithmetic, and incremental fingerprints ignore the storage width
+        self.assertEqual(widen(compacted['QUANTITY']).dtype, np.int64)
+        self.assertEqual(widen(compacted['HALVES']).dtype, np.float64)
+        self.assertEqual(frame_fingerprint(compacted[['QUANTITY', 'HALVES']]),
+                         frame_fingerprint(self.df[['QUANTITY', 'HALVES']]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# C:\clearvue-bi-system\tests\test_fin_calendar.py
+
+import tempfile
+import unittest
+
+import pandas as pd
+
+from etl_scripts.batch_etl.collection_writer import collection_path, read_collection
+from etl_scripts.batch_etl.fin_calendar import DIM_TIME, FinancialCalendar, fin_periods, load_dim_time
+
+
+class TestFinancialCalendar(unittest.TestCase):
+    """Tests the last-Friday financial months and the dim_time documents."""
+
+    def test_month_ends_on_last_friday(self):
+        """A date belongs to the financial month that ends on or after it."""
+        dates = pd.Series(pd.to_datetime(['2018-03-30', '2018-03-31', '2018-04-27', '2018-12-31', '2019-01-01']))
+        self.assertEqual(fin_periods(dates).tolist(), [201803, 201804, 201804, 201901, 201901])
+
+    def test_missing_dates_have_no_period(self):
+        """NaT and unparseable dates map to <NA> instead of failing the column."""
+        periods = fin_periods(pd.Series(['2018-03-15', None, 'not a date'], index=[7, 8, 9]))
+        self.assertEqual(str(periods.dtype), 'Int64')
+        self.assertEqual(periods.index.tolist(), [7, 8, 9])
+        self.assertEqual(periods.iloc[0], 201803)
+        self.assertTrue(periods.iloc[1:].isna().all())
+
+    def test_months_are_contiguous(self):
+        """Every month starts on a Saturday, the day after the previous one ends on a Friday."""
+        calendar = FinancialCalendar(2016, 2020)
+        starts, ends = pd.to_datetime(calendar.starts), pd.to_datetime(calendar.ends)
+        self.assertTrue((starts.dayofweek == 5).all())
+        self.assertTrue((ends.dayofweek == 4).all())
+        self.assertTrue(((starts[1:] - ends[:-1]).days == 1).all())
+        self.assertEqual(len(calendar), 60)
+
+    def test_assign_quarters(self):
+        """The quarter is the calendar quarter of the financial month."""
+        calendar = FinancialCalendar(2018, 2019)
+        assigned = calendar.assign(pd.Series(pd.to_datetime(['2018-03-31', '2018-12-31', '2030-01-01'])))
+        self.assertEqual(assigned['FIN_QUARTER'].iloc[:2].tolist(), [2, 1])
+        self.assertEqual(assigned['QUARTER_LABEL'].tolist(), ['Q2 2018', 'Q1 2019', None])
+        self.assertTrue(pd.isna(assigned['FIN_PERIOD'].iloc[2]))
+
+    def test_dim_time_documents(self):
+        """load_dim_time exports one document per financial month of the range."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            load_dim_time(201802, 201804, output_dir)
+            docs = list(read_collection(collection_path(output_dir, DIM_TIME)))
+
+        self.assertEqual([doc['_id'] for doc in docs], ['201802', '201803', '201804'])
+        march = docs[1]
+        self.assertEqual((march['start_date'], march['end_date'], march['days']), ('2018-02-24', '2018-03-30', 35))
+        self.assertEqual((march['year'], march['month'], march['quarter_label']), (2018, 3, 'Q1 2018'))
+
+
+if __name__ == '__main__':
+    unittest.main()
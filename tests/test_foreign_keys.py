@@ -0,0 +1,83 @@
+# C:\clearvue-bi-system\tests\test_foreign_keys.py
+
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from etl_scripts.batch_etl.foreign_keys import (
+    REASON_COLUMN, REJECTS_DIR_NAME, ForeignKey, RejectLog, check_foreign_keys, print_report, read_rejects,
+)
+from etl_scripts.batch_etl.surrogate_keys import KeyDictionary
+
+
+class TestCheckForeignKeys(unittest.TestCase):
+    """Tests validating a child table against several parents at once."""
+
+    def setUp(self):
+        self.customers = pd.DataFrame({
+            'CUSTOMER_KEY': [0, 1, 2, 3],
+            'CCAT_CODE': ['A', 'B', 'X', 'X'],
+            'REGION_CODE': ['N', 'Q', 'S', np.nan],
+        }, index=[10, 11, 12, 13])
+        self.parents = {
+            'categories': pd.DataFrame({'CCAT_CODE': ['A', 'B', 'B']}),
+            'regions': pd.DataFrame({'REGION_CODE': ['N', 'S']}),
+        }
+        self.constraints = [
+            ForeignKey('unknown_ccat_code', 'CCAT_CODE', 'categories'),
+            ForeignKey('unknown_region_code', 'REGION_CODE', 'regions'),
+        ]
+
+    def test_all_reasons_are_reported_in_one_pass(self):
+        result = check_foreign_keys('customers', self.customers, self.constraints, self.parents)
+
+        self.assertEqual(result.valid.index.tolist(), [10])
+        self.assertEqual(result.rejected, 3)
+        self.assertEqual(result.violations, {'unknown_ccat_code': 2, 'unknown_region_code': 2})
+        self.assertEqual(result.rejects[REASON_COLUMN].tolist(), [
+            'unknown_region_code',
+            'unknown_ccat_code',
+            'unknown_ccat_code|unknown_region_code',
+        ])
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            print_report(result)
+        self.assertIn('⚠ WARNING: 2 customers have invalid CCAT_CODE', out.getvalue())
+
+    def test_flag_only_keys_and_composite_keys(self):
+        lines = pd.DataFrame({'DOC': ['D1', 'D1', 'D2'], 'LINE': [1, 2, 1]})
+        parents = {'lines': pd.DataFrame({'DOC_NO': ['D1', 'D2'], 'LINE_NO': [1, 1]}), 'docs': ['D1']}
+        result = check_foreign_keys('lines', lines, [
+            ForeignKey('unknown_line', ('DOC', 'LINE'), 'lines', parent_columns=('DOC_NO', 'LINE_NO')),
+            ForeignKey('unknown_doc', 'DOC', 'docs', reject=False),
+        ], parents)
+
+        self.assertEqual(result.valid.index.tolist(), [0, 2])
+        self.assertEqual(result.rejects[REASON_COLUMN].tolist(), ['unknown_line', 'unknown_doc'])
+
+    def test_reject_log_writes_sidecars(self):
+        keys = KeyDictionary()
+        keys.encode(pd.Series(['C0', 'C1', 'C2', 'C3']))
+        with tempfile.TemporaryDirectory() as output_dir:
+            stale = Path(output_dir) / REJECTS_DIR_NAME / 'customer_collection' / 'old.parquet'
+            stale.parent.mkdir(parents=True)
+            stale.touch()
+            with RejectLog('customer_collection', output_dir, keys):
+                check_foreign_keys('customers', self.customers, self.constraints, self.parents)
+
+            directory = stale.parent
+            summary = json.loads((directory / 'summary.json').read_text())
+            rejects = read_rejects(summary['tables']['customers']['path'])
+            self.assertFalse(stale.exists())
+
+        self.assertEqual(summary['tables']['customers']['rejected'], 3)
+        self.assertEqual(rejects['CUSTOMER_NUMBER'].tolist(), ['C1', 'C2', 'C3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# C:\clearvue-bi-system\tests\test_incremental.py
+
+import tempfile
+import unittest
+
+import pandas as pd
+
+from etl_scripts.batch_etl.dtype_planner import compact_frame
+from etl_scripts.batch_etl.incremental import PeriodState, frame_fingerprint, period_fingerprints
+
+
+class TestPeriodState(unittest.TestCase):
+    """Tests the FIN_PERIOD watermark and fingerprints behind incremental runs."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame({
+            'FIN_PERIOD': [202401, 202401, 202402],
+            'CUSTOMER_NUMBER': ['C1', 'C2', 'C1'],
+            'TOTAL_DUE': [10.0, 20.0, 30.0],
+        })
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fingerprints_ignore_row_order(self):
+        """Reordering rows does not restate a period; editing a row does."""
+        original = period_fingerprints(self.df, 'FIN_PERIOD')
+        self.assertEqual(period_fingerprints(self.df.iloc[::-1], 'FIN_PERIOD'), original)
+
+        edited = self.df.copy()
+        edited.loc[1, 'TOTAL_DUE'] = 21.0
+        changed = period_fingerprints(edited, 'FIN_PERIOD')
+        self.assertNotEqual(changed['202401'], original['202401'])
+        self.assertEqual(changed['202402'], original['202402'])
+
+    def test_fingerprints_ignore_storage_width(self):
+        """An unchanged period keeps its fingerprint when a new period widens a compacted column."""
+        df = pd.DataFrame({'FIN_PERIOD': [201901, 201902], 'QTY': [-1, 5], 'PRICE': [1.5, 2.25]})
+        grown = pd.concat([df, pd.DataFrame({'FIN_PERIOD': [201903], 'QTY': [70000], 'PRICE': [3.75]})],
+                          ignore_index=True)
+        narrow, wide = compact_frame(df)[0], compact_frame(grown)[0]
+        self.assertNotEqual(narrow['QTY'].dtype, wide['QTY'].dtype)
+
+        before = period_fingerprints(narrow, 'FIN_PERIOD')
+        after = period_fingerprints(wide, 'FIN_PERIOD')
+        self.assertEqual(after['201901'], before['201901'])
+        self.assertEqual(after['201902'], before['201902'])
+        self.assertEqual(before, period_fingerprints(df, 'FIN_PERIOD'))
+
+    def test_only_new_and_restated_periods_are_rebuilt(self):
+        """After a committed run only a new period and an edited period are selected."""
+        state = PeriodState.load(self.tmp.name, 'finance_collection')
+        self.assertTrue(state.is_first_run)
+        first = period_fingerprints(self.df, 'FIN_PERIOD')
+        self.assertEqual(state.changed_periods(first), ['202401', '202402'])
+        state.stage(first)
+        state.commit()
+
+        state = PeriodState.load(self.tmp.name, 'finance_collection')
+        self.assertEqual(state.watermark, '202402')
+        self.assertEqual(state.changed_periods(first), [])
+
+        grown = pd.concat([self.df, pd.DataFrame({
+            'FIN_PERIOD': [202403], 'CUSTOMER_NUMBER': ['C2'], 'TOTAL_DUE': [5.0],
+        })], ignore_index=True)
+        grown.loc[2, 'TOTAL_DUE'] = 31.0
+        changed = state.changed_periods(period_fingerprints(grown, 'FIN_PERIOD'))
+        self.assertEqual(changed, ['202402', '202403'])
+        self.assertEqual([state.is_new(period) for period in changed], [False, True])
+
+    def test_changed_source_rebuilds_every_period(self):
+        """A whole-table input change selects all periods."""
+        state = PeriodState.load(self.tmp.name, 'finance_collection')
+        fingerprints = period_fingerprints(self.df, 'FIN_PERIOD')
+        state.stage(fingerprints, {'account_params': frame_fingerprint(self.df[['CUSTOMER_NUMBER']])})
+        state.commit()
+
+        sources = {'account_params': frame_fingerprint(pd.DataFrame({'CUSTOMER_NUMBER': ['C9']}))}
+        self.assertEqual(state.changed_periods(fingerprints, sources), ['202401', '202402'])
+
+    def test_uncommitted_run_leaves_state_untouched(self):
+        """A run that fails before commit() is redone in full next time."""
+        state = PeriodState.load(self.tmp.name, 'sales_collection')
+        state.stage(period_fingerprints(self.df, 'FIN_PERIOD'))
+
+        state = PeriodState.load(self.tmp.name, 'sales_collection')
+        self.assertTrue(state.is_first_run)
+
+
+if __name__ == '__main__':
+    unittest.main()
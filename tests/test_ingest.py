@@ -0,0 +1,145 @@
+# C:\clearvue-bi-system\tests\test_ingest.py
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+from etl_scripts.batch_etl import ingest
+
+
+class TestReadExcelCached(unittest.TestCase):
+    """Tests the snapshot cache in front of pd.read_excel."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.workbook = Path(self.tmp.name) / "Customer.xlsx"
+        self.df = pd.DataFrame({
+            'CUSTOMER_NUMBER': ['AACJ01', 599000, 'ESP100'],
+            'REP_CODE': ['02JUL', None, '010'],
+            'CREDIT_LIMIT': [6000, 0, 999999],
+            'TRANS_DATE': pd.to_datetime(['2019-03-25', '2019-04-01', None]),
+        })
+        self.df.to_excel(self.workbook, sheet_name="Customer", index=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_second_read_uses_snapshot(self):
+        """The workbook is only parsed once and the snapshot matches read_excel."""
+        expected = pd.read_excel(self.workbook, sheet_name="Customer")
+        first = ingest.read_excel_cached(self.workbook, sheet_name="Customer")
+
+        with mock.patch.object(ingest.pd, "read_excel", side_effect=AssertionError("parsed again")):
+            second = ingest.read_excel_cached(self.workbook, sheet_name="Customer")
+
+        pd.testing.assert_frame_equal(first, expected)
+        pd.testing.assert_frame_equal(second, expected)
+
+    def test_touched_file_with_same_content_reuses_snapshot(self):
+        """A new mtime alone does not force a re-parse."""
+        ingest.read_excel_cached(self.workbook, sheet_name="Customer")
+        stat = self.workbook.stat()
+        os.utime(self.workbook, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        with mock.patch.object(ingest.pd, "read_excel", side_effect=AssertionError("parsed again")):
+            ingest.read_excel_cached(self.workbook, sheet_name="Customer")
+
+    def test_changed_content_invalidates_snapshot(self):
+        """Rewriting the workbook with new rows returns the new rows."""
+        ingest.read_excel_cached(self.workbook, sheet_name="Customer")
+        self.df.iloc[:1].to_excel(self.workbook, sheet_name="Customer", index=False)
+
+        df = ingest.read_excel_cached(self.workbook, sheet_name="Customer")
+        self.assertEqual(len(df), 1)
+
+    def test_load_and_sanitize_standardises_columns(self):
+        """Column names are stripped and upper-cased."""
+        pd.DataFrame({' deposit_ref ': [1]}).to_excel(self.workbook, sheet_name="Payment_Header", index=False)
+        df = ingest.load_and_sanitize(self.workbook, "Payment_Header")
+        self.assertEqual(df.columns.tolist(), ['DEPOSIT_REF'])
+
+
+class TestIterExcelChunks(unittest.TestCase):
+    """Tests streaming a sheet in typed chunks."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.workbook = Path(self.tmp.name) / "Age Analysis.xlsx"
+        self.df = pd.DataFrame({
+            ' customer_number ': ['AACJ01', 599000, 'ESP100', None, 'DGSOC'],
+            'AMT_30_DAYS': [1.5, 2.0, None, 4.0, 5.0],
+            'FIN_PERIOD': [201901, 201902, 201903, 201904, 201905],
+            'DEPOSIT_DATE': pd.to_datetime(['2019-03-25', None, '2019-04-01', '2019-04-02', '2019-04-03']),
+        })
+        self.df.to_excel(self.workbook, sheet_name="Age_Analysis", index=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_chunks_match_read_excel_and_are_cached(self):
+        """The chunks concatenate to the sanitised read_excel frame, also when read from the snapshot parts."""
+        expected = pd.read_excel(self.workbook, sheet_name="Age_Analysis")
+        expected.columns = ['CUSTOMER_NUMBER', 'AMT_30_DAYS', 'FIN_PERIOD', 'DEPOSIT_DATE']
+
+        chunks = list(ingest.iter_excel_chunks(self.workbook, "Age_Analysis", chunksize=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+        with mock.patch.object(ingest, "_sheet_rows", side_effect=AssertionError("parsed again")):
+            cached = pd.concat(ingest.iter_excel_chunks(self.workbook, "Age_Analysis", chunksize=3))
+            whole = ingest.load_and_sanitize(self.workbook, "Age_Analysis")
+        pd.testing.assert_frame_equal(cached, expected)
+        pd.testing.assert_frame_equal(whole, expected)
+
+    def test_chunk_boundaries_do_not_change_dtypes(self):
+        """Every chunk is typed like the whole sheet: codes keep their leading zeros, blanks widen ints."""
+        workbook = Path(self.tmp.name) / "Products.xlsx"
+        pd.DataFrame({
+            'CODE': ['001', '002', '010', 'A01'],
+            'QTY': [1, 2, None, 4],
+            'ON_HOLD': [True, False, None, True],
+            'LAST_SOLD': pd.to_datetime([None, None, '2019-04-01', '2019-04-02']),
+        }).to_excel(workbook, sheet_name="Products", index=False)
+        expected = ingest.load_and_sanitize(workbook, "Products", cache_dir=Path(self.tmp.name) / "whole")
+
+        chunks = list(ingest.iter_excel_chunks(workbook, "Products", chunksize=2))
+        self.assertEqual(chunks[0]['CODE'].tolist(), ['001', '002'])
+        for chunk in chunks:
+            pd.testing.assert_series_equal(chunk.dtypes, expected.dtypes)
+        pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+    def test_raw_frames_clean_each_chunk(self):
+        """A frame with a cleaner is cleaned chunk by chunk and served as is by cleaned_frame."""
+        cleaner = mock.Mock(side_effect=lambda chunk: chunk.dropna(subset=['CUSTOMER_NUMBER']))
+        frames = ingest.RawFrames(self.tmp.name, {'age_analysis': ("Age Analysis.xlsx", "Age_Analysis")},
+                                  compact=False, cleaners={'age_analysis': cleaner}, chunksize=2)
+
+        with mock.patch('sys.stdout'):
+            df = ingest.cleaned_frame(frames, 'age_analysis', cleaner)
+        self.assertEqual(cleaner.call_count, 3)
+        self.assertEqual(df.index.tolist(), [0, 1, 2, 4])
+
+
+class TestRawFrames(unittest.TestCase):
+    """Tests the lazy frame mapping the transforms extract into."""
+
+    def test_frames_load_on_first_access_only(self):
+        """Nothing is read up front, and each frame is read once."""
+        loader = mock.Mock(return_value=pd.DataFrame({'A': [1, 2]}))
+        frames = ingest.RawFrames("raw", {'customers': ("Customer.xlsx", "Customer")}, loader=loader)
+        self.assertFalse(frames.is_loaded('customers'))
+        loader.assert_not_called()
+
+        with mock.patch('sys.stdout'):
+            self.assertEqual(len(frames['customers']), 2)
+            frames['customers']
+        loader.assert_called_once_with(Path("raw") / "Customer.xlsx", "Customer")
+        self.assertEqual(list(frames), ['customers'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# C:\clearvue-bi-system\tests\test_instrumentation.py
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from etl_scripts.batch_etl.instrumentation import METRICS_DIR_NAME, RunMetrics, phase
+
+
+@phase("dedupe")
+def dedupe(df):
+    return df.drop_duplicates()
+
+
+@phase("split")
+def split(df, keys, periods):
+    return [df.iloc[:1], df.iloc[1:]]
+
+
+@phase("documents", rows_out=len)
+def documents(df):
+    return [{'_id': code} for code in df['CODE'].unique()]
+
+
+@phase("lookup")
+def lookup(codes):
+    return dict.fromkeys(codes)
+
+
+@phase("explode")
+def explode(df):
+    raise ValueError("bad input")
+
+
+class TestRunMetrics(unittest.TestCase):
+    """Tests recording decorated phases into the active run."""
+
+    def setUp(self):
+        self.df = pd.DataFrame({'CODE': ['A', 'A', 'B']})
+
+    def test_phases_record_only_inside_a_run(self):
+        dedupe(self.df)  # no active run: a plain call
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            with RunMetrics("sales_collection", output_dir, trace_memory=True) as run:
+                dedupe(self.df)
+            report = json.loads((Path(output_dir) / METRICS_DIR_NAME / "sales_collection.json").read_text())
+
+        self.assertTrue(report["success"])
+        self.assertEqual(len(report["phases"]), 1)
+        metrics = report["phases"][0]
+        self.assertEqual((metrics["name"], metrics["rows_in"], metrics["rows_out"]), ("dedupe", 3, 2))
+        self.assertGreaterEqual(metrics["wall_time"], 0.0)
+        self.assertIsNotNone(metrics["traced_peak_bytes"])
+        self.assertIn("dedupe", run.report())
+
+    def test_row_counts_of_frame_lists_and_documents(self):
+        """Lists of frames add up their rows; other values are only counted when the phase says how."""
+        with RunMetrics("finance_collection") as run:
+            split(self.df, {'A': 1}, self.df['CODE'])
+            documents(self.df)
+            lookup(codes=['A', 'B'])
+        counts = [(p.name, p.rows_in, p.rows_out) for p in run.phases]
+        self.assertEqual(counts, [("split", 3, 3), ("documents", 3, 2), ("lookup", None, None)])
+
+    def test_failed_phase_and_prometheus_textfile(self):
+        with tempfile.TemporaryDirectory() as prom_dir:
+            with self.assertRaises(ValueError):
+                with RunMetrics("finance_collection", prom_textfile_dir=prom_dir) as run:
+                    explode(self.df)
+            text = (Path(prom_dir) / "clearvue_finance_collection.prom").read_text()
+
+        self.assertFalse(run.success)
+        self.assertEqual(run.phases[0].error, "ValueError: bad input")
+        self.assertIn('clearvue_etl_run_success{job="finance_collection"} 0.0', text)
+        self.assertIn('clearvue_etl_phase_rows_in{job="finance_collection",phase="explode"} 3.0', text)
+
+
+    def test_repeated_phase_is_one_prometheus_series(self):
+        """A phase called twice in a run is written once, with its calls added up."""
+        with tempfile.TemporaryDirectory() as prom_dir:
+            with RunMetrics("kafka_producer", prom_textfile_dir=prom_dir) as run:
+                dedupe(self.df)
+                dedupe(self.df.iloc[:2])
+            lines = (Path(prom_dir) / "clearvue_kafka_producer.prom").read_text().splitlines()
+
+        self.assertEqual(len(run.phases), 2)
+        samples = [line for line in lines if not line.startswith('#')]
+        self.assertEqual(len(samples), len(set(line.rsplit(' ', 1)[0] for line in samples)))
+        self.assertIn('clearvue_etl_phase_calls{job="kafka_producer",phase="dedupe"} 2.0', lines)
+        self.assertIn('clearvue_etl_phase_rows_in{job="kafka_producer",phase="dedupe"} 5.0', lines)
+        self.assertIn('clearvue_etl_phase_rows_out{job="kafka_producer",phase="dedupe"} 3.0', lines)
+
+if __name__ == '__main__':
+    unittest.main()
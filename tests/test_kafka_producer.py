@@ -0,0 +1,120 @@
+# C:\clearvue-bi-system\tests\test_kafka_producer.py
+
+import json
+import tempfile
+import unittest
+
+import pandas as pd
+
+from etl_scripts.batch_etl.incremental import PeriodState
+from etl_scripts.streaming_etl.in_memory_broker import InMemoryBroker, InMemoryProducer
+from etl_scripts.streaming_etl.kafka_producer import STREAMS, EventProducer, event_payloads, publish_streams
+
+
+class TestKafkaProducer(unittest.TestCase):
+    """Tests the event producer against the in-process broker stand-in."""
+
+    def setUp(self):
+        self.header = pd.DataFrame({
+            'DOC_NUMBER': ['DC1', 'DC2', 'DC3', 'DC1'],
+            'CUSTOMER_NUMBER': ['C1', 'C2', 'C1', 'C1'],
+            'TRANS_DATE': pd.to_datetime(['2019-01-10', '2019-01-11', None, '2019-02-01']),
+            'FIN_PERIOD': [201901, 201901, 201902, 201902],
+        })
+        self.payments = pd.DataFrame({
+            'CUSTOMER_NUMBER': ['C1', 'C2', 'C1'],
+            'FIN_PERIOD': [201901, 201901, 201902],
+            'TOT_PAYMENT': [100, 200, 300],
+        })
+
+    def producer(self, broker, **config):
+        return EventProducer(InMemoryProducer(broker, config), poll_every=2)
+
+    def test_event_payloads(self):
+        """Events carry the row as JSON with ISO dates, None for missing values and the key column as key."""
+        keys, values = event_payloads(self.header, STREAMS['sales_header'], self.header['FIN_PERIOD'])
+        self.assertEqual(keys, [b'DC1', b'DC2', b'DC3', b'DC1'])
+        event = json.loads(values[0])
+        self.assertEqual(event['event_type'], 'sales_header')
+        self.assertEqual(event['fin_period'], '201901')
+        self.assertEqual(event['data'], {'DOC_NUMBER': 'DC1', 'CUSTOMER_NUMBER': 'C1',
+                                         'TRANS_DATE': '2019-01-10T00:00:00', 'FIN_PERIOD': 201901})
+        self.assertIsNone(json.loads(values[2])['data']['TRANS_DATE'])
+
+    def test_identical_rows_get_distinct_event_ids(self):
+        """Replays keep their event_id; duplicate rows are still told apart."""
+        df = pd.DataFrame({'CUSTOMER_NUMBER': ['C1', 'C1'], 'TOT_PAYMENT': [5, 5]})
+        ids = [json.loads(v)['event_id'] for v in event_payloads(df, STREAMS['payment_line'])[1]]
+        self.assertEqual(len(set(ids)), 2)
+        again = [json.loads(v)['event_id'] for v in event_payloads(df, STREAMS['payment_line'])[1]]
+        self.assertEqual(ids, again)
+
+    def test_event_ids_ignore_storage_width(self):
+        """A replayed row keeps its event_id when the dtype planner stores its columns wider."""
+        refunds = self.payments.assign(TOT_PAYMENT=[-100, 200, -300])
+        narrow = refunds.astype({'TOT_PAYMENT': 'int16', 'FIN_PERIOD': 'int32'})
+        wide = refunds.astype({'TOT_PAYMENT': 'int32', 'FIN_PERIOD': 'int64'})
+        ids = [json.loads(v)['event_id'] for v in event_payloads(narrow, STREAMS['payment_line'])[1]]
+        self.assertEqual([json.loads(v)['event_id'] for v in event_payloads(wide, STREAMS['payment_line'])[1]], ids)
+
+    def test_keyed_events_keep_order_per_partition(self):
+        """All events of a key land on one partition, in the order they were produced."""
+        broker = InMemoryBroker(partitions=4)
+        stats = publish_streams(self.producer(broker, **{'batch.num.messages': 2}),
+                                {'sales_header': (self.header, self.header['FIN_PERIOD'])})
+
+        self.assertEqual((stats.events, stats.delivered, stats.failed), (4, 4, 0))
+        delivered = broker.messages('clearvue.sales.header')
+        partitions = {m.key(): {d.partition() for d in delivered if d.key() == m.key()} for m in delivered}
+        self.assertTrue(all(len(p) == 1 for p in partitions.values()))
+        dc1 = [json.loads(m.value())['fin_period'] for m in delivered if m.key() == b'DC1']
+        self.assertEqual(dc1, ['201901', '201902'])
+
+    def test_batches_are_compressed(self):
+        """Messages go to the broker in batches whose compressed size is recorded."""
+        broker = InMemoryBroker(partitions=1)
+        frame = pd.concat([self.payments] * 100, ignore_index=True)
+        stats = publish_streams(self.producer(broker, **{'batch.num.messages': 100}),
+                                {'payment_line': (frame, frame['FIN_PERIOD'])})
+        self.assertEqual(len(broker.batches), 3)
+        self.assertLess(broker.wire_bytes, stats.bytes)
+        self.assertGreater(stats.events_per_sec, 0)
+
+    def test_full_queue_applies_backpressure(self):
+        """A full local queue makes the producer poll and retry instead of dropping events."""
+        broker = InMemoryBroker()
+        producer = self.producer(broker, **{'queue.buffering.max.messages': 2, 'batch.num.messages': 100})
+        stats = publish_streams(producer, {'payment_line': (self.payments, self.payments['FIN_PERIOD'])})
+        self.assertGreater(stats.backpressure, 0)
+        self.assertEqual(stats.delivered, 3)
+        self.assertEqual(len(broker.messages('clearvue.finance.payment_line')), 3)
+
+    def test_incremental_publishes_new_periods_only(self):
+        """With a PeriodState only new or restated periods are published again."""
+        with tempfile.TemporaryDirectory() as state_dir:
+            frames = {'payment_line': (self.payments, self.payments['FIN_PERIOD'])}
+            states = {'payment_line': PeriodState.load(state_dir, 'kafka_payment_line')}
+            self.assertEqual(publish_streams(self.producer(InMemoryBroker()), frames, states).delivered, 3)
+
+            grown = pd.concat([self.payments, pd.DataFrame({
+                'CUSTOMER_NUMBER': ['C3'], 'FIN_PERIOD': [201903], 'TOT_PAYMENT': [50],
+            })], ignore_index=True)
+            broker = InMemoryBroker()
+            states = {'payment_line': PeriodState.load(state_dir, 'kafka_payment_line')}
+            stats = publish_streams(self.producer(broker), {'payment_line': (grown, grown['FIN_PERIOD'])}, states)
+            self.assertEqual(stats.delivered, 1)
+            self.assertEqual(broker.messages('clearvue.finance.payment_line')[0].key(), b'C3')
+
+    def test_failed_delivery_does_not_commit_state(self):
+        """Events the broker rejects are counted and the periods are published again next run."""
+        with tempfile.TemporaryDirectory() as state_dir:
+            frames = {'payment_line': (self.payments, self.payments['FIN_PERIOD'])}
+            broker = InMemoryBroker(fail_topics={'clearvue.finance.payment_line'})
+            states = {'payment_line': PeriodState.load(state_dir, 'kafka_payment_line')}
+            stats = publish_streams(self.producer(broker), frames, states)
+            self.assertEqual((stats.delivered, stats.failed), (0, 3))
+            self.assertTrue(PeriodState.load(state_dir, 'kafka_payment_line').is_first_run)
+
+
+if __name__ == '__main__':
+    unittest.main()
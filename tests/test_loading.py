@@ -1,2 +1,145 @@
-from pymongo import MongoClient
-#
\ No newline at end of file
+# C:\clearvue-bi-system\tests\test_loading.py
+
+import unittest
+
+import mongomock
+from pymongo import DeleteOne, InsertOne, MongoClient
+from pymongo.errors import BulkWriteError
+
+from etl_scripts.batch_etl.collection_writer import content_hash
+from etl_scripts.batch_etl.loading_scripts.bulk_upsert import batched, bulk_upsert, sync_collection
+
+
+class StandInCollection:
+    """mongomock-backed collection whose bulk_write applies pymongo write requests.
+
+    (mongomock's own bulk_write does not accept the operations of current pymongo.)
+    """
+
+    def __init__(self):
+        self.collection = mongomock.MongoClient().db.finance
+        self.bulk_calls = []
+        self.sent = []
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, requests, ordered=True):
+        self.bulk_calls.append((len(requests), ordered))
+        self.sent.extend(requests)
+        result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "writeErrors": []}
+        for index, request in enumerate(requests):
+            if isinstance(request, DeleteOne):
+                result["nRemoved"] += self.collection.delete_one(request._filter).deleted_count
+                continue
+            if isinstance(request, InsertOne):
+                self.collection.insert_one(request._doc)
+                result["nInserted"] += 1
+                continue
+            if "bad" in request._doc:
+                result["writeErrors"].append({"index": index, "errmsg": "bad document"})
+                continue
+            outcome = self.collection.replace_one(request._filter, request._doc, upsert=request._upsert)
+            result["nUpserted"] += outcome.upserted_id is not None
+            result["nMatched"] += outcome.matched_count
+            result["nModified"] += outcome.modified_count
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return type("BulkWriteResult", (), {"bulk_api_result": result})()
+
+
+class TestBulkUpsert(unittest.TestCase):
+    """Tests the chunked ReplaceOne upsert engine behind the loading scripts."""
+
+    def setUp(self):
+        self.target = StandInCollection()
+        self.docs = [{"_id": f"C{i}_202401", "total_due": float(i)} for i in range(25)]
+
+    def test_batched_splits_any_iterable(self):
+        """Batches are filled in order and the last one holds the remainder."""
+        sizes = [len(batch) for batch in batched(iter(self.docs), 10)]
+        self.assertEqual(sizes, [10, 10, 5])
+
+    def test_reload_replaces_instead_of_duplicating(self):
+        """A second load of changed documents updates them in place, unordered, in batches."""
+        stats = bulk_upsert(self.target, iter(self.docs), batch_size=10)
+        self.assertEqual((stats.documents, stats.batches, stats.inserted), (25, 3, 25))
+        self.assertEqual(self.target.bulk_calls, [(10, False), (10, False), (5, False)])
+
+        self.docs[0]["total_due"] = 99.0
+        stats = bulk_upsert(self.target, self.docs, batch_size=10)
+        self.assertEqual((stats.inserted, stats.matched, stats.modified), (0, 25, 1))
+        self.assertEqual(self.target.collection.count_documents({}), 25)
+        self.assertEqual(self.target.collection.find_one({"_id": "C0_202401"})["total_due"], 99.0)
+        self.assertGreater(stats.docs_per_sec, 0)
+
+    def test_concurrent_workers_load_every_document(self):
+        """Batches spread over several workers still land exactly once."""
+        progress = []
+        stats = bulk_upsert(self.target, self.docs, batch_size=4, workers=3,
+                            progress=lambda s: progress.append(s.documents))
+        self.assertEqual(stats.documents, 25)
+        self.assertEqual(stats.batches, 7)
+        self.assertEqual(progress[-1], 25)
+        self.assertEqual(self.target.collection.count_documents({}), 25)
+
+    def test_failed_documents_do_not_stop_the_batch(self):
+        """A rejected document is reported while the rest of its batch is written."""
+        self.docs[3]["bad"] = True
+        stats = bulk_upsert(self.target, self.docs, batch_size=10)
+        self.assertEqual(len(stats.write_errors), 1)
+        self.assertEqual(self.target.collection.count_documents({}), 24)
+
+
+class TestSyncCollection(unittest.TestCase):
+    """Tests content-hash change detection: only the change is sent to the server."""
+
+    def setUp(self):
+        self.target = StandInCollection()
+        self.docs = [{"_id": f"C{i}", "credit_limit": float(i)} for i in range(10)]
+        for doc in self.docs:
+            doc["content_hash"] = content_hash(doc)
+
+    def test_second_sync_sends_only_changes(self):
+        """Unchanged documents are skipped; changed, new and vanished ones are written."""
+        stats = sync_collection(self.target, self.docs, batch_size=4)
+        self.assertEqual((stats.inserted, stats.skipped), (10, 0))
+
+        self.target.sent.clear()
+        changed = dict(self.docs[2], credit_limit=500.0)
+        changed["content_hash"] = content_hash(changed)
+        export = [doc for doc in self.docs if doc["_id"] != "C9"]
+        export[2] = changed
+        export.append({"_id": "C10", "credit_limit": 10.0})  # no stored hash: computed on the fly
+
+        stats = sync_collection(self.target, export, batch_size=4)
+        self.assertEqual((stats.documents, stats.skipped), (10, 8))
+        self.assertEqual((stats.inserted, stats.modified, stats.deleted), (1, 1, 1))
+        self.assertEqual(len(self.target.sent), 3)
+        self.assertEqual(self.target.collection.find_one({"_id": "C2"})["credit_limit"], 500.0)
+        self.assertIsNone(self.target.collection.find_one({"_id": "C9"}))
+        self.assertEqual(self.target.collection.find_one({"_id": "C10"})["content_hash"],
+                         content_hash({"_id": "C10", "credit_limit": 10.0}))
+
+    def test_partial_export_keeps_missing_documents(self):
+        """A delta export never deletes the _ids it does not contain."""
+        sync_collection(self.target, self.docs)
+        stats = sync_collection(self.target, self.docs[:2], delete_missing=False, workers=2)
+        self.assertEqual((stats.skipped, stats.deleted), (2, 0))
+        self.assertEqual(self.target.collection.count_documents({}), 10)
+
+    def test_scoped_delta_replaces_whole_periods(self):
+        """A rollup delta deletes the vanished rows of its own periods only."""
+        rollup = [{"_id": f"{period}|R{i}", "fin_period": period, "total_revenue": 1.0}
+                  for period in ("202401", "202402") for i in range(3)]
+        sync_collection(self.target, rollup)
+
+        delta = [dict(rollup[0], total_revenue=5.0), rollup[1]]  # 202401 lost R2
+        stats = sync_collection(self.target, delta, delete_missing=False, scope_field="fin_period")
+        self.assertEqual((stats.modified, stats.skipped, stats.deleted), (1, 1, 1))
+        self.assertIsNone(self.target.collection.find_one({"_id": "202401|R2"}))
+        self.assertEqual(self.target.collection.count_documents({"fin_period": "202402"}), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+# C:\clearvue-bi-system\tests\test_orchestrator.py
+
+import tempfile
+import unittest
+
+from etl_scripts.batch_etl.orchestrator import NODES, Node, RAW_DATA_DIR, run_pipeline
+
+
+class TestOrchestrator(unittest.TestCase):
+    """Tests DAG scheduling decisions that do not need the raw workbooks."""
+
+    def test_nodes_declare_unique_names(self):
+        """Every collection build is declared once."""
+        names = [node.name for node in NODES]
+        self.assertEqual(sorted(names), sorted(set(names)))
+        self.assertEqual(set(names), {'sales', 'customer', 'finance', 'supplier', 'dim_time'})
+
+    def test_unselected_dependency_is_rejected(self):
+        """A node cannot depend on a node that is not part of the run."""
+        with self.assertRaises(ValueError):
+            run_pipeline([Node("rollups", "missing", (), deps=("sales",))])
+
+    def test_missing_input_fails_node_and_dependants(self):
+        """A missing workbook fails its node up front and skips everything downstream."""
+        self.assertFalse((RAW_DATA_DIR / "Does Not Exist.xlsx").exists())
+        nodes = [
+            Node("broken", "missing", (("Does Not Exist.xlsx", 0),)),
+            Node("downstream", "missing", (), deps=("broken",)),
+        ]
+        with tempfile.TemporaryDirectory() as log_dir:
+            result = run_pipeline(nodes, workers=1, log_dir=log_dir)
+
+        self.assertEqual(result['nodes']['broken']['status'], 'failed')
+        self.assertIn('Does Not Exist.xlsx', result['nodes']['broken']['error'])
+        self.assertEqual(result['nodes']['downstream']['status'], 'failed')
+        self.assertIn('Dependency failed', result['nodes']['downstream']['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
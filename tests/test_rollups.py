@@ -0,0 +1,59 @@
+# C:\clearvue-bi-system\tests\test_rollups.py
+
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from etl_scripts.batch_etl.rollups import build_finance_rollup, build_sales_rollup, customer_regions
+from etl_scripts.batch_etl.surrogate_keys import KeyDictionary
+
+
+class TestRollups(unittest.TestCase):
+    """Tests the pre-aggregated BI rollups built from the transforms' frames."""
+
+    def setUp(self):
+        self.keys = KeyDictionary()
+
+    def test_sales_rollup_by_period_rep_and_customer(self):
+        header_df = pd.DataFrame({
+            'DOC_NUMBER': ['D1', 'D2', 'D3', 'D4'],
+            'FIN_PERIOD': [202401, 202401, 202401, np.nan],
+            'REP_CODE': ['010', '010', '04C', '010'],
+            'CUSTOMER_KEY': self.keys.encode(pd.Series(['C1', ' c1', 'C1', 'C2'])),
+            'TOTAL_REVENUE': [10.0, 5.0, 1.0, 2.0],
+            'TOTAL_COST': [4.0, 2.0, 1.0, 1.0],
+            'TOTAL_PROFIT': [6.0, 3.0, 0.0, 1.0],
+        })
+        with mock.patch('sys.stdout'):
+            docs = {doc['_id']: doc for doc in build_sales_rollup(header_df, self.keys)}
+
+        self.assertEqual(sorted(docs), ['202401|010|C1', '202401|04C|C1', '|010|C2'])
+        self.assertEqual(docs['202401|010|C1'], {
+            '_id': '202401|010|C1', 'fin_period': '202401', 'rep_code': '010', 'customer_number': 'C1',
+            'total_revenue': 15.0, 'total_cost': 6.0, 'total_profit': 9.0, 'documents': 2,
+        })
+        self.assertIsNone(docs['|010|C2']['fin_period'])
+
+    def test_finance_rollup_by_period_and_region(self):
+        regions = customer_regions(pd.DataFrame({'CUSTOMER_NUMBER': ['C1', 'C2'], 'REGION_CODE': ['7a ', '9a']}),
+                                   self.keys)
+        finance_data = pd.DataFrame({
+            'CUSTOMER_KEY': self.keys.encode(pd.Series(['C1', 'C2', 'C3', 'C1'])),
+            'FIN_PERIOD': [202401, 202401, 202401, 202402],
+            'TOTAL_DUE': [100.0, 50.0, 7.0, np.nan],
+            'AMT_CURRENT': [10.0, 5.0, 7.0, 1.0],
+        })
+        finance_data['REGION_CODE'] = finance_data['CUSTOMER_KEY'].map(regions)
+        with mock.patch('sys.stdout'):
+            docs = {doc['_id']: doc for doc in build_finance_rollup(finance_data)}
+
+        self.assertEqual(sorted(docs), ['202401|', '202401|7a', '202401|9a', '202402|7a'])
+        self.assertEqual((docs['202401|7a']['total_due'], docs['202401|7a']['customers']), (100.0, 1))
+        self.assertIsNone(docs['202401|']['region_code'])  # customer without a Customer row
+        self.assertEqual(docs['202402|7a']['total_due'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+# C:\clearvue-bi-system\tests\test_stage_cache.py
+
+import json
+import tempfile
+from collections import deque
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+from etl_scripts.batch_etl import fin_calendar
+from etl_scripts.batch_etl.fin_calendar import FinancialCalendar
+from etl_scripts.batch_etl.stage_cache import Stage, StageCache, code_digest, execution_order, run_stages
+
+SCALE = 2
+CALLS = deque()  # not a constant type, so not part of the stages' code digests
+
+
+def load_amounts(amounts_df):
+    CALLS.append("amounts")
+    return amounts_df
+
+
+def scaled(amounts):
+    CALLS.append("scaled")
+    return amounts.assign(AMOUNT=amounts["AMOUNT"] * SCALE)
+
+
+def total(scaled):
+    CALLS.append("total")
+    return pd.DataFrame({"TOTAL": [scaled["AMOUNT"].sum()]})
+
+
+def calendar_months(dates):
+    return FinancialCalendar(2019, 2019).fin_periods(dates)
+
+
+def module_periods(dates):
+    return fin_calendar.fin_periods(dates)
+
+
+STAGES = (
+    Stage("amounts", load_amounts, sources=(("amounts_df", "Amounts.xlsx", "Amounts"),)),
+    Stage("scaled", scaled, deps=("amounts",)),
+    Stage("total", total, deps=("scaled",), export="total.json"),
+)
+
+
+class TestStageCache(unittest.TestCase):
+    """Tests the content-addressed stage cache behind the dimension pipeline."""
+
+    def setUp(self):
+        global SCALE
+        SCALE = 2
+        CALLS.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        (self.root / "data").mkdir()
+        self.write_amounts([1.0, 2.0, 3.0])
+
+    def tearDown(self):
+        global SCALE
+        SCALE = 2
+        self.tmp.cleanup()
+
+    def write_amounts(self, amounts):
+        pd.DataFrame({"AMOUNT": amounts}).to_excel(self.root / "data" / "Amounts.xlsx",
+                                                   sheet_name="Amounts", index=False)
+
+    def run_pipeline(self, **kwargs):
+        CALLS.clear()
+        runs = run_stages(STAGES, self.root / "data", self.root / "cache", self.root / "out", **kwargs)
+        return {run.name: run.status for run in runs}
+
+    def exported_total(self):
+        return json.loads((self.root / "out" / "total.json").read_text())["TOTAL"]
+
+    def test_second_run_is_cached(self):
+        """Unchanged inputs and code reuse every stage without calling it."""
+        self.assertEqual(set(self.run_pipeline().values()), {"ran"})
+        self.assertEqual(self.exported_total(), 12.0)
+
+        self.assertEqual(set(self.run_pipeline().values()), {"cached"})
+        self.assertEqual(list(CALLS), [])
+
+    def test_source_change_reruns_downstream(self):
+        """A changed workbook reruns its stage and every stage whose inputs changed."""
+        self.run_pipeline()
+        self.write_amounts([1.0, 2.0, 4.0])
+        self.assertEqual(self.run_pipeline(), {"amounts": "ran", "scaled": "ran", "total": "ran"})
+        self.assertEqual(self.exported_total(), 14.0)
+
+    def test_code_constant_change_reruns_stage(self):
+        """Editing a constant a stage uses reruns that stage, not its upstream."""
+        global SCALE
+        self.run_pipeline()
+        SCALE = 3
+        self.assertEqual(self.run_pipeline(), {"amounts": "cached", "scaled": "ran", "total": "ran"})
+        self.assertEqual(list(CALLS), ["scaled", "total"])
+        self.assertEqual(self.exported_total(), 18.0)
+
+    def test_identical_rerun_keeps_downstream_cached(self):
+        """A forced stage that produces the same rows does not invalidate its dependants."""
+        self.run_pipeline()
+        self.assertEqual(self.run_pipeline(force=("scaled",)),
+                         {"amounts": "cached", "scaled": "ran", "total": "cached"})
+
+    def test_targets_limit_the_run(self):
+        """Targets run only themselves and their upstream stages."""
+        self.assertEqual(self.run_pipeline(targets=["scaled"]), {"amounts": "ran", "scaled": "ran"})
+        self.assertFalse((self.root / "out" / "total.json").exists())
+
+    def test_artifacts_are_columnar_and_pruned(self):
+        """Each stage keeps one Parquet artifact, the one of its current key."""
+        self.run_pipeline()
+        self.write_amounts([5.0])
+        self.run_pipeline()
+        artifacts = sorted(p.suffix for p in (self.root / "cache" / "amounts").iterdir())
+        self.assertEqual(artifacts, [".json", ".parquet"])
+
+        cache = StageCache(self.root / "cache")
+        key = next((self.root / "cache" / "amounts").glob("*.json")).stem
+        self.assertEqual(cache.load("amounts", key)["AMOUNT"].tolist(), [5.0])
+
+    def test_code_digest_follows_helpers(self):
+        """A stage's code digest includes the constants it refers to."""
+        global SCALE
+        before = code_digest(scaled)
+        SCALE = 5
+        self.assertNotEqual(code_digest(scaled), before)
+        self.assertEqual(code_digest(load_amounts), code_digest(load_amounts))
+
+    def test_code_digest_follows_project_modules(self):
+        """Classes and functions from other etl_scripts modules are part of the digest."""
+        before = (code_digest(calendar_months), code_digest(module_periods))
+        with mock.patch.object(fin_calendar, "FRIDAY", 3):
+            after = (code_digest(calendar_months), code_digest(module_periods))
+        self.assertNotEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+
+    def test_execution_order_rejects_cycles_and_unknown_deps(self):
+        """Dependencies must exist and must not form a cycle."""
+        with self.assertRaises(ValueError):
+            execution_order([Stage("a", total, deps=("missing",))])
+        with self.assertRaises(ValueError):
+            execution_order([Stage("a", total, deps=("b",)), Stage("b", total, deps=("a",))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+# C:\clearvue-bi-system\tests\test_surrogate_keys.py
+
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from etl_scripts.batch_etl.surrogate_keys import MISSING_KEY, KeyDictionary
+
+
+class TestKeyDictionary(unittest.TestCase):
+    """Tests the shared CUSTOMER_NUMBER surrogate key dictionary."""
+
+    def test_normalised_codes_share_a_key(self):
+        """Whitespace, stray quotes and case do not create new keys; missing codes get MISSING_KEY."""
+        keys = KeyDictionary()
+        encoded = keys.encode(pd.Series(['AKRA01', ' akra01 ', "'DGSOC", np.nan, '', 'DGSOC']))
+
+        self.assertEqual(encoded.dtype, np.int32)
+        self.assertEqual(encoded.tolist(), [0, 0, 1, MISSING_KEY, MISSING_KEY, 1])
+        self.assertEqual(keys.decode(encoded).tolist(), ['AKRA01', 'AKRA01', 'DGSOC', None, None, 'DGSOC'])
+
+    def test_keys_persist_and_grow_without_collisions(self):
+        """Two dictionaries loaded from the same file (parallel transforms) never reuse a key."""
+        with tempfile.TemporaryDirectory() as state_dir:
+            first = KeyDictionary.load(state_dir, 'customer_keys')
+            second = KeyDictionary.load(state_dir, 'customer_keys')
+
+            self.assertEqual(first.encode(['C1', 'C2']).tolist(), [0, 1])
+            self.assertEqual(second.encode(['C3', 'C1']).tolist(), [2, 0])
+
+            reloaded = KeyDictionary.load(state_dir, 'customer_keys')
+            self.assertEqual(len(reloaded), 3)
+            self.assertEqual(reloaded.encode(['C3', 'C2', 'C1']).tolist(), [2, 1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# C:\clearvue-bi-system\tests\test_transform_customer.py
+
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from etl_scripts.batch_etl.representatives import build_rep_dimension, rep_group
+from etl_scripts.batch_etl.surrogate_keys import KeyDictionary
+from etl_scripts.batch_etl.transform_customer import transform
+
+
+class TestTransformCustomer(unittest.TestCase):
+    """Runs the customer phases on in-memory frames instead of the workbooks."""
+
+    def setUp(self):
+        self.frames = {
+            'customers': pd.DataFrame({
+                'CUSTOMER_NUMBER': ['C1', 'C2', "'c3", 'C4'],
+                'CCAT_CODE': [1, 2, 1, 99],
+                'REGION_CODE': ['1a', '2b', None, '1a'],
+                'REP_CODE': ['010', np.nan, '04C', '010'],
+                'SETTLE_TERMS': [30.0, np.nan, 0.0, 0.0],
+                'NORMAL_PAYTERMS': [90, 60, 30, 30],
+                'DISCOUNT': [0, 5, 0, 0],
+                'CREDIT_LIMIT': [3000, 0, 999999, 0],
+            }),
+            'customer_categories': pd.DataFrame({'CCAT_CODE': [1, 1, 2], 'CCAT_DESC': ['Old', 'House', np.nan]}),
+            'customer_regions': pd.DataFrame({'REGION_CODE': ['1a', '2b'], 'REGION_DESC': ['Pretoria', 'Durban']}),
+            'account_params': pd.DataFrame({
+                'CUSTOMER_NUMBER': ['C1', ' c1', 'C3', 'C2', None],
+                'PARAMETER': ['closed', 'Promotion', 'Consignment', ' Closed ', 'Closed'],
+            }),
+            'representatives': pd.DataFrame({
+                'REP_CODE': ['010', '04C ', '99'],
+                'REP_DESC': ['BA ALLISON', 'BM CONSIGNMENT SALES ACC', 'do not use'],
+                'COMM_METHOD': ['Sales', 'Sales', 'Unknown'],
+                'COMMISSION': [0.5, 0.5, 0.0],
+            }),
+        }
+
+    def test_documents_embed_lookups_and_parameters(self):
+        with mock.patch('sys.stdout'):
+            docs = {doc['_id']: doc for doc in transform(self.frames, KeyDictionary())}
+
+        self.assertEqual(sorted(docs), ['C1', 'C2'])  # invalid CCAT_CODE and REGION_CODE are dropped
+        self.assertEqual(docs['C1'], {
+            '_id': 'C1',
+            'customer_categories': {'ccat_code': 1, 'ccat_desc': 'House'},  # the last lookup row wins
+            'region': {'region_code': '1a', 'region_desc': 'Pretoria'},
+            'rep_code': '010',
+            'representative': {
+                'rep_code': '010', 'rep_desc': 'BA ALLISON', 'rep_group': 'Sales Rep',
+                'comm_method': 'Sales', 'commission': 0.5,
+            },
+            'credit_limit': 3000.0,
+            'settle_terms': 30,
+            'normal_payterms': 90,
+            'discount': 0.0,
+            'status': 'active',
+            'account_parameters': ['Closed', 'Promotion'],
+        })
+        self.assertIsNone(docs['C2']['rep_code'])
+        self.assertEqual(docs['C2']['representative'], {})
+        self.assertEqual((docs['C2']['settle_terms'], docs['C2']['discount']), (0, 5.0))
+        self.assertEqual(docs['C2']['account_parameters'], ['Closed'])
+        self.assertTrue(np.isnan(docs['C2']['customer_categories']['ccat_desc']))
+
+
+class TestRepDimension(unittest.TestCase):
+    """Tests the representative groups derived from REP_DESC."""
+
+    def test_rep_groups(self):
+        descriptions = ['BJ', "R'S CUSTOMER - JU'S SALE", 'BJ CONSIGNMENTS', 'CONSIGNMENTS HEAD OFFICE',
+                        "HO'S CUSTOMER-EM'S SALE", 'CAT CUSTOMER ONLY ex BM', 'SALE BM', 'BAD CREDIT',
+                        'Faulty code - do not use', '07-GROUP-LA', 'EXPORTS', None]
+        self.assertEqual(rep_group(descriptions).tolist(), [
+            'Sales Rep', 'Sales Rep', 'Sales Rep', 'Channel: Consignment', 'Internal Sales',
+            'Channel: Catalogue', 'Unclassified', 'Problem Account', 'Unwanted', 'Sales Rep', 'Channel: Export',
+            'Unclassified',
+        ])
+
+    def test_notebook_groups_are_kept(self):
+        """Reps representatives_cleaned.ipynb left unclassified keep its groups, not 'Other'."""
+        reps = pd.DataFrame({
+            'REP_CODE': ['01S01', '01S02', '01S03', '01S04', '01S05', '01S06', '01S07', '01SCG', '01SJM', '01SMC',
+                         '01DIS', 'CITC', 'SALE', 'CLEGA'],
+            'REP_DESC': ['SALE HEAD OFFICE', 'SALE R', 'SALE BJ', 'SALE BM', 'SALE RL', 'SALE DA', 'LA SALE GOODS',
+                         'SALE CH', 'SALE JU', 'SALE EM', 'DISC. FOR WIFES/FRIENDS', 'C- ITC', 'sales stock',
+                         'C LEGAL'],
+        })
+        with mock.patch('sys.stdout'):
+            groups = build_rep_dimension(reps)['rep_group'].to_dict()
+        self.assertEqual(groups, {
+            **{code: 'Unclassified' for code in reps['REP_CODE'][:10]},
+            '01DIS': 'Unclassified_Missing_Data', 'CITC': 'Unclassified_Missing_Data',
+            # dropped by the notebook; kept here with their own group
+            'SALE': 'Other', 'CLEGA': 'Other',
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# C:\clearvue-bi-system\tests\test_transform_finance.py
+
+import contextlib
+import io
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from etl_scripts.batch_etl.surrogate_keys import KeyDictionary
+from etl_scripts.batch_etl.transform_finance import (
+    ageing_buckets,
+    encode_days_due,
+    merge_finance_data,
+    standardize_customer_numbers,
+)
+
+
+class TestMergeFinanceData(unittest.TestCase):
+    """Tests nesting payment lines under their (customer, period) age analysis row."""
+
+    def setUp(self):
+        self.payment_lines = pd.DataFrame({
+            'CUSTOMER_NUMBER': ['C1', 'C1', 'C2', 'C9'],
+            'FIN_PERIOD': [201901, 201901, 201902, 201901],
+            'DEPOSIT_DATE': pd.to_datetime(['2019-01-03', '2019-01-09', '2019-02-01', '2019-01-05']),
+            'DEPOSIT_REF': ['R1', 'R2', np.nan, 'R4'],
+            'BANK_AMT': [100.0, 50.5, np.nan, 1.0],
+            'DISCOUNT': [0, 5, 0, 0],
+        })
+        self.age_df = pd.DataFrame({
+            'CUSTOMER_NUMBER': ['C1', 'C1', 'C2'],
+            'FIN_PERIOD': [201901, 201902, 201902],
+            'TOTAL_DUE': [10.0, 0.0, 7.0],
+            'AMT_CURRENT': [10.0, 0.0, 0.0],
+            'AMT_30_DAYS': [0, 0, 7],
+        })
+        self.custAcc_df = pd.DataFrame({'CUSTOMER_NUMBER': ['C1'], 'PARAMETER': ['P1']})
+
+    def merge(self):
+        keys = KeyDictionary()
+        with contextlib.redirect_stdout(io.StringIO()):
+            frames = standardize_customer_numbers(self.payment_lines, self.age_df, self.custAcc_df, keys)
+            finance_data = merge_finance_data(*frames, keys)
+        return {
+            (row.CUSTOMER_NUMBER, row.FIN_PERIOD): row
+            for row in finance_data.itertuples(index=False)
+        }
+
+    def test_payment_lines_are_nested_per_customer_period(self):
+        """Each age row gets its own payment lines as plain dicts; rows without payments get []."""
+        rows = self.merge()
+
+        self.assertEqual(rows[('C1', 201901)].payment_lines, [
+            {'deposit_date': '2019-01-03T00:00:00', 'deposit_ref': 'R1', 'bank_amt': 100.0, 'discount': 0},
+            {'deposit_date': '2019-01-09T00:00:00', 'deposit_ref': 'R2', 'bank_amt': 50.5, 'discount': 5},
+        ])
+        self.assertEqual(rows[('C1', 201902)].payment_lines, [])
+        # missing values become None so the document stays valid JSON
+        self.assertEqual(rows[('C2', 201902)].payment_lines, [
+            {'deposit_date': '2019-02-01T00:00:00', 'deposit_ref': None, 'bank_amt': None, 'discount': 0},
+        ])
+        self.assertEqual(rows[('C2', 201902)].days_due, {'30': 7})
+
+    def test_empty_selection(self):
+        """An incremental run that selects nothing still merges cleanly."""
+        self.payment_lines = self.payment_lines.iloc[0:0]
+        self.age_df = self.age_df.iloc[0:0]
+
+        self.assertEqual(self.merge(), {})
+
+
+class TestAgeingBuckets(unittest.TestCase):
+    """Tests the AMT_ bucket matrix behind days_due and BUCKET_SUM."""
+
+    def test_labels_sums_and_non_zero_buckets(self):
+        age_df = pd.DataFrame({
+            'TOTAL_DUE': [12.5, 0.0, -3.0],
+            'AMT_CURRENT': [2.5, 0.0, 0.0],
+            'AMT_30_DAYS': [10, 0, -3],
+            'AMT_120_DAYS': [0.0, 0.0, 0.0],
+        })
+        labels, buckets = ageing_buckets(age_df)
+
+        self.assertEqual(labels, ['0', '30', '120'])
+        self.assertEqual(buckets.sum(axis=1).tolist(), [12.5, 0.0, -3.0])
+        # amounts are truncated like int(), zero buckets are left out
+        self.assertEqual(encode_days_due(labels, buckets), [{'0': 2, '30': 10}, {}, {'30': -3}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+# C:\clearvue-bi-system\tests\test_transform_sales.py
+
+import contextlib
+import io
+import tempfile
+import unittest
+
+import pandas as pd
+
+from etl_scripts.batch_etl.incremental import PeriodState
+from etl_scripts.batch_etl.transform_sales import transform
+
+
+class TestSalesTransform(unittest.TestCase):
+    """Runs the sales phases on in-memory frames instead of the workbooks."""
+
+    def setUp(self):
+        self.frames = {
+            'sales_header': pd.DataFrame({
+                'DOC_NUMBER': ['D1', 'D2', 'D2'],
+                'CUSTOMER_NUMBER': ['C1', 'C2', 'C2'],
+                'REP_CODE': ['R1', 'R2', 'R2'],
+                'TRANS_DATE': ['2024-01-05', '2024-02-10', '2024-02-10'],
+                'FIN_PERIOD': [202401, 202402, 202402],
+            }),
+            'sales_lines': pd.DataFrame({
+                'DOC_NUMBER': ['D1', 'D1', 'D9'],
+                'INVENTORY_CODE': ['P1', 'P2', 'P3'],
+                'QUANTITY': [2, 1, 5],
+                'UNIT_SELL_PRICE': [10.0, 4.0, 1.0],
+                'UNIT_COST': [6.0, 3.0, 1.0],
+                'TOTAL_LINE_PRICE': [20.0, 4.0, 5.0],
+            }),
+            'trans_types': pd.DataFrame({'TRANSTYPE_CODE': [1], 'TRANSTYPE_DESC': ['Invoice']}),
+            'representatives': pd.DataFrame({
+                'REP_CODE': ['R1'], 'REP_DESC': ['BJ'], 'COMM_METHOD': ['Sales'], 'COMMISSION': [0.5],
+            }),
+            'products': pd.DataFrame({'INVENTORY_CODE': ['P1', 'P2'], 'PRODCAT_CODE': [7, 8]}),
+            'product_styles': pd.DataFrame({
+                'INVENTORY_CODE': ['P1'], 'GENDER': ['female'], 'MATERIAL': ['metal'], 'STYLE': [' classic '],
+                'COLOUR': [None], 'BRANDING': ['high'],
+            }),
+            'product_categories': pd.DataFrame({
+                'PRODCAT_CODE': [7, 8], 'PRODCAT_DESC': ['Watches', 'Parts'], 'BRAND_CODE': [1, 9], 'PRAN_CODE': [1, 2],
+            }),
+            'product_brands': pd.DataFrame({'PRODBRA_CODE': [1], 'PRODBRA_DESC': ['A']}),
+            'product_ranges': pd.DataFrame({'PRAN_CODE': [1, 2], 'PRAN_DESC': ['Product', 'Parts']}),
+        }
+
+    def run_transform(self, state=None):
+        frames = {name: df.copy() for name, df in self.frames.items()}
+        with contextlib.redirect_stdout(io.StringIO()):
+            header_df, documents = transform(frames, state)
+            return header_df, list(documents)
+
+    def test_documents_embed_lines_and_totals(self):
+        """Lines nest under their header; orphan lines and duplicate headers are dropped."""
+        _, documents = self.run_transform()
+        by_id = {doc['_id']: doc for doc in documents}
+
+        self.assertEqual(sorted(by_id), ['D1', 'D2'])
+        d1 = by_id['D1']
+        self.assertEqual([line['inventory_code'] for line in d1['line_items']], ['P1', 'P2'])
+        p1, p2 = d1['line_items']
+        self.assertEqual(
+            {field: p1[field] for field in ('prodcat_code', 'product_category', 'brand', 'product_range',
+                                            'gender', 'style', 'colour', 'branding')},
+            {'prodcat_code': 7, 'product_category': 'Watches', 'brand': 'A', 'product_range': 'Product',
+             'gender': 'female', 'style': 'classic', 'colour': None, 'branding': 'high'},
+        )
+        self.assertEqual((p2['product_category'], p2['brand'], p2['style']), ('Parts', None, None))
+        self.assertEqual(d1['total_revenue'], 24.0)
+        self.assertEqual(d1['total_cost'], 15.0)
+        self.assertEqual(d1['total_profit'], 9.0)
+        self.assertEqual(d1['fin_period'], '202401')
+        self.assertEqual(d1['trans_date'], '2024-01-05T00:00:00')
+        self.assertEqual(d1['trans_type_desc'], 'Unknown')
+        self.assertEqual(d1['representative'], {
+            'rep_code': 'R1', 'rep_desc': 'BJ', 'rep_group': 'Sales Rep', 'comm_method': 'Sales', 'commission': 0.5,
+        })
+        self.assertEqual(by_id['D2']['representative'], {})
+        self.assertEqual(by_id['D2']['line_items'], [])
+        self.assertEqual(by_id['D2']['total_revenue'], 0.0)
+
+    def test_incremental_run_emits_only_changed_periods(self):
+        """A changed sales line restates its header's period and nothing else."""
+        with tempfile.TemporaryDirectory() as state_dir:
+            state = PeriodState.load(state_dir, 'sales_collection')
+            _, documents = self.run_transform(state)
+            state.commit()
+            self.assertEqual(sorted(doc['_id'] for doc in documents), ['D1', 'D2'])
+
+            state = PeriodState.load(state_dir, 'sales_collection')
+            _, documents = self.run_transform(state)
+            self.assertEqual(documents, [])
+
+            self.frames['sales_lines'].loc[1, 'QUANTITY'] = 3
+            _, documents = self.run_transform(PeriodState.load(state_dir, 'sales_collection'))
+            self.assertEqual([doc['_id'] for doc in documents], ['D1'])
+            self.assertEqual(documents[0]['total_cost'], 21.0)
+
+            # every document embeds the representatives: a changed rep rebuilds all periods
+            self.frames['representatives'].loc[0, 'COMMISSION'] = 1.0
+            _, documents = self.run_transform(PeriodState.load(state_dir, 'sales_collection'))
+            self.assertEqual(sorted(doc['_id'] for doc in documents), ['D1', 'D2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,7 +10,8 @@ logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s -
 
 # Import the functions and variables you need to test
 # The ETL script must be fully functional for this import to succeed.
-from etl_scripts.batch_etl.transform_supplier import clean_supplier_desc
+from etl_scripts.batch_etl.transform_supplier import clean_supplier_desc, transform
+from etl_scripts.batch_etl.columnar import nest_records
 
 # --- Mock DataFrames for Unit Testing ---
 MOCK_SUPPLIERS_DATA = {
@@ -83,6 +84,38 @@ class TestETLTransformations(unittest.TestCase):
         self.assertNotIn('999999', df['SUPPLIER_CODE'].values)
         self.assertEqual(df.loc[df['SUPPLIER_CODE'] == '001', 'EXCLSV'].iloc[0], False)
         self.assertEqual(df.loc[df['SUPPLIER_CODE'] == '008', 'EXCLSV'].iloc[0], True)
+
+    def test_line_items_grouped_by_po(self):
+        """Test the Step 5 grouped lookup matches a per-PO filter."""
+        lines = pd.concat([self.lines_df, self.lines_df.iloc[:1]], ignore_index=True).rename(columns={
+            'INVENTORY_CODE': 'productID', 'QUANTITY': 'quantity',
+            'UNIT_COST_PRICE': 'unitCost', 'TOTAL_LINE_COST': 'totalCost'
+        })
+        item_cols = ['productID', 'quantity', 'unitCost', 'totalCost']
+
+        grouped = nest_records(lines['PURCH_DOC_NO'], {col: lines[col] for col in item_cols})
+
+        for doc_no in ['P001', 'P002']:
+            expected = lines[lines['PURCH_DOC_NO'] == doc_no][item_cols].to_dict('records')
+            self.assertEqual(grouped[doc_no], expected)
+        self.assertEqual(len(grouped['P001']), 2)
+        self.assertEqual(grouped.get('P404', []), [])
+
+    def test_transform_builds_documents_from_frames(self):
+        """transform() runs Steps 2-5 on in-memory frames, without the workbooks."""
+        documents = transform({
+            'suppliers': self.suppliers_df,
+            'headers': self.headers_df,
+            'lines': self.lines_df,
+        })
+
+        by_id = {doc['_id']: doc for doc in documents}
+        self.assertEqual(sorted(by_id), ['P001', 'P002'])
+        self.assertEqual(by_id['P001']['purchaseDate'], '2019-05-15')
+        self.assertEqual(by_id['P001']['supplier']['name'], 'Regular Vendor')
+        self.assertEqual(by_id['P002']['supplier']['shipmentDetails'], ['Shipment 2025-09'])
+        self.assertEqual(by_id['P001']['lineItems'][0]['productID'], 'A1')
+        self.assertEqual(by_id['P002']['totalPurchaseCost'], 50.0)
 # C:\clearvue-bi-system\tests\test_transform_supplier.py (FIXED test_purchase_date_cleaning)
 
 def test_purchase_date_cleaning(self):